@@ -0,0 +1,543 @@
+import io
+import os
+import queue
+import stat
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+# ==================== АРХИВЫ: ПОТОКОВАЯ ПЕРЕУПАКОВКА ====================
+# Члены архива читаются из исходника по очереди и сразу пишутся в целевой архив
+# кусками по ARCHIVE_CHUNK_SIZE — без распаковки на диск и без загрузки файлов в память.
+# Сжатие tar.gz/tar.bz2/tar.xz идет параллельно блоками: каждый блок — отдельный поток
+# gzip/bzip2/xz, их склейка читается любой стандартной утилитой (как у pigz)
+
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+DEFAULT_COMPRESSION_LEVEL = 6
+# Больше потоков сжатия почти не дает выигрыша, а память xz растет линейно
+ARCHIVE_MAX_THREADS = 8
+
+# Расширение → сжатие tar (None — без сжатия)
+TAR_COMPRESSIONS = {'tar': None, 'gz': 'gz', 'tgz': 'gz', 'bz2': 'bz2', 'tbz2': 'bz2', 'xz': 'xz', 'txz': 'xz'}
+
+# Размер блока параллельного сжатия: bzip2 работает блоками 900 КБ, xz выигрывает от больших блоков
+COMPRESSION_BLOCK_SIZES = {'gz': 1024 * 1024, 'bz2': 900 * 1024, 'xz': 4 * 1024 * 1024}
+
+# Члены 7z до этого размера копятся в памяти, больше — во временном файле (py7zr нужен размер заранее)
+SEVENZIP_SPOOL_SIZE = 16 * 1024 * 1024
+
+
+class ArchiveMember:
+    # Описание члена архива, не зависящее от формата.
+    # kind: 'file', 'dir', 'symlink' или 'hardlink'
+
+    def __init__(self, name, size=0, mtime=None, mode=None, kind='file', linkname=''):
+        self.name = name.rstrip('/') if kind == 'dir' else name
+        self.size = size
+        self.mtime = mtime if mtime is not None else time.time()
+        self.mode = mode if mode is not None else (0o755 if kind == 'dir' else 0o644)
+        self.kind = kind
+        self.linkname = linkname
+
+
+class ProgressReader:
+    # Обертка над файлом: каждое чтение сообщает прочитанный объем в ProgressReporter
+    # (он же проверяет отмену)
+
+    def __init__(self, fileobj, progress, absolute=False):
+        self.fileobj = fileobj
+        self.progress = progress
+        self.absolute = absolute
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        if self.absolute:
+            self.progress.update(self.fileobj.tell())
+        else:
+            self.progress.advance(len(data))
+        return data
+
+
+def archive_format(path):
+    # 'zip', '7z', 'rar' или ключ TAR_COMPRESSIONS; report.tar.gz → 'gz'
+    return Path(path).suffix.lstrip('.').lower()
+
+
+# ==================== ЧТЕНИЕ ====================
+# Читатели — генераторы пар (ArchiveMember, файловый объект или None).
+# Файловый объект действителен только до следующего шага генератора
+
+def iter_zip_members(path, progress):
+    with zipfile.ZipFile(path) as archive:
+        infos = archive.infolist()
+        progress.set_total(sum(info.file_size for info in infos), 'bytes')
+        for info in infos:
+            mode = info.external_attr >> 16
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            if info.is_dir():
+                yield ArchiveMember(info.filename, mtime=mtime, mode=stat.S_IMODE(mode) or None, kind='dir'), None
+            elif stat.S_ISLNK(mode):
+                # Info-ZIP хранит символическую ссылку как файл с путем назначения
+                linkname = archive.read(info).decode('utf-8')
+                yield ArchiveMember(info.filename, mtime=mtime, kind='symlink', linkname=linkname), None
+            else:
+                with archive.open(info) as member_file:
+                    member = ArchiveMember(info.filename, info.file_size, mtime, stat.S_IMODE(mode) or None)
+                    yield member, ProgressReader(member_file, progress)
+
+
+# Сигнатуры сжатых потоков: сжатие tar определяется по содержимому, а не по расширению
+COMPRESSION_MAGIC = {
+    b'\x1f\x8b': 'gz',
+    b'BZh': 'bz2',
+    b'\xfd7zXZ\x00': 'xz',
+}
+
+
+def detect_compression(raw):
+    head = raw.read(6)
+    raw.seek(0)
+    for magic, compression in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_decompressor(fileobj, compression):
+    # GzipFile, BZ2File и LZMAFile читают потоки из нескольких сжатых частей подряд —
+    # так пишет ParallelCompressor. Потоковый режим tarfile 'r|gz' читает только первую часть
+    import bz2
+    import gzip
+    import lzma
+
+    if compression == 'gz':
+        return gzip.GzipFile(fileobj=fileobj)
+    if compression == 'bz2':
+        return bz2.BZ2File(fileobj)
+    return lzma.LZMAFile(fileobj)
+
+
+def iter_tar_members(path, progress):
+    # Потоковый режим 'r|': tar читается строго последовательно, распаковку делаем сами.
+    # Прогресс — по сжатым байтам исходника, размер распакованного заранее неизвестен
+    progress.set_total(os.path.getsize(path), 'bytes')
+    with open(path, 'rb') as raw:
+        source = ProgressReader(raw, progress, absolute=True)
+        compression = detect_compression(raw)
+        stream = open_decompressor(source, compression) if compression else source
+        try:
+            archive = tarfile.open(fileobj=stream, mode='r|')
+        except tarfile.ReadError:
+            archive = None
+        if archive is None:
+            # Не tar: одиночный файл, сжатый gzip/bzip2/xz (data.csv.gz)
+            if stream is not source:
+                stream.close()
+            raw.seek(0)
+            yield from iter_compressed_file(path, source)
+            return
+
+        try:
+            with archive:
+                for info in archive:
+                    member = ArchiveMember(info.name, info.size, info.mtime, info.mode)
+                    if info.isdir():
+                        member.kind = 'dir'
+                        yield member, None
+                    elif info.issym() or info.islnk():
+                        member.kind = 'symlink' if info.issym() else 'hardlink'
+                        member.linkname = info.linkname
+                        yield member, None
+                    elif info.isfile():
+                        yield member, archive.extractfile(info)
+                    # Устройства и FIFO пропускаем
+        finally:
+            if stream is not source:
+                stream.close()
+
+
+def iter_compressed_file(path, source):
+    compression = TAR_COMPRESSIONS.get(archive_format(path))
+    if compression is None:
+        raise ValueError(f"{os.path.basename(path)} не является архивом tar")
+    with open_decompressor(source, compression) as member_file:
+        yield ArchiveMember(Path(path).stem, None, os.path.getmtime(path)), member_file
+
+
+class QueueWriter:
+    # Приемник py7zr: куски распакованного члена уходят в ограниченную очередь
+    def __init__(self, events, name, stopped):
+        self.events = events
+        self.name = name
+        self.stopped = stopped
+        self.written = 0
+        events.put(('start', name))
+
+    def write(self, data):
+        if self.stopped.is_set():
+            # Читатель закрыт — прерываем распаковку
+            raise OSError("Чтение архива 7z прервано")
+        self.events.put(('data', bytes(data)))
+        self.written += len(data)
+        return len(data)
+
+    def read(self, size=None):
+        return b''
+
+    def seek(self, offset, whence=0):
+        return 0
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        pass
+
+    def size(self):
+        return self.written
+
+    def close(self):
+        self.events.put(('end', self.name))
+
+
+class QueueReader:
+    # Файловый объект поверх очереди QueueWriter: читает один член до события 'end'
+    def __init__(self, events):
+        self.events = events
+        self.buffer = b''
+        self.finished = False
+
+    def read(self, size=-1):
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            kind, payload = self.events.get()
+            if kind == 'data':
+                self.buffer += payload
+            elif kind == 'end':
+                self.finished = True
+            elif kind == 'error':
+                raise payload
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def drain(self):
+        while self.read(ARCHIVE_CHUNK_SIZE):
+            pass
+
+
+def iter_7z_members(path, progress):
+    # py7zr сам толкает данные в приемники (extract с factory), поэтому распаковка идет
+    # в отдельном потоке, а члены отдаются через очередь ограниченного размера.
+    # Архив открываем из файлового объекта: так py7zr распаковывает последовательно
+    try:
+        import py7zr
+        from py7zr.io import WriterFactory
+    except ImportError:
+        raise RuntimeError("Для архивов 7z установите py7zr: pip install py7zr")
+
+    events = queue.Queue(maxsize=16)
+    stopped = threading.Event()
+
+    class QueueFactory(WriterFactory):
+        def create(self, filename):
+            return QueueWriter(events, filename, stopped)
+
+    with open(path, 'rb') as raw, py7zr.SevenZipFile(raw, 'r') as archive:
+        infos = {info.filename: info for info in archive.list()}
+        progress.set_total(sum(info.uncompressed or 0 for info in infos.values()), 'bytes')
+
+        def mtime_of(info):
+            return info.creationtime.timestamp() if info.creationtime else None
+
+        for info in infos.values():
+            if info.is_directory:
+                yield ArchiveMember(info.filename, mtime=mtime_of(info), kind='dir'), None
+
+        def extract():
+            try:
+                archive.extract(factory=QueueFactory())
+                events.put(('done', None))
+            except BaseException as e:
+                events.put(('error', e))
+
+        worker = threading.Thread(target=extract, daemon=True)
+        worker.start()
+        seen = set()
+        try:
+            while True:
+                kind, payload = events.get()
+                if kind == 'done':
+                    break
+                if kind == 'error':
+                    raise payload
+                if kind != 'start':
+                    continue
+                info = infos.get(payload)
+                seen.add(payload)
+                reader = QueueReader(events)
+                member = ArchiveMember(payload, info.uncompressed if info else None,
+                                       mtime_of(info) if info else None)
+                yield member, ProgressReader(reader, progress)
+                # Писатель мог прочитать член не до конца (например, пропустил его)
+                reader.drain()
+        finally:
+            stopped.set()
+            # Освобождаем очередь, чтобы поток распаковки увидел остановку и завершился
+            while worker.is_alive():
+                try:
+                    events.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+        # Пустые файлы py7zr не распаковывает
+        for name, info in infos.items():
+            if not info.is_directory and name not in seen:
+                yield ArchiveMember(name, 0, mtime_of(info)), io.BytesIO()
+
+
+def iter_rar_members(path, progress):
+    # RAR только читаем: rarfile распаковывает через внешнюю утилиту unrar/unar/bsdtar
+    try:
+        import rarfile
+    except ImportError:
+        raise RuntimeError("Для архивов RAR установите rarfile и unrar: pip install rarfile")
+
+    with rarfile.RarFile(path) as archive:
+        infos = archive.infolist()
+        progress.set_total(sum(info.file_size for info in infos), 'bytes')
+        for info in infos:
+            mtime = time.mktime(tuple(info.date_time) + (0, 0, -1))
+            if info.is_dir():
+                yield ArchiveMember(info.filename, mtime=mtime, kind='dir'), None
+            elif info.is_symlink():
+                yield ArchiveMember(info.filename, mtime=mtime, kind='symlink',
+                                    linkname=archive.read(info).decode('utf-8')), None
+            else:
+                with archive.open(info) as member_file:
+                    yield ArchiveMember(info.filename, info.file_size, mtime), ProgressReader(member_file, progress)
+
+
+def iter_archive_members(path, progress):
+    fmt = archive_format(path)
+    if fmt == 'zip':
+        return iter_zip_members(path, progress)
+    if fmt == '7z':
+        return iter_7z_members(path, progress)
+    if fmt == 'rar':
+        return iter_rar_members(path, progress)
+    if fmt in TAR_COMPRESSIONS:
+        return iter_tar_members(path, progress)
+    raise ValueError(f"Неизвестный формат архива: {fmt}")
+
+
+# ==================== ЗАПИСЬ ====================
+
+class ParallelCompressor:
+    # Файловый объект для записи: данные режутся на блоки, блоки сжимаются в пуле потоков
+    # (zlib, bz2 и lzma отпускают GIL) и пишутся по порядку. В работе не больше 2 блоков на поток
+    def __init__(self, fileobj, compression, level, threads):
+        import bz2
+        import gzip
+        import lzma
+
+        compressors = {
+            'gz': lambda block: gzip.compress(block, compresslevel=level, mtime=0),
+            'bz2': lambda block: bz2.compress(block, max(level, 1)),
+            'xz': lambda block: lzma.compress(block, preset=level),
+        }
+        self.fileobj = fileobj
+        self.compress = compressors[compression]
+        self.block_size = COMPRESSION_BLOCK_SIZES[compression]
+        self.max_pending = threads * 2
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self.submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def submit(self, block):
+        self.pending.append(self.executor.submit(self.compress, block))
+        while len(self.pending) > self.max_pending:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def close(self):
+        try:
+            if self.buffer:
+                self.submit(bytes(self.buffer))
+                self.buffer.clear()
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
+
+def open_compressor(fileobj, compression, level, threads):
+    # Один поток — обычный потоковый компрессор (лучшее сжатие), несколько — блочный параллельный
+    import bz2
+    import gzip
+    import lzma
+
+    if threads > 1:
+        return ParallelCompressor(fileobj, compression, level, threads)
+    if compression == 'gz':
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=level, mtime=0)
+    if compression == 'bz2':
+        return bz2.BZ2File(fileobj, 'wb', compresslevel=max(level, 1))
+    return lzma.LZMAFile(fileobj, 'wb', preset=level)
+
+
+class TarArchiveWriter:
+    def __init__(self, output_path, compression, level, threads):
+        self.raw = open(output_path, 'wb')
+        self.compressor = open_compressor(self.raw, compression, level, threads) if compression else None
+        self.archive = tarfile.open(fileobj=self.compressor or self.raw, mode='w|', format=tarfile.PAX_FORMAT)
+
+    def add(self, member, fileobj):
+        info = tarfile.TarInfo(member.name)
+        info.mtime = int(member.mtime)
+        info.mode = member.mode
+        if member.kind == 'dir':
+            info.type = tarfile.DIRTYPE
+        elif member.kind in ('symlink', 'hardlink'):
+            info.type = tarfile.SYMTYPE if member.kind == 'symlink' else tarfile.LNKTYPE
+            info.linkname = member.linkname
+        elif member.size is None:
+            # Размер неизвестен (одиночный .gz) — tar требует его в заголовке, поэтому буферизуем
+            fileobj = spool(fileobj)
+            info.size = fileobj.seek(0, os.SEEK_END)
+            fileobj.seek(0)
+        else:
+            info.size = member.size
+        self.archive.addfile(info, fileobj if info.isfile() else None)
+
+    def close(self):
+        try:
+            self.archive.close()
+            if self.compressor:
+                self.compressor.close()
+        finally:
+            self.raw.close()
+
+
+# Публичный уровень сжатия записи есть у ZipInfo с Python 3.13; в более старых
+# потоковая запись ZIP сжимает с уровнем zlib по умолчанию
+ZIPINFO_HAS_LEVEL = hasattr(zipfile.ZipInfo, 'compress_level')
+
+
+class ZipArchiveWriter:
+    def __init__(self, output_path, level):
+        self.compression = zipfile.ZIP_DEFLATED if level else zipfile.ZIP_STORED
+        self.level = level
+        self.archive = zipfile.ZipFile(output_path, 'w', self.compression, compresslevel=level or None)
+
+    def add(self, member, fileobj):
+        name = f"{member.name}/" if member.kind == 'dir' else member.name
+        info = zipfile.ZipInfo(name, time.localtime(max(member.mtime, 315532800))[:6])
+        if member.kind == 'dir':
+            info.external_attr = ((stat.S_IFDIR | member.mode) << 16) | 0x10
+            self.archive.writestr(info, b'')
+        elif member.kind == 'symlink':
+            info.external_attr = (stat.S_IFLNK | 0o777) << 16
+            self.archive.writestr(info, member.linkname)
+        elif member.kind == 'file':
+            info.external_attr = (stat.S_IFREG | member.mode) << 16
+            info.compress_type = self.compression
+            if ZIPINFO_HAS_LEVEL:
+                # Уровень сжатия для open('w') берется из ZipInfo, а не из ZipFile
+                info.compress_level = self.level or None
+            if member.size is not None:
+                info.file_size = member.size
+            with self.archive.open(info, 'w', force_zip64=member.size is None) as target:
+                copy_stream(fileobj, target)
+        # Жесткие ссылки в ZIP не переносятся: в потоковом чтении данных у них нет
+
+    def close(self):
+        self.archive.close()
+
+
+class SevenZipArchiveWriter:
+    def __init__(self, output_path, level):
+        try:
+            import py7zr
+        except ImportError:
+            raise RuntimeError("Для архивов 7z установите py7zr: pip install py7zr")
+        filters = [{'id': py7zr.FILTER_LZMA2, 'preset': level}]
+        self.archive = py7zr.SevenZipFile(output_path, 'w', filters=filters)
+
+    def add(self, member, fileobj):
+        # Каталоги 7z восстанавливает по путям файлов; ссылки не переносим
+        if member.kind != 'file':
+            return
+        data = spool(fileobj, member.size)
+        try:
+            self.archive.writef(data, member.name)
+        finally:
+            data.close()
+
+    def close(self):
+        self.archive.close()
+
+
+def spool(fileobj, size=None):
+    # Копия члена с известным размером: в памяти, если он небольшой, иначе во временном файле
+    if size is not None and size <= SEVENZIP_SPOOL_SIZE:
+        buffer = io.BytesIO()
+    else:
+        from converters import fast_temp_dir
+        buffer = tempfile.TemporaryFile(dir=fast_temp_dir())
+    copy_stream(fileobj, buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_stream(source, target):
+    while True:
+        chunk = source.read(ARCHIVE_CHUNK_SIZE)
+        if not chunk:
+            return
+        target.write(chunk)
+
+
+def open_archive_writer(output_path, level, threads):
+    fmt = archive_format(output_path)
+    if fmt == 'zip':
+        return ZipArchiveWriter(output_path, level)
+    if fmt == '7z':
+        return SevenZipArchiveWriter(output_path, level)
+    if fmt in TAR_COMPRESSIONS:
+        return TarArchiveWriter(output_path, TAR_COMPRESSIONS[fmt], level, threads)
+    raise ValueError(f"Запись в формат {fmt.upper()} не поддерживается")
+
+
+def repack_archive(input_path, output_path, level=DEFAULT_COMPRESSION_LEVEL, threads=1, progress=None):
+    # Переупаковка члена за членом; возвращает количество перенесенных членов
+    from progress import ensure_progress
+
+    progress = ensure_progress(progress)
+    threads = max(1, min(threads, ARCHIVE_MAX_THREADS))
+    writer = open_archive_writer(output_path, level, threads)
+    count = 0
+    try:
+        members = iter_archive_members(input_path, progress)
+        try:
+            for member, fileobj in members:
+                writer.add(member, fileobj)
+                count += 1
+        finally:
+            members.close()
+    finally:
+        writer.close()
+    progress.finish()
+    return count
@@ -0,0 +1,301 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from cache import ConversionCache, cached_convert, get_default_cache
+from cancel import ConversionCancelled, convert_atomic
+from metrics import (ConversionMetrics, add_metrics_arguments, apply_metrics_arguments, record_result,
+                     write_prometheus)
+from options import add_option_arguments, options_from_args
+from progress import ProgressReporter, describe_progress
+from planner import resolve_conversion_function
+
+
+# ==================== ПАКЕТНАЯ КОНВЕРТАЦИЯ ====================
+
+def collect_inputs(patterns, recursive=False):
+    # Раскрывает список путей, папок и glob-шаблонов в список файлов
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            mask = os.path.join(pattern, '**', '*') if recursive else os.path.join(pattern, '*')
+            matches = glob.glob(mask, recursive=recursive)
+        elif glob.has_magic(pattern):
+            matches = glob.glob(pattern, recursive=recursive)
+        else:
+            matches = [pattern]
+
+        for path in sorted(matches):
+            if os.path.isfile(path) and path not in files:
+                files.append(path)
+    return files
+
+
+def build_output_path(input_path, output_format, output_dir=None, base_dir=None, with_extension=False,
+                      counter=None):
+    # Путь для результата: рядом с исходником с суффиксом _converted
+    # или в указанной папке с тем же именем; папки входа относительно base_dir повторяются в output_dir.
+    # with_extension добавляет к имени исходное расширение: in.wav → in_wav.mp3,
+    # counter — номер при оставшемся совпадении: in_wav-2.mp3
+    path = Path(input_path)
+    stem = f"{path.stem}_{path.suffix.lstrip('.').lower()}" if with_extension else path.stem
+    if counter is not None:
+        stem = f"{stem}-{counter}"
+    ext = output_format.lower()
+    if output_dir:
+        relative_dir = os.path.relpath(os.path.dirname(os.path.abspath(input_path)), base_dir) if base_dir else '.'
+        return os.path.normpath(os.path.join(output_dir, relative_dir, f"{stem}.{ext}"))
+    return os.path.join(os.path.dirname(input_path), f"{stem}_converted.{ext}")
+
+
+def build_output_paths(inputs, output_format, output_dir=None):
+    # Пути результатов пакета: {вход: выход}. Входы с одинаковым именем (in.mkv и in.wav → in.mp3,
+    # a/x.png и b/x.png с -r) не должны перезаписывать друг друга: папки повторяются
+    # относительно общей папки входов, совпавшие имена различаются исходным расширением,
+    # а если совпало и оно (x.PNG и x.png) — номером
+    base_dir = None
+    if output_dir and inputs:
+        base_dir = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in inputs])
+    paths = {}
+    claimed = {}
+    for input_path in inputs:
+        save_path = build_output_path(input_path, output_format, output_dir, base_dir)
+        key = os.path.normcase(os.path.abspath(save_path))
+        if key in claimed:
+            save_path = build_output_path(input_path, output_format, output_dir, base_dir, with_extension=True)
+            key = os.path.normcase(os.path.abspath(save_path))
+        counter = 2
+        while key in claimed:
+            save_path = build_output_path(input_path, output_format, output_dir, base_dir, with_extension=True,
+                                          counter=counter)
+            key = os.path.normcase(os.path.abspath(save_path))
+            counter += 1
+        claimed[key] = input_path
+        paths[input_path] = save_path
+    return paths
+
+
+def convert_file(input_path, save_path, use_cache=True, cache_dir=None, progress_queue=None, options=None,
+                 progress_key=None, cancel_token=None, source_hash=None):
+    # Конвертация одного файла в процессе-воркере
+    # Возвращает словарь со статусом, чтобы ошибка одного файла не ломала весь пакет.
+    # Прогресс конвертера уходит в progress_queue парами (progress_key или input_path, info).
+    # cancel_token должен быть межпроцессным: CancellationToken(manager.Event()).
+    # source_hash — уже посчитанный хэш содержимого входа для ключа кэша.
+    # В result['metrics'] — замер конвертации (см. metrics.py)
+    result = {
+        'input': input_path,
+        'output': save_path,
+        'status': 'ok',
+        'error': None,
+        'bytes_in': 0,
+        'bytes_out': 0,
+        'seconds': 0.0,
+        'cache': None,
+        'method': None,
+    }
+    key = progress_key if progress_key is not None else input_path
+    callback = (lambda info: progress_queue.put((key, info))) if progress_queue else None
+    reporter = ProgressReporter(callback=callback, min_interval=0.5, cancel_token=cancel_token)
+    metrics = ConversionMetrics(input_path, save_path, reporter)
+    start = time.perf_counter()
+    try:
+        result['bytes_in'] = os.path.getsize(input_path)
+        # Прямой конвертер или цепочка через планировщик
+        conversion_func = resolve_conversion_function(input_path, save_path)
+        if not conversion_func:
+            raise ValueError(f"Конвертация {Path(input_path).suffix} в {Path(save_path).suffix} не поддерживается")
+        with metrics:
+            if use_cache:
+                cache = ConversionCache(cache_dir) if cache_dir else get_default_cache()
+                # Некоторые конвертеры сообщают выбранный путь, например 'copy' или 'transcode'
+                hit, result['method'] = cached_convert(conversion_func, input_path, save_path, options,
+                                                       cache=cache, source_hash=source_hash, progress=reporter)
+                result['cache'] = 'hit' if hit else 'miss'
+            else:
+                result['method'] = convert_atomic(conversion_func, input_path, save_path,
+                                                  progress=reporter, options=options)
+        if os.path.exists(save_path):
+            result['bytes_out'] = os.path.getsize(save_path)
+    except ConversionCancelled as e:
+        result['status'] = 'cancelled'
+        result['error'] = str(e)
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f"{str(e)}\n{traceback.format_exc()}"
+    result['seconds'] = time.perf_counter() - start
+    if metrics.started:
+        # Неподдерживаемые пары и отсутствующие файлы не замеряем — конвертации не было
+        result['metrics'] = metrics.to_dict(method=result['method'], cache=result['cache'])
+    return result
+
+
+def run_batch(inputs, output_format, output_dir=None, workers=None, on_result=None,
+              use_cache=True, cache_dir=None, on_progress=None, options=None, cancel_token=None):
+    # Конвертирует список файлов в пуле процессов
+    # on_result(result) вызывается по мере готовности каждого файла,
+    # on_progress(input_path, info) — по отчетам конвертеров изнутри воркеров,
+    # options — настройки кодирования (см. options.py),
+    # cancel_token — межпроцессный токен отмены: оставшиеся файлы завершатся со статусом 'cancelled'.
+    # Результаты пишутся атомарно, поэтому повторный запуск после отмены берет готовое из кэша
+    output_paths = build_output_paths(inputs, output_format, output_dir)
+    for save_path in output_paths.values():
+        os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    results = []
+    start = time.perf_counter()
+
+    manager = None
+    progress_queue = None
+    listener = None
+    if on_progress:
+        manager = multiprocessing.Manager()
+        progress_queue = manager.Queue()
+        listener = threading.Thread(target=drain_progress, args=(progress_queue, on_progress), daemon=True)
+        listener.start()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(convert_file, path, output_paths[path],
+                                use_cache, cache_dir, progress_queue, options, None, cancel_token)
+                for path in inputs
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                record_result(result)
+                results.append(result)
+                if on_result:
+                    on_result(result)
+    finally:
+        if manager:
+            progress_queue.put(None)
+            listener.join()
+            manager.shutdown()
+
+    return summarize(results, time.perf_counter() - start)
+
+
+def drain_progress(progress_queue, on_progress):
+    # Поток, который пересылает отчеты о прогрессе из воркеров в on_progress
+    while True:
+        try:
+            item = progress_queue.get()
+        except (EOFError, OSError, queue.Empty):
+            return
+        if item is None:
+            return
+        on_progress(*item)
+
+
+def summarize(results, elapsed):
+    # Итоговая статистика пакета: количество файлов и пропускная способность
+    ok = [r for r in results if r['status'] == 'ok']
+    bytes_in = sum(r['bytes_in'] for r in ok)
+    return {
+        'results': results,
+        'total': len(results),
+        'ok': len(ok),
+        'failed': len(results) - len(ok),
+        'cache_hits': sum(1 for r in results if r['cache'] == 'hit'),
+        'elapsed': elapsed,
+        'files_per_sec': len(ok) / elapsed if elapsed > 0 else 0.0,
+        'mb_per_sec': bytes_in / (1024 * 1024) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+# ==================== CLI ====================
+
+def print_result(result):
+    name = os.path.basename(result['input'])
+    if result['status'] == 'ok':
+        cached = ' [кэш]' if result['cache'] == 'hit' else ''
+        method = f" [{result['method']}]" if result['method'] else ''
+        print(f"[OK]     {name} -> {result['output']} ({result['seconds']:.2f} с){cached}{method}")
+    elif result['status'] == 'cancelled':
+        print(f"[ОТМЕНА] {name}")
+    else:
+        error = result['error'].splitlines()[0] if result['error'] else ''
+        print(f"[ОШИБКА] {name}: {error}")
+
+
+def print_progress(input_path, info):
+    percent = f"{info['percent']:5.1f}%" if info['percent'] is not None else '  ... '
+    print(f"[{percent}] {os.path.basename(input_path)}: {describe_progress(info)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная конвертация файлов без GUI")
+    parser.add_argument('inputs', nargs='+', help="Файлы, папки или glob-шаблоны")
+    parser.add_argument('-t', '--to', required=True, help="Целевой формат, например PNG")
+    parser.add_argument('-o', '--output-dir', help="Папка для результатов")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="Количество процессов (по умолчанию — число ядер)")
+    parser.add_argument('-r', '--recursive', action='store_true', help="Обходить папки рекурсивно")
+    parser.add_argument('--no-cache', action='store_true', help="Не использовать кэш конвертаций")
+    parser.add_argument('--cache-dir', help="Папка кэша конвертаций")
+    parser.add_argument('--progress', action='store_true', help="Показывать прогресс каждого файла")
+    parser.add_argument('--scheduler', action='store_true',
+                        help="Запускать ffmpeg/pandoc/pdftoppm напрямую через планировщик asyncio")
+    parser.add_argument('--limit', action='append', metavar='ИНСТРУМЕНТ=N',
+                        help="Лимит одновременных процессов инструмента для --scheduler, например ffmpeg=2")
+    parser.add_argument('--metrics-file', metavar='ФАЙЛ',
+                        help="Записать метрики в текстовом формате Prometheus по окончании")
+    add_metrics_arguments(parser)
+    add_option_arguments(parser)
+    args = parser.parse_args(argv)
+    options = options_from_args(args)
+    apply_metrics_arguments(args)
+
+    inputs = collect_inputs(args.inputs, recursive=args.recursive)
+    if not inputs:
+        print("Файлы не найдены")
+        return 1
+
+    try:
+        if args.scheduler:
+            from scheduler import parse_limits, run_scheduled_batch
+            limits = parse_limits(args.limit)
+            if args.workers:
+                limits.setdefault('python', args.workers)
+            summary = run_scheduled_batch(inputs, args.to, args.output_dir, limits, on_result=print_result,
+                                          use_cache=not args.no_cache, cache_dir=args.cache_dir,
+                                          on_progress=print_progress if args.progress else None, options=options)
+        else:
+            summary = run_batch(inputs, args.to, args.output_dir, args.workers, on_result=print_result,
+                                use_cache=not args.no_cache, cache_dir=args.cache_dir,
+                                on_progress=print_progress if args.progress else None, options=options)
+    except ValueError as e:
+        # Неверные лимиты планировщика — ничего не конвертируем
+        print(e)
+        return 1
+    except KeyboardInterrupt:
+        # Воркеры получают тот же сигнал и удаляют недописанные файлы;
+        # готовые результаты уже в кэше, повторный запуск их не пересчитывает
+        print("\nПрервано")
+        return 130
+    finally:
+        if args.metrics_file:
+            write_prometheus(args.metrics_file)
+
+    print(f"\nГотово: {summary['ok']} из {summary['total']}, ошибок: {summary['failed']}, "
+          f"из кэша: {summary['cache_hits']}")
+    print(f"Время: {summary['elapsed']:.2f} с, "
+          f"{summary['files_per_sec']:.2f} файл/с, {summary['mb_per_sec']:.2f} МБ/с")
+    if 'scheduler' in summary:
+        from scheduler import print_scheduler_stats
+        print_scheduler_stats(summary['scheduler'])
+    return 0 if summary['failed'] == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+# ==================== ВРЕМЯ ЗАПУСКА ====================
+# Замеряет запуск CLI и GUI в отдельных процессах через python -X importtime
+# и показывает самые дорогие импорты. Тяжелые модули в CLI — регрессия
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Что замеряем: название → код, выполняемый в чистом интерпретаторе
+TARGETS = {
+    'cli': "import sys; sys.argv = ['converter', 'formats']; import converter; converter.build_parser()",
+    'cli-convert': "import cache, planner, registry, options, progress",
+    'gui': "import main",
+}
+
+# Модули, которым не место при запуске CLI
+HEAVY_MODULES = ['PyQt6', 'pandas', 'pyarrow', 'numpy', 'moviepy', 'pydub', 'pypandoc', 'PIL', 'pdf2image']
+
+
+def parse_importtime(stderr):
+    # Строки вида "import time:       123 |       4567 | package.module"
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def measure(code, repeat=3):
+    # Лучшее время из нескольких запусков и разбор импортов последнего
+    best = None
+    imports = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                cwd=ROOT, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return {'error': result.stderr.strip().splitlines()[-1]}
+        best = elapsed if best is None else min(best, elapsed)
+        imports = parse_importtime(result.stderr)
+    return {'seconds': best, 'imports': imports}
+
+
+def report(name, result, top):
+    if 'error' in result:
+        print(f"{name}: ошибка — {result['error']}")
+        return False
+
+    imports = result['imports']
+    print(f"{name}: {result['seconds'] * 1000:.0f} мс, модулей: {len(imports)}")
+    for module, _, cumulative_us in sorted(imports, key=lambda item: -item[2])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} мс  {module}")
+
+    loaded = {module.split('.')[0] for module, _, _ in imports}
+    heavy = [module for module in HEAVY_MODULES if module in loaded]
+    if heavy and name.startswith('cli'):
+        print(f"  ВНИМАНИЕ: при запуске CLI загружены {', '.join(heavy)}")
+        return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Время запуска CLI и GUI")
+    parser.add_argument('targets', nargs='*', help=f"Что замерять: {', '.join(TARGETS)} (по умолчанию все)")
+    parser.add_argument('--top', type=int, default=10, help="Сколько самых дорогих импортов показывать")
+    parser.add_argument('--repeat', type=int, default=3, help="Количество запусков")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.targets if name not in TARGETS]
+    if unknown:
+        parser.error(f"неизвестные цели: {', '.join(unknown)}")
+
+    ok = True
+    for name in args.targets or list(TARGETS):
+        ok = report(name, measure(TARGETS[name], args.repeat), args.top) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,391 @@
+import argparse
+import csv
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from array import array
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+# ==================== НАБОР БЕНЧМАРКОВ КОНВЕРТЕРОВ ====================
+# Синтетические файлы генерируются локально, каждая конвертация запускается в отдельном процессе:
+# так пиковая память не смешивается между замерами. Результаты пишутся в JSON
+# и сравниваются с сохраненной базой по порогу регрессии
+
+DEFAULT_ROWS = 100_000
+DEFAULT_IMAGE_SIZE = 2048
+DEFAULT_DURATION = 5
+DEFAULT_THRESHOLD = 0.15
+# Метрики, по которым ищем регрессии
+COMPARED_METRICS = ['wall', 'cpu', 'peak_rss_mb']
+
+# Замеры: (название, семейство, входной файл, выходной формат, функция из converters, настройки)
+CASES = [
+    ('png-jpg', 'image', 'image.png', 'jpg', 'convert_image_pillow', None),
+    ('png-webp', 'image', 'image.png', 'webp', 'convert_image_pillow', None),
+    ('png-tiff', 'image', 'image.png', 'tiff', 'convert_image_pillow', None),
+    ('jpg-png', 'image', 'image.jpg', 'png', 'convert_image_pillow', None),
+    ('jpg-ico', 'image', 'image.jpg', 'ico', 'convert_image_pillow', None),
+    ('jpg-webp-thumb', 'image', 'image.jpg', 'webp', 'convert_image_pillow', {'max_size': 512}),
+    ('bmp-png', 'image', 'image.bmp', 'png', 'convert_image_pillow', None),
+    ('webp-png', 'image', 'image.webp', 'png', 'convert_image_pillow', None),
+    ('gif-webp-animated', 'image', 'animated.gif', 'webp', 'convert_image_pillow', None),
+    ('csv-parquet', 'table', 'table.csv', 'parquet', 'convert_table_pandas', None),
+    ('csv-json', 'table', 'table.csv', 'json', 'convert_table_pandas', None),
+    ('csv-xlsx', 'table', 'table.csv', 'xlsx', 'convert_table_pandas', None),
+    ('csv-xml', 'table', 'table.csv', 'xml', 'convert_table_pandas', None),
+    ('json-csv', 'table', 'table.json', 'csv', 'convert_table_pandas', None),
+    ('xml-csv', 'table', 'table.xml', 'csv', 'convert_table_pandas', None),
+    ('wav-mp3', 'audio', 'tone.wav', 'mp3', 'convert_audio_ffmpeg', None),
+    ('wav-flac', 'audio', 'tone.wav', 'flac', 'convert_audio_ffmpeg', None),
+    ('wav-ogg', 'audio', 'tone.wav', 'ogg', 'convert_audio_ffmpeg', None),
+    ('mp4-webm', 'video', 'video.mp4', 'webm', 'convert_video_moviepy', {'profile': 'fastest'}),
+    ('mp4-avi', 'video', 'video.mp4', 'avi', 'convert_video_moviepy', {'profile': 'fastest'}),
+    ('mp4-mkv-remux', 'video', 'video.mp4', 'mkv', 'convert_video_ffmpeg', None),
+    ('mp4-mp3', 'video', 'video.mp4', 'mp3', 'extract_audio_ffmpeg', None),
+    ('pdf-png', 'pdf', 'document.pdf', 'png', 'convert_pdf_to_image_pdf2image', None),
+    ('pdf-png-all', 'pdf', 'document.pdf', 'png', 'convert_pdf_to_image_pdf2image', {'pages': 'all'}),
+    ('pdf-jpg-300dpi', 'pdf', 'document.pdf', 'jpg', 'convert_pdf_to_image_pdf2image', {'dpi': 300}),
+]
+
+FAMILIES = sorted({family for _, family, _, _, _, _ in CASES})
+
+
+# ==================== СИНТЕТИЧЕСКИЕ ФАЙЛЫ ====================
+
+def make_images(fixtures_dir, size):
+    from PIL import Image
+
+    # Шум в одном канале и градиенты в других: не сжимается в ноль, но и не чистый шум
+    base = Image.merge('RGB', [
+        Image.effect_noise((size, size), 48),
+        Image.linear_gradient('L').resize((size, size)),
+        Image.radial_gradient('L').resize((size, size)),
+    ])
+    for ext in ['png', 'jpg', 'bmp', 'webp']:
+        base.save(os.path.join(fixtures_dir, f"image.{ext}"))
+
+    frames = []
+    frame_size = max(size // 8, 64)
+    small = base.resize((frame_size, frame_size))
+    for index in range(30):
+        frames.append(small.rotate(index * 12).convert('P', palette=Image.Palette.ADAPTIVE))
+    frames[0].save(os.path.join(fixtures_dir, 'animated.gif'), save_all=True,
+                   append_images=frames[1:], duration=40, loop=0)
+
+
+def iter_table_rows(rows, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    for index in range(rows):
+        yield {
+            'id': index,
+            'name': f"item_{rng.randrange(10_000)}",
+            'value': round(rng.uniform(-1000, 1000), 4),
+            'count': rng.randrange(1000),
+            'date': (start + timedelta(minutes=index)).isoformat(),
+            'flag': rng.random() < 0.5,
+        }
+
+
+def make_tables(fixtures_dir, rows):
+    fields = list(next(iter_table_rows(1)))
+
+    with open(os.path.join(fixtures_dir, 'table.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(iter_table_rows(rows))
+
+    with open(os.path.join(fixtures_dir, 'table.json'), 'w', encoding='utf-8') as f:
+        f.write('[')
+        for index, row in enumerate(iter_table_rows(rows)):
+            f.write((',\n' if index else '\n') + json.dumps(row, ensure_ascii=False))
+        f.write('\n]\n')
+
+    with open(os.path.join(fixtures_dir, 'table.xml'), 'w', encoding='utf-8') as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<data>\n")
+        for row in iter_table_rows(rows):
+            f.write('  <row>' + ''.join(f"<{key}>{value}</{key}>" for key, value in row.items()) + '</row>\n')
+        f.write('</data>\n')
+
+
+def make_wav(fixtures_dir, duration, sample_rate=44100):
+    # Стерео-синусоида 440/660 Гц, 16 бит
+    samples = array('h')
+    for index in range(int(duration * sample_rate)):
+        t = index / sample_rate
+        samples.append(int(12000 * math.sin(2 * math.pi * 440 * t)))
+        samples.append(int(12000 * math.sin(2 * math.pi * 660 * t)))
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    with wave.open(os.path.join(fixtures_dir, 'tone.wav'), 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+
+def make_video(fixtures_dir, duration):
+    # Тестовая таблица ffmpeg + синусоида, H.264/AAC в MP4
+    import ffmpeg_tools
+
+    ffmpeg = ffmpeg_tools.find_ffmpeg()
+    if not ffmpeg:
+        return False
+    subprocess.run([
+        ffmpeg, '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f"testsrc=size=1280x720:rate=30:duration={duration}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:duration={duration}",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-shortest',
+        os.path.join(fixtures_dir, 'video.mp4'),
+    ], check=True)
+    return True
+
+
+def make_pdf(fixtures_dir, pages=10):
+    from PIL import Image, ImageDraw
+
+    # Страницы A4 при 100 dpi с текстом и линиями
+    images = []
+    for page in range(pages):
+        img = Image.new('RGB', (827, 1169), 'white')
+        draw = ImageDraw.Draw(img)
+        for line in range(40):
+            y = 60 + line * 26
+            draw.text((60, y), f"Page {page + 1}, line {line + 1}: " + 'lorem ipsum ' * 5, fill='black')
+            draw.line((60, y + 20, 767, y + 20), fill=(200, 200, 200))
+        images.append(img)
+    images[0].save(os.path.join(fixtures_dir, 'document.pdf'), save_all=True,
+                   append_images=images[1:], resolution=100)
+
+
+def make_fixtures(fixtures_dir, families, rows, image_size, duration):
+    # Создает только недостающие файлы, чтобы повторные прогоны не тратили время на генерацию
+    os.makedirs(fixtures_dir, exist_ok=True)
+    generators = {
+        'image': ('image.png', lambda: make_images(fixtures_dir, image_size)),
+        'table': ('table.csv', lambda: make_tables(fixtures_dir, rows)),
+        'audio': ('tone.wav', lambda: make_wav(fixtures_dir, duration)),
+        'video': ('video.mp4', lambda: make_video(fixtures_dir, duration)),
+        'pdf': ('document.pdf', lambda: make_pdf(fixtures_dir)),
+    }
+    for family in families:
+        marker, generate = generators[family]
+        if os.path.exists(os.path.join(fixtures_dir, marker)):
+            continue
+        print(f"Генерация файлов: {family}")
+        try:
+            generate()
+        except Exception as e:
+            print(f"  не удалось: {e}")
+
+
+# ==================== ЗАМЕРЫ ====================
+
+def peak_rss_mb():
+    # Пиковая память процесса и его дочерних процессов (ffmpeg и т.п.)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # На macOS ru_maxrss в байтах, на Linux — в килобайтах
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def cpu_seconds():
+    # Процессорное время вместе с дочерними процессами: кодирование часто идет во внешнем ffmpeg
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def run_case_in_process(name, fixtures_dir, output_dir):
+    # Выполняется в дочернем процессе: одна конвертация, результат — JSON в stdout
+    import converters
+
+    _, _, fixture, output_ext, func_name, options = next(case for case in CASES if case[0] == name)
+    input_path = os.path.join(fixtures_dir, fixture)
+    output_path = os.path.join(output_dir, f"{name}.{output_ext}")
+    func = getattr(converters, func_name)
+
+    cpu_start = cpu_seconds()
+    start = time.perf_counter()
+    func(input_path, output_path, options=options)
+    wall = time.perf_counter() - start
+    cpu = cpu_seconds() - cpu_start
+
+    outputs = [os.path.join(output_dir, entry) for entry in os.listdir(output_dir) if entry.startswith(name)]
+    return {
+        'wall': wall,
+        'cpu': cpu,
+        'peak_rss_mb': peak_rss_mb(),
+        'bytes_in': os.path.getsize(input_path),
+        'bytes_out': sum(os.path.getsize(path) for path in outputs),
+    }
+
+
+def measure_case(name, fixtures_dir, repeat):
+    # Несколько запусков в отдельных процессах: медиана времени, максимум памяти
+    fixture = next(case[2] for case in CASES if case[0] == name)
+    if not os.path.exists(os.path.join(fixtures_dir, fixture)):
+        return {'status': 'skipped', 'error': f"нет файла {fixture}"}
+
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run-case', name,
+                 '--fixtures', fixtures_dir, '--output-dir', output_dir],
+                cwd=ROOT, capture_output=True, text=True,
+            )
+        if result.returncode != 0:
+            lines = (result.stderr or result.stdout).strip().splitlines()
+            return {'status': 'error', 'error': lines[-1] if lines else f"код {result.returncode}"}
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    rss = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb'] is not None]
+    return {
+        'status': 'ok',
+        'wall': statistics.median(run['wall'] for run in runs),
+        'cpu': statistics.median(run['cpu'] for run in runs),
+        'peak_rss_mb': max(rss) if rss else None,
+        'bytes_in': runs[0]['bytes_in'],
+        'bytes_out': runs[0]['bytes_out'],
+        'runs': len(runs),
+    }
+
+
+# ==================== СРАВНЕНИЕ С БАЗОЙ ====================
+
+def compare(results, baseline, threshold):
+    # Список регрессий: (замер, метрика, база, текущее, относительное изменение)
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base or current.get('status') != 'ok' or base.get('status') != 'ok':
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = base.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change > threshold:
+                regressions.append((name, metric, old, new, change))
+    return regressions
+
+
+def format_metric(metric, value):
+    if value is None:
+        return '—'
+    if metric == 'peak_rss_mb':
+        return f"{value:.0f} МБ"
+    return f"{value:.3f} с"
+
+
+def print_results(results, baseline=None):
+    print(f"{'замер':<20} {'время':>10} {'CPU':>10} {'память':>9}  ")
+    for name, result in results.items():
+        if result['status'] != 'ok':
+            print(f"{name:<20} {result['status']}: {result['error']}")
+            continue
+        line = (f"{name:<20} {format_metric('wall', result['wall']):>10} "
+                f"{format_metric('cpu', result['cpu']):>10} "
+                f"{format_metric('peak_rss_mb', result['peak_rss_mb']):>9}")
+        base = (baseline or {}).get(name)
+        if base and base.get('status') == 'ok' and base.get('wall'):
+            line += f"  {(result['wall'] - base['wall']) * 100 / base['wall']:+.0f}% к базе"
+        print(line)
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки конвертеров на синтетических файлах")
+    parser.add_argument('cases', nargs='*', help=f"Замеры или семейства: {', '.join(FAMILIES)} (по умолчанию все)")
+    parser.add_argument('--list', action='store_true', help="Показать замеры и выйти")
+    parser.add_argument('--fixtures', help="Папка с тестовыми файлами (создается при необходимости)")
+    parser.add_argument('--repeat', type=int, default=3, help="Запусков на замер (берется медиана)")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help="Строк в таблицах")
+    parser.add_argument('--image-size', type=int, default=DEFAULT_IMAGE_SIZE, help="Сторона изображения, px")
+    parser.add_argument('--duration', type=int, default=DEFAULT_DURATION, help="Длительность аудио и видео, с")
+    parser.add_argument('-o', '--output', help="Куда записать результаты (JSON)")
+    parser.add_argument('--baseline', help="Результаты для сравнения (JSON)")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимое ухудшение, доля (0.15 = 15%%)")
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('--output-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case_in_process(args.run_case, args.fixtures, args.output_dir)))
+        return 0
+
+    if args.list:
+        for name, family, fixture, output_ext, func_name, options in CASES:
+            print(f"{name:<20} {family:<6} {fixture} → {output_ext}  {func_name}{' ' + str(options) if options else ''}")
+        return 0
+
+    selected = [case for case in CASES
+                if not args.cases or case[0] in args.cases or case[1] in args.cases]
+    if not selected:
+        parser.error("нет подходящих замеров, см. --list")
+
+    fixtures_dir = os.path.abspath(args.fixtures or os.path.join(
+        tempfile.gettempdir(), f"konvertor-bench-{args.rows}-{args.image_size}-{args.duration}"))
+    make_fixtures(fixtures_dir, sorted({case[1] for case in selected}),
+                  args.rows, args.image_size, args.duration)
+
+    results = {}
+    for name, *_ in selected:
+        print(f"{name}...", end=' ', flush=True)
+        results[name] = measure_case(name, fixtures_dir, args.repeat)
+        print(results[name]['status'])
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    print()
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': {'rows': args.rows, 'image_size': args.image_size,
+                       'duration': args.duration, 'repeat': args.repeat},
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nРезультаты: {args.output}")
+
+    if baseline is None:
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    if not regressions:
+        print(f"\nРегрессий нет (порог {args.threshold:.0%})")
+        return 0
+    print(f"\nРегрессии (порог {args.threshold:.0%}):")
+    for name, metric, old, new, change in regressions:
+        print(f"  {name}: {metric} {format_metric(metric, old)} → {format_metric(metric, new)} ({change:+.0%})")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,23 @@
+import subprocess
+import sys
+from pathlib import Path
+
+
+# ==================== СБОРКА ИНТЕРФЕЙСА ====================
+# Компилирует .ui в модуль Python, чтобы GUI не разбирал XML при каждом запуске.
+# Запускать после правки uic_storage/main2.ui
+
+UI_FILES = ['uic_storage/main2.ui']
+
+
+def build(ui_path):
+    ui_path = Path(ui_path)
+    output_path = ui_path.with_name(f"{ui_path.stem}_ui.py")
+    subprocess.run([sys.executable, '-m', 'PyQt6.uic.pyuic', str(ui_path), '-o', str(output_path)],
+                   check=True)
+    print(f"{ui_path} -> {output_path}")
+
+
+if __name__ == '__main__':
+    for ui_file in sys.argv[1:] or UI_FILES:
+        build(ui_file)
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from cancel import convert_atomic
+from progress import ensure_progress
+
+
+# ==================== КЭШ КОНВЕРТАЦИЙ ====================
+
+DEFAULT_CACHE_DIR = os.path.join(Path.home(), '.cache', 'konvertor')
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024  # 1 ГБ
+# Вытеснение освобождает место с запасом, до этой доли лимита, чтобы не обходить кэш на каждой записи
+EVICT_TARGET = 0.9
+# Размер кэша ведется счетчиком; полный обход — при превышении лимита или не реже раза в интервал,
+# чтобы учесть записи других процессов
+RESCAN_INTERVAL = 60.0
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    # SHA-256 содержимого файла, читаем кусками чтобы не грузить файл целиком
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def place_file(src, dst):
+    # Кладет файл по пути dst: сначала пробуем жесткую ссылку, иначе копируем
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ConversionCache:
+    # Кэш результатов на диске, ключ — хэш исходника + целевой формат + опции
+    # Вытеснение LRU по времени последнего обращения (atime записи). mtime не трогаем:
+    # запись связана жесткой ссылкой с файлом пользователя, и у него mtime бы тоже менялся
+
+    def __init__(self, cache_dir=None, max_size=None):
+        self.cache_dir = cache_dir or os.environ.get('KONVERTOR_CACHE_DIR', DEFAULT_CACHE_DIR)
+        if max_size is None:
+            max_size = int(os.environ.get('KONVERTOR_CACHE_MAX_MB', DEFAULT_MAX_SIZE // (1024 * 1024))) * 1024 * 1024
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # оценка размера кэша, None — еще не считали
+        self._scanned = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, input_path, output_format, options=None, converter=None, source_hash=None):
+        # source_hash — уже посчитанный file_hash(input_path), чтобы не читать файл второй раз
+        key_data = {
+            'source': source_hash or file_hash(input_path),
+            'format': output_format.lower(),
+            'options': options or {},
+            'converter': converter or '',
+        }
+        raw = json.dumps(key_data, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def entry_path(self, key, output_format):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{output_format.lower()}")
+
+    def get(self, key, output_format, save_path):
+        # При попадании кладет результат в save_path и возвращает True
+        entry = self.entry_path(key, output_format)
+        try:
+            if not os.path.exists(entry):
+                raise FileNotFoundError(entry)
+            place_file(entry, save_path)
+        except FileNotFoundError:
+            # Записи нет или ее между проверкой и ссылкой вытеснил другой процесс
+            with self._lock:
+                self.misses += 1
+            return False
+        try:
+            # Обновляем время обращения для LRU, mtime оставляем прежним
+            os.utime(entry, (time.time(), os.stat(entry).st_mtime))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key, output_format, output_path):
+        # Сохраняет готовый результат в кэш и при необходимости вытесняет старые записи
+        try:
+            size = os.path.getsize(output_path)
+        except OSError:
+            return
+        # Результат больше цели вытеснения не кэшируем: иначе он выдавил бы все записи, а затем и себя
+        if size > self.max_size * EVICT_TARGET:
+            return
+        entry = self.entry_path(key, output_format)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+
+        # Пишем через временный файл, чтобы параллельные процессы не увидели недописанную запись
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry), suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copy2(output_path, tmp_path)
+            try:
+                replaced = os.path.getsize(entry)
+            except OSError:
+                replaced = 0
+            added = os.path.getsize(tmp_path) - replaced
+            os.replace(tmp_path, entry)
+            os.utime(entry)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            if self._size is not None:
+                self._size += added
+            need_scan = (self._size is None or self._size > self.max_size
+                         or time.monotonic() - self._scanned > RESCAN_INTERVAL)
+        if need_scan:
+            self.evict()
+
+    def entries(self):
+        # Список записей кэша: (время обращения, размер, путь)
+        result = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                result.append((stat.st_atime, stat.st_size, path))
+        return result
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # Полный обход: если кэш больше лимита, удаляем самые давно использованные записи
+        # до EVICT_TARGET от лимита. Итог обхода становится новой оценкой размера
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_size:
+            target = self.max_size * EVICT_TARGET
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+        with self._lock:
+            self._size = total
+            self._scanned = time.monotonic()
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._lock:
+            self._size = 0
+            self._scanned = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': self.size(),
+                'max_size': self.max_size,
+                'cache_dir': self.cache_dir,
+            }
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    # Общий кэш процесса, создается при первом обращении
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ConversionCache()
+    return _default_cache
+
+
+def converter_name(conversion_func):
+    # Идентичность конвертера в ключе кэша: одна и та же для всех путей, которые им конвертируют
+    return f"{conversion_func.__module__}.{conversion_func.__qualname__}"
+
+
+def cached_convert(conversion_func, input_path, save_path, options=None, cache=None, source_hash=None, **kwargs):
+    # Выполняет конвертацию через кэш. Возвращает (попадание в кэш, результат конвертера).
+    # options участвуют в ключе и передаются конвертеру вместе с kwargs (например, progress).
+    # Результат пишется атомарно: при ошибке или отмене save_path не появится недописанным
+    cache = cache or get_default_cache()
+    output_format = Path(save_path).suffix.lstrip('.')
+    converter = converter_name(conversion_func)
+
+    progress = ensure_progress(kwargs.get('progress'))
+    with progress.stage('hash'):
+        key = cache.make_key(input_path, output_format, options, converter, source_hash)
+    with progress.stage('cache'):
+        hit = cache.get(key, output_format, save_path)
+    if hit:
+        return True, None
+
+    result = convert_atomic(conversion_func, input_path, save_path, options=options, **kwargs)
+    with progress.stage('cache'):
+        cache.put(key, output_format, save_path)
+    return False, result
@@ -0,0 +1,102 @@
+import os
+import secrets
+import subprocess
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# ==================== ОТМЕНА И АТОМАРНАЯ ЗАПИСЬ ====================
+# Конвертеры не убиваются снаружи: они сами проверяют токен отмены между кадрами,
+# кусками и страницами (через ProgressReporter), завершают свои подпроцессы и удаляют
+# недописанный результат. Результат пишется во временный файл рядом с целевым
+# и переименовывается только после успешной конвертации
+
+class ConversionCancelled(Exception):
+    pass
+
+
+class CancellationToken:
+    # event — любой объект с set()/is_set(): threading.Event для потоков,
+    # Manager().Event() — чтобы передать токен в процесс-воркер
+
+    def __init__(self, event=None):
+        self.event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        if self.event.is_set():
+            raise ConversionCancelled("Конвертация отменена")
+
+
+# Как часто проверять отмену, пока ждем подпроцесс
+PROCESS_POLL_INTERVAL = 0.2
+
+
+def run_process(command, progress=None, **kwargs):
+    # subprocess.run(check=True, capture_output=True), который можно отменить:
+    # пока процесс работает, периодически проверяем токен и при отмене завершаем процесс
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+    try:
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=PROCESS_POLL_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                if progress is not None:
+                    progress.check()
+    finally:
+        stop_process(process)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def stop_process(process, timeout=5):
+    # Завершает подпроцесс, если он еще жив, и дожидается его, чтобы не оставить сирот
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+@contextmanager
+def atomic_output(output_path):
+    # Отдает временный путь с тем же расширением в той же папке (формат определяется по расширению).
+    # После успеха переименовывает результат в output_path; многостраничные результаты
+    # (report_1.png, report_2.png) переименовываются так же. При ошибке или отмене удаляет все
+    path = Path(output_path)
+    directory = path.parent
+    temp_stem = f".{path.stem}.{secrets.token_hex(4)}.part"
+    temp_path = directory / f"{temp_stem}{path.suffix}"
+
+    def produced():
+        return [entry for entry in os.listdir(directory) if entry.startswith(temp_stem)]
+
+    try:
+        yield str(temp_path)
+    except BaseException:
+        for entry in produced():
+            try:
+                os.remove(directory / entry)
+            except OSError:
+                pass
+        raise
+    for entry in produced():
+        os.replace(directory / entry, directory / f"{path.stem}{entry[len(temp_stem):]}")
+
+
+def convert_atomic(conversion_func, input_path, output_path, **kwargs):
+    # Вызов конвертера с атомарной записью результата
+    with atomic_output(output_path) as temp_path:
+        return conversion_func(input_path, temp_path, **kwargs)
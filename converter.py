@@ -0,0 +1,191 @@
+import argparse
+import os
+import sys
+
+
+# ==================== CLI БЕЗ GUI ====================
+# Запуск не трогает Qt, pandas, moviepy и pypandoc:
+# тяжелые библиотеки импортируются внутри конвертеров, когда они действительно нужны
+
+def cmd_convert(args):
+    from cache import cached_convert
+    from cancel import convert_atomic
+    from metrics import ConversionMetrics, apply_metrics_arguments, record_result
+    from options import options_from_args
+    from planner import convert_via_plan, describe_plan, plan, resolve_conversion_function
+    from progress import ProgressReporter, describe_progress
+    from registry import format_of
+
+    input_path = args.input
+    if not os.path.isfile(input_path):
+        print(f"Файл не найден: {input_path}")
+        return 1
+
+    output_path = args.output
+    if not output_path:
+        stem = os.path.splitext(input_path)[0]
+        output_path = f"{stem}_converted.{args.to.lower()}"
+
+    conversion_func = resolve_conversion_function(input_path, output_path)
+    if not conversion_func:
+        print(f"Конвертация .{format_of(input_path)} в .{format_of(output_path)} не поддерживается")
+        return 1
+    if conversion_func is convert_via_plan:
+        print(f"Цепочка: {describe_plan(plan(format_of(input_path), format_of(output_path)))}")
+
+    def on_progress(info):
+        percent = f"{info['percent']:5.1f}%" if info['percent'] is not None else '  ... '
+        print(f"\r[{percent}] {describe_progress(info)}", end='', flush=True)
+
+    options = options_from_args(args)
+    apply_metrics_arguments(args)
+    if args.daemon:
+        return convert_with_daemon(input_path, output_path, options, args, on_progress)
+
+    reporter = ProgressReporter(callback=on_progress if args.progress else None, min_interval=0.2)
+    metrics = ConversionMetrics(input_path, output_path, reporter)
+    hit = False
+    method = None
+    try:
+        with metrics:
+            if args.no_cache:
+                method = convert_atomic(conversion_func, input_path, output_path, progress=reporter,
+                                        options=options)
+            else:
+                hit, method = cached_convert(conversion_func, input_path, output_path, options,
+                                             progress=reporter)
+    finally:
+        cache_state = None if args.no_cache else ('hit' if hit else 'miss')
+        record_result({'metrics': metrics.to_dict(method=method, cache=cache_state)})
+    if args.progress:
+        print()
+
+    details = ' [кэш]' if hit else (f" [{method}]" if method else '')
+    print(f"Готово: {output_path}{details}")
+    return 0
+
+
+def convert_with_daemon(input_path, output_path, options, args, on_progress):
+    # Конвертация в запущенном демоне (python daemon.py serve)
+    import daemon
+    from metrics import record_result
+
+    client = daemon.connect()
+    if client is None:
+        print("Демон не запущен: python daemon.py serve")
+        return 1
+    try:
+        result = client.convert(input_path, output_path, options, use_cache=not args.no_cache,
+                                priority=args.priority, on_progress=on_progress if args.progress else None)
+    finally:
+        client.close()
+    if args.progress:
+        print()
+    record_result(result)
+    if result['status'] != 'ok':
+        print(f"Ошибка: {result['error'].splitlines()[0] if result['error'] else ''}")
+        return 1
+
+    details = ' [кэш]' if result.get('cache') == 'hit' else (f" [{result['method']}]" if result.get('method') else '')
+    print(f"Готово: {output_path}{details} ({result['seconds']:.2f} с в демоне)")
+    return 0
+
+
+def cmd_batch(args):
+    import batch
+    return batch.main(args.batch_args)
+
+
+def cmd_sync(args):
+    import sync
+    return sync.main(args.sync_args)
+
+
+def cmd_daemon(args):
+    import daemon
+    return daemon.main(args.daemon_args)
+
+
+def cmd_formats(args):
+    from planner import reachable_formats
+    from registry import MATRIX, get_output_formats
+
+    if args.format:
+        direct = get_output_formats(args.format)
+        chained = [fmt for fmt in reachable_formats(args.format) if fmt not in direct]
+        print(f"{args.format.upper()} → {', '.join(direct) or '—'}")
+        if chained:
+            print(f"Цепочкой: {', '.join(chained)}")
+        return 0
+
+    for input_format, outputs in MATRIX.items():
+        print(f"{input_format:>8} → {', '.join(outputs)}")
+    return 0
+
+
+def cmd_plan(args):
+    from planner import describe_plan, plan
+
+    steps = plan(args.source, args.target)
+    if not steps:
+        print(f"Не найдено цепочки {args.source.upper()} → {args.target.upper()}")
+        return 1
+    print(describe_plan(steps))
+    for source, target, entry in steps:
+        print(f"  {source} → {target}: {entry.name}")
+    return 0
+
+
+def build_parser():
+    from metrics import add_metrics_arguments
+    from options import add_option_arguments
+
+    parser = argparse.ArgumentParser(prog='converter', description="Конвертер файлов без GUI")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert = subparsers.add_parser('convert', help="Конвертировать один файл")
+    convert.add_argument('input', help="Входной файл")
+    convert.add_argument('-t', '--to', required=True, help="Целевой формат, например PNG")
+    convert.add_argument('-o', '--output', help="Выходной файл")
+    convert.add_argument('--no-cache', action='store_true', help="Не использовать кэш конвертаций")
+    convert.add_argument('--progress', action='store_true', help="Показывать прогресс")
+    convert.add_argument('--daemon', action='store_true', help="Отправить задание запущенному демону")
+    convert.add_argument('--priority', type=int, default=0, help="Приоритет задания в демоне (больше — раньше)")
+    add_option_arguments(convert)
+    add_metrics_arguments(convert)
+    convert.set_defaults(func=cmd_convert)
+
+    batch = subparsers.add_parser('batch', help="Пакетная конвертация (аргументы как у batch.py)",
+                                  add_help=False)
+    batch.add_argument('batch_args', nargs=argparse.REMAINDER)
+    batch.set_defaults(func=cmd_batch)
+
+    sync = subparsers.add_parser('sync', help="Инкрементальная синхронизация папки (аргументы как у sync.py)",
+                                 add_help=False)
+    sync.add_argument('sync_args', nargs=argparse.REMAINDER)
+    sync.set_defaults(func=cmd_sync)
+
+    daemon = subparsers.add_parser('daemon', help="Демон конвертации (аргументы как у daemon.py)",
+                                   add_help=False)
+    daemon.add_argument('daemon_args', nargs=argparse.REMAINDER)
+    daemon.set_defaults(func=cmd_daemon)
+
+    formats = subparsers.add_parser('formats', help="Поддерживаемые конвертации")
+    formats.add_argument('format', nargs='?', help="Входной формат")
+    formats.set_defaults(func=cmd_formats)
+
+    plan = subparsers.add_parser('plan', help="Показать цепочку конвертации")
+    plan.add_argument('source', help="Входной формат")
+    plan.add_argument('target', help="Выходной формат")
+    plan.set_defaults(func=cmd_plan)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
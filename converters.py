@@ -0,0 +1,921 @@
+import importlib.util
+import io
+import os
+import tempfile
+from contextlib import nullcontext
+from pathlib import Path
+
+import ffmpeg_tools
+from options import ffmpeg_audio_args, moviepy_audio_kwargs, moviepy_video_kwargs, pillow_save_kwargs
+from cancel import run_process
+from progress import ensure_progress, make_moviepy_logger
+
+
+# ==================== ФУНКЦИИ КОНВЕРТАЦИИ ====================
+
+def fast_temp_dir():
+    # Папка для промежуточных файлов: KONVERTOR_TMPDIR, иначе tmpfs (/dev/shm), иначе системная
+    path = os.environ.get('KONVERTOR_TMPDIR')
+    if path:
+        return path
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+
+# Стандартные размеры иконок Windows, от большего к меньшему
+ICO_SIZES = [(64, 64), (48, 48), (32, 32), (16, 16)]
+
+
+def fit_size(size, max_size):
+    # Размер, вписанный в max_size с сохранением пропорций (не увеличиваем)
+    width, height = size
+    max_width, max_height = max_size if isinstance(max_size, (tuple, list)) else (max_size, max_size)
+    scale = min(max_width / width, max_height / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def open_image_for_size(input_path, target_size=None):
+    # Открывает изображение; если нужен меньший размер, JPEG декодируется сразу
+    # в уменьшенном масштабе (draft: 1/2, 1/4, 1/8 средствами libjpeg)
+    from PIL import Image
+
+    img = Image.open(input_path)
+    if target_size and img.format == 'JPEG':
+        mode = img.mode if img.mode in ('RGB', 'L') else 'RGB'
+        img.draft(mode, target_size)
+    return img
+
+
+def downscale_image(img, size):
+    # Уменьшение: сначала быстрый reduce() целым множителем, затем LANCZOS до точного размера
+    from PIL import Image
+
+    if img.size == tuple(size):
+        return img
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def pillow_format(output_ext):
+    # Имя формата Pillow по расширению: нужно, когда результат пишется в файловый объект без имени
+    from PIL import Image
+
+    return Image.registered_extensions().get(f'.{output_ext}')
+
+
+def convert_image_pillow(input_path, output_path, progress=None, options=None, output_format=None):
+    # Конвертация изображений с помощью Pillow.
+    # options: max_size — вписать в размер, profile/quality — настройки кодировщика.
+    # input_path/output_path могут быть файловыми объектами, тогда output_format обязателен
+    from PIL import Image
+
+    progress = ensure_progress(progress)
+    progress.set_total(1, 'items')
+    options = options or {}
+
+    output_ext = (output_format or output_path.split('.')[-1]).lower()
+    max_size = options.get('max_size')
+    if output_ext == 'ico':
+        target_size = ICO_SIZES[0]
+    elif max_size:
+        target_size = max_size if isinstance(max_size, (tuple, list)) else (max_size, max_size)
+    else:
+        target_size = None
+
+    # Pillow декодирует лениво: для отдельного замера этапа статичное изображение загружаем сразу
+    with progress.stage('decode'):
+        img = open_image_for_size(input_path, target_size)
+        animated = getattr(img, 'is_animated', False)
+        if not animated:
+            img.load()
+
+    # Уменьшение до max_size (анимацию не трогаем)
+    if max_size and not animated and output_ext != 'ico':
+        with progress.stage('transform'):
+            img = downscale_image(img, fit_size(img.size, max_size))
+
+    # Обработка прозрачности для JPEG/BMP
+    if output_ext in ['jpg', 'jpeg', 'bmp'] and img.mode in ('RGBA', 'LA', 'P'):
+        with progress.stage('transform'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+            img = background
+
+    # ОСОБАЯ ОБРАБОТКА ДЛЯ ICO
+    elif output_ext == 'ico':
+        # ICO требует специальной обработки
+        # Конвертируем в нужный формат (RGBA для поддержки прозрачности)
+        with progress.stage('transform'):
+            if img.mode != 'RGBA':
+                img = img.convert('RGBA')
+
+            # ICO файлы обычно содержат несколько размеров.
+            # Строим пирамиду: каждый следующий размер уменьшаем из предыдущего,
+            # а не из исходного изображения в полном разрешении
+            icon_images = []
+            source = img
+            for size in ICO_SIZES:
+                source = downscale_image(source, size)
+                icon_images.append(source)
+
+        # Сохраняем как ICO: самый большой размер + готовые меньшие
+        with progress.stage('encode'):
+            icon_images[0].save(output_path, format='ICO', sizes=ICO_SIZES, append_images=icon_images[1:])
+        progress.finish()
+        return
+
+    # Анимация (GIF/WEBP/APNG) в анимированный формат — кадры читаются лениво,
+    # поэтому декодирование попадает в этап кодирования
+    elif output_ext in ANIMATED_FORMATS and animated and options.get('animated', True):
+        with progress.stage('encode'):
+            convert_animated_image(img, output_path, output_ext, progress)
+        return
+
+    # Для всех остальных форматов
+    with progress.stage('encode'):
+        img.save(output_path, format=pillow_format(output_ext), **pillow_save_kwargs(output_ext, options))
+    progress.finish()
+
+
+# Форматы, в которые сохраняем анимацию целиком (PNG — как APNG)
+ANIMATED_FORMATS = ['gif', 'webp', 'png']
+
+
+# Блок NETSCAPE2.0: число повторов анимации GIF (0 — бесконечно)
+GIF_LOOP_BLOCK = b'!\xff\x0bNETSCAPE2.0\x03\x01%s\x00'
+
+
+def encode_gif_frame(frame, duration, disposal):
+    # Кадр кодируется отдельным однокадровым GIF; info очищаем, чтобы Pillow
+    # не дописал в кадр повторы и комментарии исходника. Индекс прозрачности
+    # P-кадра сохраняем, иначе прозрачные пиксели станут непрозрачными
+    save_kwargs = {'format': 'GIF', 'duration': duration, 'disposal': disposal}
+    if 'transparency' in frame.info:
+        save_kwargs['transparency'] = frame.info['transparency']
+    frame.info = {}
+    buffer = io.BytesIO()
+    frame.save(buffer, **save_kwargs)
+    return buffer.getvalue()
+
+
+def split_gif_frame(data):
+    # Однокадровый GIF → (заголовок с логическим экраном, глобальная палитра, блоки кадра без ';')
+    packed = data[10]
+    position = 13
+    palette = b''
+    if packed & 0x80:
+        palette_size = 3 * 2 ** ((packed & 0x07) + 1)
+        palette = data[position:position + palette_size]
+        position += palette_size
+    return data[:13], palette, data[position:data.rindex(b';')]
+
+
+def localize_gif_palette(blocks, palette, packed):
+    # Глобальная палитра однокадрового GIF становится локальной палитрой кадра в общем файле
+    position = 0
+    while blocks[position:position + 1] == b'!':
+        # Расширение: метка и подблоки до нулевого
+        position += 2
+        while blocks[position]:
+            position += blocks[position] + 1
+        position += 1
+    descriptor_end = position + 10
+    flags = blocks[descriptor_end - 1]
+    if flags & 0x80 or not palette:
+        return blocks
+    flags |= 0x80 | (packed & 0x07)
+    return blocks[:descriptor_end - 1] + bytes([flags]) + palette + blocks[descriptor_end:]
+
+
+def write_gif_animation(img, output_path, loop, progress):
+    # Pillow собирает все кадры GIF в памяти до записи (ради разностных кадров),
+    # поэтому GIF пишем сами: кадр за кадром, в памяти один кадр и его сжатые данные.
+    # Кадры полные, у каждого своя палитра; прозрачные кадры стирают предыдущий (disposal 2)
+    from PIL import ImageSequence
+
+    # В память (inmemory.convert_buffer) пишем прямо в переданный файловый объект
+    target = nullcontext(output_path) if hasattr(output_path, 'write') else open(output_path, 'wb')
+    with target as out:
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            progress.advance()
+            duration = frame.info.get('duration', img.info.get('duration', 100))
+            frame = frame.copy()
+            disposal = 2 if frame.mode in ('RGBA', 'LA', 'PA') or 'transparency' in frame.info else 1
+            header, palette, blocks = split_gif_frame(encode_gif_frame(frame, duration, disposal))
+            if index == 0:
+                out.write(header + palette)
+                if loop is not None:
+                    out.write(GIF_LOOP_BLOCK % loop.to_bytes(2, 'little'))
+                out.write(blocks)
+            else:
+                out.write(localize_gif_palette(blocks, palette, header[10]))
+        out.write(b';')
+
+
+def convert_animated_image(img, output_path, output_ext, progress):
+    # Сохранение анимации без накопления всех кадров в списке.
+    # Память ограничена одним кадром для GIF (пишем сами) и WEBP (кодировщик потоковый);
+    # APNG-кодировщик Pillow держит все кадры до записи
+    progress.set_total(img.n_frames, 'frames')
+
+    loop = img.info.get('loop')
+    if output_ext == 'gif':
+        # Без loop исходник проигрывается один раз — блок повторов не пишем
+        write_gif_animation(img, output_path, loop, progress)
+        progress.finish()
+        return
+
+    save_kwargs = {'save_all': True, 'format': pillow_format(output_ext)}
+    source_format = (img.format or '').lower()
+    if loop is not None:
+        save_kwargs['loop'] = loop
+    elif source_format == 'gif':
+        # GIF без расширения NETSCAPE проигрывается один раз
+        save_kwargs['loop'] = 1
+
+    # WEBP и APNG перебирают кадры исходника сами через seek — без копий.
+    # WebP-кодировщику длительности нужны заранее списком: проходим по кадрам,
+    # не сохраняя их (WebP заполняет duration только после load)
+    if output_ext == 'webp':
+        durations = []
+        for index in range(img.n_frames):
+            progress.check()
+            img.seek(index)
+            img.load()
+            durations.append(img.info.get('duration', 100))
+        img.seek(0)
+        save_kwargs['duration'] = durations
+    img.save(output_path, **save_kwargs)
+    progress.finish()
+
+
+def convert_audio_ffmpeg(input_path, output_path, progress=None, options=None):
+    # Аудио → аудио одним процессом ffmpeg: декодирование и кодирование идут потоком,
+    # в памяти только текущие кадры, а не весь PCM. Формат входа ffmpeg определяет
+    # по заголовку; один probe дает и проверку дорожки, и длительность для прогресса.
+    # options: audio_codec, audio_bitrate, sample_rate, channels (см. options.py)
+    progress = ensure_progress(progress)
+    output_ext = output_path.split('.')[-1].lower()
+    with progress.stage('probe'):
+        info = ffmpeg_tools.probe(input_path)
+    if not any(stream['type'] == 'audio' for stream in info['streams']):
+        raise ValueError(f"Нет звуковой дорожки: {input_path}")
+    args = ['-i', input_path, '-map', '0:a:0'] + ffmpeg_audio_args(output_ext, options) + [output_path]
+    ffmpeg_tools.run_ffmpeg(args, info['duration'], progress)
+
+
+def convert_video_moviepy(input_path, output_path, progress=None, options=None):
+    # Конвертация видео с помощью moviepy
+    from moviepy import VideoFileClip
+
+    progress = ensure_progress(progress)
+    # Номера кадров приходят из логгера moviepy
+    logger = make_moviepy_logger(progress, 'frame_index')
+
+    clip = VideoFileClip(input_path)
+    output_ext = output_path.split('.')[-1].lower()
+
+    # close() в finally: при отмене читающий ffmpeg не должен остаться висеть
+    try:
+        # Уменьшение кадра (например, для легкого GIF)
+        max_size = (options or {}).get('max_size')
+        if max_size:
+            clip = clip.resized(new_size=fit_size(clip.size, max_size))
+
+        with progress.stage('transcode'):
+            if output_ext == 'gif':
+                clip.write_gif(output_path, logger=logger)
+            else:
+                # Потоки, пресет, CRF/битрейт — из профиля настроек, по умолчанию все ядра
+                clip.write_videofile(output_path, logger=logger, **moviepy_video_kwargs(output_ext, options))
+    finally:
+        clip.close()
+    progress.finish()
+
+
+def extract_audio_from_video_moviepy(video_path, audio_path, progress=None, options=None):
+    # Извлечение аудио из видео
+    from moviepy import VideoFileClip
+
+    progress = ensure_progress(progress)
+    logger = make_moviepy_logger(progress, 'chunk')
+
+    clip = VideoFileClip(video_path)
+    output_ext = audio_path.split('.')[-1].lower()
+    try:
+        with progress.stage('transcode'):
+            clip.audio.write_audiofile(audio_path, logger=logger, **moviepy_audio_kwargs(output_ext, options))
+    finally:
+        clip.close()
+    progress.finish()
+
+
+def convert_video_ffmpeg(input_path, output_path, progress=None, options=None):
+    # Видео → видео: если контейнер принимает исходные кодеки, переупаковываем (-c copy),
+    # иначе перекодируем через moviepy. Возвращает выбранный путь: 'copy' или 'transcode'
+    # options['copy'] = False принудительно включает перекодирование
+    # Изменение размера кадра тоже требует перекодирования
+    progress = ensure_progress(progress)
+    output_ext = output_path.split('.')[-1].lower()
+    allow_copy = (options or {}).get('copy', True) and not (options or {}).get('max_size')
+    if allow_copy and output_ext != 'gif' and ffmpeg_tools.find_ffmpeg():
+        with progress.stage('probe'):
+            info = ffmpeg_tools.probe(input_path)
+        if ffmpeg_tools.can_stream_copy(info['streams'], output_ext):
+            ffmpeg_tools.remux(input_path, output_path, info=info, progress=progress)
+            return 'copy'
+
+    convert_video_moviepy(input_path, output_path, progress=progress, options=options)
+    return 'transcode'
+
+
+def extract_audio_ffmpeg(video_path, audio_path, progress=None, options=None):
+    # Видео → аудио: если кодек дорожки подходит формату, просто извлекаем ее без перекодирования
+    progress = ensure_progress(progress)
+    output_ext = audio_path.split('.')[-1].lower()
+    allow_copy = (options or {}).get('copy', True)
+    if allow_copy and ffmpeg_tools.find_ffmpeg():
+        with progress.stage('probe'):
+            info = ffmpeg_tools.probe(video_path)
+        if ffmpeg_tools.can_stream_copy(info['streams'], output_ext, kinds=('audio',)):
+            ffmpeg_tools.remux(video_path, audio_path, audio_only=True, info=info, progress=progress)
+            return 'copy'
+
+    extract_audio_from_video_moviepy(video_path, audio_path, progress=progress, options=options)
+    return 'transcode'
+
+
+def convert_office_libreoffice(input_path, output_path, progress=None, options=None):
+    # Конвертация офисных файлов (PPTX, PPT, ODP, DOC) через LibreOffice в headless-режиме
+    import shutil
+
+    progress = ensure_progress(progress)
+    progress.set_total(1, 'items')
+
+    soffice = shutil.which('soffice') or shutil.which('libreoffice')
+    if not soffice:
+        raise RuntimeError("LibreOffice (soffice) не найден")
+
+    output_ext = output_path.split('.')[-1].lower()
+    with tempfile.TemporaryDirectory(dir=fast_temp_dir()) as out_dir:
+        # У каждого запуска свой профиль: с общим профилем параллельный soffice
+        # подключается к уже запущенному экземпляру или падает на его блокировке
+        profile_uri = Path(out_dir, 'profile').as_uri()
+        # LibreOffice не сообщает о ходе работы, но отмену проверяем, пока ждем его
+        with progress.stage('soffice'):
+            run_process([soffice, f'-env:UserInstallation={profile_uri}', '--headless', '--convert-to', output_ext,
+                         '--outdir', out_dir, input_path],
+                        progress=progress)
+        result = os.path.join(out_dir, f"{Path(input_path).stem}.{output_ext}")
+        if not os.path.exists(result):
+            raise RuntimeError(f"LibreOffice не создал файл {output_ext.upper()}")
+        shutil.move(result, output_path)
+    progress.finish()
+
+
+# Формат pandoc по расширению выходного файла
+PANDOC_FORMATS = {
+    'docx': 'docx', 'pdf': 'pdf', 'html': 'html', 'txt': 'plain',
+    'md': 'markdown', 'epub': 'epub', 'rtf': 'rtf', 'odt': 'odt'
+}
+
+
+def pandoc_command(input_path, output_path):
+    # pandoc запускаем сами (pypandoc только находит его), чтобы при отмене завершить процесс
+    import pypandoc
+
+    output_ext = output_path.split('.')[-1].lower()
+    output_format = PANDOC_FORMATS.get(output_ext, output_ext)
+    command = [pypandoc.get_pandoc_path(), input_path, '-o', output_path]
+    if output_format != 'pdf':
+        # Для PDF pandoc сам выбирает движок по расширению выходного файла
+        command += ['-t', output_format]
+    return command
+
+
+def run_pandoc(input_path, output_path, progress=None):
+    with ensure_progress(progress).stage('pandoc'):
+        run_process(pandoc_command(input_path, output_path), progress=progress)
+
+
+def convert_document_pypandoc(input_path, output_path, progress=None, options=None):
+    # Конвертация документов с помощью pandoc
+    progress = ensure_progress(progress)
+    progress.set_total(1, 'items')
+    run_pandoc(input_path, output_path, progress)
+    progress.finish()
+
+
+def convert_archive(input_path, output_path, progress=None, options=None):
+    # Переупаковка архива член за членом, без распаковки на диск (см. archives.py).
+    # options: compression_level (0–9), threads — потоки сжатия tar.gz/bz2/xz
+    import archives
+
+    progress = ensure_progress(progress)
+    options = options or {}
+    level = options.get('compression_level')
+    if level is None:
+        level = archives.DEFAULT_COMPRESSION_LEVEL
+    threads = options.get('threads') or os.cpu_count() or 1
+    with progress.stage('repack'):
+        archives.repack_archive(input_path, output_path, level, threads, progress)
+
+
+# Файлы больше порога конвертируются потоково, кусками по TABLE_CHUNK_ROWS строк
+TABLE_STREAMING_THRESHOLD = 256 * 1024 * 1024
+TABLE_CHUNK_ROWS = 100_000
+
+
+def convert_table_pandas(input_path, output_path, streaming=None, progress=None, options=None):
+    # Конвертация таблиц с помощью pandas
+    progress = ensure_progress(progress)
+
+    input_ext = input_path.split('.')[-1].lower()
+    output_ext = output_path.split('.')[-1].lower()
+
+    # Большие файлы автоматически переключаем в потоковый режим
+    if streaming is None:
+        streaming = (os.path.getsize(input_path) >= TABLE_STREAMING_THRESHOLD
+                     and can_stream_table(input_path) and can_stream_table_output(output_path))
+    # Между колоночными форматами и CSV конвертируем напрямую через pyarrow
+    # Чтение и запись идут вперемешку, поэтому это один этап
+    if has_pyarrow() and input_ext in ARROW_FORMATS and output_ext in ARROW_FORMATS:
+        with progress.stage('stream'):
+            convert_table_arrow(input_path, output_path, progress=progress)
+        return
+
+    if streaming:
+        with progress.stage('stream'):
+            convert_table_streaming(input_path, output_path, progress=progress)
+        return
+
+    # Без потокового режима считаем этапы: чтение и запись
+    progress.set_total(2, 'items')
+    with progress.stage('decode'):
+        df = read_table(input_path, input_ext)
+    progress.advance()
+    with progress.stage('encode'):
+        write_table(df, output_path, output_ext)
+    progress.finish()
+
+
+def read_table(source, input_ext):
+    # source — путь или файловый объект с позиции 0
+    import pandas as pd
+
+    # С pyarrow читаем многопоточно и без лишних копий в Arrow-типы
+    arrow_options = {'dtype_backend': 'pyarrow'} if has_pyarrow() else {}
+
+    if input_ext == 'csv':
+        if has_pyarrow():
+            # Тот же CSV-читатель pyarrow и те же типы, что у потокового чтения (iter_table_chunks)
+            import pyarrow.csv as pa_csv
+            table = pa_csv.read_csv(source, read_options=pa_csv.ReadOptions(use_threads=True))
+            return arrow_batch_to_pandas(table)
+        return pd.read_csv(source)
+    if input_ext in ['xlsx', 'xls']:
+        return pd.read_excel(source)
+    if input_ext == 'ods':
+        return pd.read_excel(source, engine='odf')
+    if input_ext == 'parquet':
+        return pd.read_parquet(source, **arrow_options)
+    if input_ext in ['feather', 'arrow']:
+        return pd.read_feather(source, **arrow_options)
+    if input_ext == 'json':
+        return pd.read_json(source, lines=is_json_lines(source))
+    if input_ext == 'xml':
+        return pd.read_xml(source)
+    raise ValueError(f"Неподдерживаемый формат: {input_ext}")
+
+
+# Форматы, которые pandas пишет текстом: в двоичный файловый объект пишем через TextIOWrapper
+# (XML pandas пишет байтами сам)
+TEXT_TABLE_FORMATS = ['csv', 'json', 'html']
+
+
+def write_table(df, target, output_ext):
+    # target — путь или двоичный файловый объект
+    if output_ext in TEXT_TABLE_FORMATS and not isinstance(target, (str, os.PathLike, io.TextIOBase)):
+        text = io.TextIOWrapper(target, encoding='utf-8', newline='')
+        try:
+            write_table(df, text, output_ext)
+            text.flush()
+        finally:
+            text.detach()
+        return
+
+    if output_ext == 'csv':
+        df.to_csv(target, index=False)
+    elif output_ext in ['xlsx', 'xls']:
+        df.to_excel(target, index=False)
+    elif output_ext == 'ods':
+        df.to_excel(target, index=False, engine='odf')
+    elif output_ext == 'parquet':
+        df.to_parquet(target, index=False)
+    elif output_ext in ['feather', 'arrow']:
+        df.reset_index(drop=True).to_feather(target)
+    elif output_ext == 'json':
+        # Массив записей — как у потоковой записи (TableChunkWriter), форма не зависит от размера входа
+        df.to_json(target, orient='records', date_format='iso', indent=2, force_ascii=False)
+    elif output_ext == 'html':
+        df.to_html(target, index=False)
+    elif output_ext == 'xml':
+        df.to_xml(target, index=False)
+    else:
+        raise ValueError(f"Неподдерживаемый выходной формат: {output_ext}")
+
+
+# ==================== КОЛОНОЧНЫЕ ФОРМАТЫ (PYARROW) ====================
+
+# Форматы, которые pyarrow читает и пишет сам, без pandas
+ARROW_FORMATS = ['csv', 'parquet', 'feather', 'arrow']
+
+
+def has_pyarrow():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def open_arrow_reader(input_path, source=None):
+    # Потоковый читатель RecordBatch'ей: CSV читается многопоточно блоками.
+    # source — уже открытый файл (по его позиции считается прогресс), иначе путь
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    source = source if source is not None else input_path
+    input_ext = input_path.split('.')[-1].lower()
+    if input_ext == 'csv':
+        reader = pa_csv.open_csv(source, read_options=pa_csv.ReadOptions(use_threads=True))
+        return reader.schema, iter(reader)
+    if input_ext == 'parquet':
+        parquet_file = pq.ParquetFile(source)
+        return parquet_file.schema_arrow, parquet_file.iter_batches(batch_size=TABLE_CHUNK_ROWS)
+    if input_ext in ['feather', 'arrow']:
+        ipc_reader = ipc.open_file(source)
+        batches = (ipc_reader.get_batch(i) for i in range(ipc_reader.num_record_batches))
+        return ipc_reader.schema, batches
+    raise ValueError(f"Неподдерживаемый формат: {input_ext}")
+
+
+def open_arrow_writer(output_path, schema):
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    output_ext = output_path.split('.')[-1].lower()
+    if output_ext == 'csv':
+        return pa_csv.CSVWriter(output_path, schema)
+    if output_ext == 'parquet':
+        return pq.ParquetWriter(output_path, schema)
+    if output_ext in ['feather', 'arrow']:
+        return ipc.new_file(output_path, schema)
+    raise ValueError(f"Неподдерживаемый выходной формат: {output_ext}")
+
+
+def convert_table_arrow(input_path, output_path, progress=None):
+    # CSV/Parquet/Feather/Arrow → CSV/Parquet/Feather/Arrow без pandas:
+    # данные идут блоками от читателя к писателю, память не зависит от размера файла
+    progress = ensure_progress(progress)
+    progress.set_total(os.path.getsize(input_path), 'bytes')
+
+    with open(input_path, 'rb') as source:
+        schema, batches = open_arrow_reader(input_path, source)
+        writer = open_arrow_writer(output_path, schema)
+        try:
+            for batch in batches:
+                writer.write_batch(batch)
+                progress.update(source.tell())
+        finally:
+            writer.close()
+    progress.finish()
+
+
+# ==================== ПОТОКОВАЯ КОНВЕРТАЦИЯ ТАБЛИЦ ====================
+
+def is_json_lines(path):
+    # JSON Lines: каждая строка — отдельный JSON-объект.
+    # path может быть двоичным файловым объектом: читаем две строки и возвращаем позицию
+    import json
+
+    if hasattr(path, 'read'):
+        position = path.tell()
+        first_line = path.readline().decode('utf-8', errors='replace').strip()
+        has_more = bool(path.readline().strip())
+        path.seek(position)
+    elif path.lower().endswith(('.jsonl', '.ndjson')):
+        return True
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            first_line = f.readline().strip()
+            has_more = bool(f.readline().strip())
+    if not first_line.startswith('{') or not has_more:
+        return False
+    try:
+        return isinstance(json.loads(first_line), dict)
+    except ValueError:
+        return False
+
+
+def can_stream_table(input_path):
+    # Кусками умеем читать CSV, JSON Lines и XML
+    input_ext = input_path.split('.')[-1].lower()
+    if input_ext == 'csv' or input_ext == 'xml':
+        return True
+    if input_ext in ['parquet', 'feather', 'arrow']:
+        return has_pyarrow()
+    if input_ext == 'json':
+        return is_json_lines(input_path)
+    return False
+
+
+def can_stream_table_output(output_path):
+    # Кусками пишет только TableChunkWriter; ODS дописывать нельзя, колоночным форматам нужен pyarrow
+    output_ext = output_path.split('.')[-1].lower()
+    if output_ext in ['parquet', 'feather', 'arrow']:
+        return has_pyarrow()
+    return output_ext in ['csv', 'json', 'html', 'xml', 'xlsx', 'xls']
+
+
+def arrow_batch_to_pandas(batch):
+    # RecordBatch или Table pyarrow → DataFrame с Arrow-типами, как у read_table с dtype_backend='pyarrow':
+    # результат не зависит от того, читали файл целиком или кусками
+    import pandas as pd
+
+    return batch.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def iter_xml_chunks(input_path, chunk_rows, source=None):
+    # Потоковое чтение XML через iterparse: строки — дочерние элементы корня,
+    # поля — атрибуты и вложенные элементы строки (тот же формат, что пишет to_xml)
+    import xml.etree.ElementTree as ET
+    import pandas as pd
+
+    rows = []
+    depth = 0
+    root = None
+    source = source if source is not None else input_path
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1:
+            record = dict(elem.attrib)
+            for child in elem:
+                record[child.tag] = child.text
+            rows.append(record)
+            # Освобождаем уже обработанные элементы
+            root.clear()
+            if len(rows) >= chunk_rows:
+                yield pd.DataFrame(rows)
+                rows = []
+
+    if rows:
+        yield pd.DataFrame(rows)
+
+
+def iter_table_chunks(input_path, chunk_rows=TABLE_CHUNK_ROWS, progress=None):
+    # Возвращает итератор по кускам таблицы ограниченного размера.
+    # Прогресс — прочитанные байты входного файла
+    import pandas as pd
+
+    progress = ensure_progress(progress)
+    progress.set_total(os.path.getsize(input_path), 'bytes')
+
+    input_ext = input_path.split('.')[-1].lower()
+    with open(input_path, 'rb') as source:
+        if input_ext == 'csv' and has_pyarrow():
+            # Тот же движок и те же типы, что у read_table: CSV-читатель pyarrow
+            _, batches = open_arrow_reader(input_path, source)
+            chunks = (arrow_batch_to_pandas(batch) for batch in batches)
+        elif input_ext == 'csv':
+            chunks = pd.read_csv(source, chunksize=chunk_rows)
+        elif input_ext == 'json' and is_json_lines(input_path):
+            chunks = pd.read_json(source, lines=True, chunksize=chunk_rows)
+        elif input_ext == 'xml':
+            chunks = iter_xml_chunks(input_path, chunk_rows, source)
+        elif input_ext in ['parquet', 'feather', 'arrow']:
+            _, batches = open_arrow_reader(input_path, source)
+            chunks = (arrow_batch_to_pandas(batch) for batch in batches)
+        else:
+            raise ValueError(f"Потоковое чтение формата {input_ext} не поддерживается")
+
+        for chunk in chunks:
+            yield chunk
+            progress.update(source.tell())
+
+
+class TableChunkWriter:
+    # Дописывает куски таблицы в выходной файл по мере чтения
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.output_ext = output_path.split('.')[-1].lower()
+        self.rows = 0
+        self.file = None
+        self.excel_writer = None
+        self.arrow_writer = None
+        self.arrow_schema = None
+
+        if self.output_ext in ['parquet', 'feather', 'arrow']:
+            # Писатель pyarrow создается по схеме первого куска
+            pass
+        elif self.output_ext in ['xlsx', 'xls']:
+            import pandas as pd
+            # XLSX хранит книгу в памяти целиком, но формат и так ограничен ~1 млн строк
+            self.excel_writer = pd.ExcelWriter(output_path)
+        elif self.output_ext in ['csv', 'json', 'html', 'xml']:
+            self.file = open(output_path, 'w', encoding='utf-8', newline='')
+        else:
+            raise ValueError(f"Неподдерживаемый выходной формат: {self.output_ext}")
+
+    def write(self, df):
+        first = self.rows == 0
+
+        if self.output_ext in ['parquet', 'feather', 'arrow']:
+            import pyarrow as pa
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.arrow_writer is None:
+                # Схема первого куска — схема файла; у писателя IPC атрибута schema нет
+                self.arrow_schema = table.schema
+                self.arrow_writer = open_arrow_writer(self.output_path, table.schema)
+            self.arrow_writer.write_table(table.cast(self.arrow_schema))
+        elif self.output_ext == 'csv':
+            df.to_csv(self.file, index=False, header=first)
+        elif self.output_ext in ['xlsx', 'xls']:
+            df.to_excel(self.excel_writer, index=False, header=first,
+                        startrow=self.rows + (0 if first else 1))
+        elif self.output_ext == 'json':
+            # Массив записей: куски пишем через запятую внутри одного массива,
+            # с теми же отступами, что у write_table
+            records = df.to_json(orient='records', date_format='iso', indent=2, force_ascii=False)[2:-2]
+            if records:
+                self.file.write(('[\n' if first else ',\n') + records)
+        elif self.output_ext == 'html':
+            html = df.to_html(index=False)
+            body_start = html.index('<tbody>') + len('<tbody>')
+            body_end = html.rindex('</tbody>')
+            self.file.write(html[:body_end] if first else html[body_start:body_end])
+        elif self.output_ext == 'xml':
+            xml = df.to_xml(index=False, xml_declaration=False)
+            rows_start = xml.index('>') + 1
+            rows_end = xml.rindex('</')
+            if first:
+                self.file.write("<?xml version='1.0' encoding='utf-8'?>\n" + xml[:rows_start])
+            self.file.write(xml[rows_start:rows_end])
+
+        self.rows += len(df)
+
+    def close(self):
+        if self.output_ext in ['parquet', 'feather', 'arrow']:
+            if self.arrow_writer is not None:
+                self.arrow_writer.close()
+            return
+        if self.excel_writer is not None:
+            self.excel_writer.close()
+            return
+
+        if self.output_ext == 'json':
+            self.file.write('\n]' if self.rows else '[\n\n]')
+        elif self.output_ext == 'html' and self.rows:
+            self.file.write('</tbody>\n</table>')
+        elif self.output_ext == 'xml':
+            self.file.write('</data>\n' if self.rows else "<?xml version='1.0' encoding='utf-8'?>\n<data/>\n")
+        self.file.close()
+
+
+def convert_table_streaming(input_path, output_path, chunk_rows=TABLE_CHUNK_ROWS, progress=None):
+    # Потоковая конвертация: в памяти одновременно не больше одного куска
+    progress = ensure_progress(progress)
+    writer = TableChunkWriter(output_path)
+    try:
+        for chunk in iter_table_chunks(input_path, chunk_rows, progress):
+            writer.write(chunk)
+    finally:
+        writer.close()
+    progress.finish()
+
+
+# Разрешение растеризации PDF по умолчанию
+PDF_DEFAULT_DPI = 150
+# Форматы, которые pdf2image (pdftoppm) пишет сам; остальные получаем из PNG через Pillow
+PDF2IMAGE_FORMATS = {'png': 'png', 'jpg': 'jpeg', 'jpeg': 'jpeg', 'tiff': 'tiff', 'tif': 'tiff', 'ppm': 'ppm'}
+
+
+def parse_page_range(pages, page_count):
+    # pages: None/'first' — первая страница, 'all' — все, 'N' или 'A-B' — номер или диапазон
+    if pages is None or pages == 'first':
+        return 1, 1
+    if pages == 'all':
+        return 1, page_count
+    if isinstance(pages, (tuple, list)):
+        first, last = pages
+    else:
+        first, _, last = str(pages).partition('-')
+        last = last or first
+    first, last = int(first), min(int(last), page_count)
+    if first < 1 or first > last:
+        raise ValueError(f"Неверный диапазон страниц: {pages}")
+    return first, last
+
+
+def page_output_path(output_path, page):
+    # Путь для страницы: report.png → report_3.png
+    path = Path(output_path)
+    return str(path.with_name(f"{path.stem}_{page}{path.suffix}"))
+
+
+def convert_pdf_to_image_pdf2image(pdf_path, output_path, progress=None, options=None):
+    # Конвертация PDF в изображение.
+    # options: dpi, pages (None — первая страница, 'all', 'A-B'), threads, multipage_tiff.
+    # Страницы рендерятся параллельно прямо на диск (paths_only) и сразу переносятся на место,
+    # в памяти одновременно не больше одной страницы
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    from PIL import Image
+
+    progress = ensure_progress(progress)
+    options = options or {}
+    dpi = options.get('dpi') or PDF_DEFAULT_DPI
+    threads = options.get('threads') or os.cpu_count() or 1
+
+    page_count = pdfinfo_from_path(pdf_path)['Pages']
+    first_page, last_page = parse_page_range(options.get('pages'), page_count)
+    total_pages = last_page - first_page + 1
+    progress.set_total(total_pages, 'pages')
+
+    output_ext = output_path.split('.')[-1].lower()
+    render_fmt = PDF2IMAGE_FORMATS.get(output_ext, 'png')
+    multipage_tiff = output_ext in ['tiff', 'tif'] and total_pages > 1 and options.get('multipage_tiff', True)
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    page_paths = []
+    # Временная папка рядом с результатом — перенос файлов без копирования
+    with tempfile.TemporaryDirectory(dir=output_dir) as render_dir:
+        # Рендерим блоками, чтобы прогресс обновлялся по мере готовности страниц
+        block = max(threads, 1) * 2
+        for block_first in range(first_page, last_page + 1, block):
+            block_last = min(block_first + block - 1, last_page)
+            with progress.stage('rasterize'):
+                rendered = convert_from_path(
+                    pdf_path, dpi=dpi, first_page=block_first, last_page=block_last,
+                    fmt=render_fmt, thread_count=min(threads, block_last - block_first + 1),
+                    output_folder=render_dir, paths_only=True,
+                )
+            # pdf2image возвращает пути в порядке страниц
+            for page, rendered_path in zip(range(block_first, block_last + 1), rendered):
+                if multipage_tiff:
+                    page_paths.append(rendered_path)
+                else:
+                    target = output_path if total_pages == 1 else page_output_path(output_path, page)
+                    if render_fmt == PDF2IMAGE_FORMATS.get(output_ext):
+                        os.replace(rendered_path, target)
+                    else:
+                        # WEBP, BMP, GIF и т.п. — пересохраняем страницу через Pillow
+                        with progress.stage('encode'), Image.open(rendered_path) as img:
+                            img.save(target)
+                        os.remove(rendered_path)
+                progress.advance()
+
+        if multipage_tiff:
+            # Многостраничный TIFF: страницы открываются с диска по одной
+            pages = (Image.open(path) for path in page_paths[1:])
+            with progress.stage('encode'), Image.open(page_paths[0]) as first_img:
+                first_img.save(output_path, save_all=True, append_images=pages)
+
+    progress.finish()
+
+
+def convert_docx_to_image(docx_path, output_path, progress=None, options=None):
+    # Конвертация DOCX в изображение через временный PDF
+    progress = ensure_progress(progress)
+
+    # Создаем временный PDF (в tmpfs, если есть)
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False, dir=fast_temp_dir()) as tmp:
+        temp_pdf = tmp.name
+
+    try:
+        # DOCX → PDF
+        run_pandoc(docx_path, temp_pdf, progress)
+        # PDF → изображение (с теми же настройками страниц и DPI)
+        convert_pdf_to_image_pdf2image(temp_pdf, output_path, progress=progress, options=options)
+    finally:
+        if os.path.exists(temp_pdf):
+            os.remove(temp_pdf)
+
+
+def convert_doc_to_image(input_path, output_path, progress=None, options=None):
+    # Выбирает функцию конвертации документа в изображение
+    input_ext = Path(input_path).suffix.lower()
+
+    if input_ext == '.pdf':
+        convert_pdf_to_image_pdf2image(input_path, output_path, progress=progress, options=options)
+    elif input_ext == '.docx':
+        convert_docx_to_image(input_path, output_path, progress=progress, options=options)
+    else:
+        raise ValueError(f"Конвертация {input_ext} в изображение не поддерживается")
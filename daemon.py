@@ -0,0 +1,392 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.connection import Client, Listener
+
+from cache import DEFAULT_CACHE_DIR
+from cancel import CancellationToken
+from metrics import add_metrics_arguments, apply_metrics_arguments, record_result, serve_prometheus
+
+
+# ==================== ДЕМОН КОНВЕРТАЦИИ ====================
+# Долгоживущий процесс с прогретыми воркерами: тяжелые библиотеки импортированы заранее,
+# поэтому маленькие файлы не платят за импорт pandas/moviepy на каждый запуск.
+# Задания принимаются по локальному сокету в очередь с приоритетами,
+# прогресс и результат отправляются обратно клиенту по тому же соединению.
+#
+# Протокол — словари через multiprocessing.connection (с ключом доступа):
+#   {'cmd': 'convert', 'input', 'output', 'options', 'use_cache', 'priority'} →
+#       {'event': 'queued', 'job', 'position'}, {'event': 'progress', 'job', 'info'}*,
+#       {'event': 'result', 'job', 'result'}
+#   {'cmd': 'cancel', 'job'} — отменить задание; результат придет со статусом 'cancelled'
+#   {'cmd': 'status'} → {'event': 'status', ...}
+#   {'cmd': 'ping'} → {'event': 'pong'}
+#   {'cmd': 'shutdown'} → {'event': 'bye'}
+
+DEFAULT_ADDRESS = '127.0.0.1:47800'
+# Приоритет по умолчанию; больше — раньше
+DEFAULT_PRIORITY = 0
+
+# Модули, которые воркер импортирует при старте
+WARM_MODULES = ['converters', 'registry', 'planner', 'cache', 'PIL.Image', 'numpy', 'pandas', 'pyarrow',
+                'pyarrow.csv', 'pyarrow.parquet', 'moviepy', 'pypandoc', 'pdf2image', 'openpyxl']
+
+
+def parse_address(address):
+    # "host:port" — TCP на localhost, иначе путь к Unix-сокету
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return (host, int(port))
+    return address
+
+
+def get_address():
+    return parse_address(os.environ.get('KONVERTOR_DAEMON_ADDRESS', DEFAULT_ADDRESS))
+
+
+def default_key_file():
+    # Рядом с папкой кэша, но не внутри: кэш вытесняет и очищает все файлы своей папки,
+    # и клиенты потеряли бы ключ запущенного демона
+    cache_dir = os.path.abspath(os.environ.get('KONVERTOR_CACHE_DIR', DEFAULT_CACHE_DIR))
+    return os.path.join(os.path.dirname(cache_dir), f"{os.path.basename(cache_dir)}-daemon.key")
+
+
+def load_authkey(create=False):
+    # Ключ доступа хранится в файле, доступном только владельцу:
+    # без него к демону не подключится другой пользователь машины
+    path = os.environ.get('KONVERTOR_DAEMON_KEY_FILE') or default_key_file()
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        if not create:
+            return None
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    key = secrets.token_bytes(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+def warm_up_worker():
+    # Инициализатор процесса-воркера: импортируем все, что понадобится конвертерам
+    import importlib
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    try:
+        # pypandoc ищет pandoc при первом вызове, делаем это сразу
+        import pypandoc
+        pypandoc.get_pandoc_path()
+    except (ImportError, OSError):
+        pass
+
+
+class Job:
+    def __init__(self, job_id, request, session, cancel_token):
+        self.id = job_id
+        self.input_path = request['input']
+        self.output_path = request['output']
+        self.options = request.get('options')
+        self.use_cache = request.get('use_cache', True)
+        self.priority = request.get('priority', DEFAULT_PRIORITY)
+        self.session = session
+        self.cancel_token = cancel_token
+
+
+class Session:
+    # Соединение с клиентом; отправка из нескольких потоков защищена блокировкой
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send(self, message):
+        if self.closed:
+            return False
+        try:
+            with self.lock:
+                self.connection.send(message)
+            return True
+        except (OSError, EOFError, ValueError):
+            self.closed = True
+            return False
+
+
+class ConversionDaemon:
+    def __init__(self, address=None, workers=None):
+        self.address = address or get_address()
+        self.workers = workers or os.cpu_count() or 1
+        self.jobs = queue.PriorityQueue()
+        self.counter = itertools.count(1)
+        self.pending = {}  # id задания → Job, от постановки в очередь до результата
+        self.active = {}  # id задания → Job, пока оно выполняется
+        self.done = 0
+        self.failed = 0
+        self.started = time.time()
+        self.stopping = threading.Event()
+        self.executor = None
+        self.manager = None
+        self.progress_queue = None
+        self.listener = None
+
+    # ---------- жизненный цикл ----------
+
+    def serve(self):
+        from batch import drain_progress
+
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up_worker)
+        # Сразу поднимаем все воркеры, чтобы первая конвертация не ждала импортов
+        for future in [self.executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+        self.manager = multiprocessing.Manager()
+        self.progress_queue = self.manager.Queue()
+        threading.Thread(target=drain_progress, args=(self.progress_queue, self.on_progress),
+                         daemon=True).start()
+        for _ in range(self.workers):
+            threading.Thread(target=self.dispatch, daemon=True).start()
+
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        self.listener = Listener(self.address, authkey=load_authkey(create=True))
+        print(f"Демон слушает {self.listener.address}, воркеров: {self.workers}")
+        try:
+            while not self.stopping.is_set():
+                try:
+                    connection = self.listener.accept()
+                except (OSError, EOFError, multiprocessing.AuthenticationError):
+                    continue
+                threading.Thread(target=self.handle, args=(Session(connection),), daemon=True).start()
+        finally:
+            self.close()
+
+    def stop(self):
+        self.stopping.set()
+        # accept() не прерывается закрытием сокета, поэтому будим его пустым подключением
+        try:
+            Client(self.address, authkey=load_authkey()).close()
+        except (OSError, EOFError, multiprocessing.AuthenticationError):
+            pass
+
+    def close(self):
+        self.listener.close()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.progress_queue.put(None)
+        self.manager.shutdown()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    # ---------- клиенты ----------
+
+    def handle(self, session):
+        while not self.stopping.is_set():
+            try:
+                request = session.connection.recv()
+            except (OSError, EOFError):
+                break
+            command = request.get('cmd')
+            if command == 'convert':
+                self.submit(request, session)
+            elif command == 'cancel':
+                self.cancel(request.get('job'))
+            elif command == 'status':
+                session.send(self.status())
+            elif command == 'ping':
+                session.send({'event': 'pong'})
+            elif command == 'shutdown':
+                session.send({'event': 'bye'})
+                self.stop()
+                break
+            else:
+                session.send({'event': 'error', 'error': f"Неизвестная команда: {command}"})
+        session.closed = True
+        session.connection.close()
+        # Клиент ушел — его задания никому не нужны
+        for job in list(self.pending.values()):
+            if job.session is session:
+                job.cancel_token.cancel()
+
+    def submit(self, request, session):
+        # Токен на Event менеджера: его видит процесс-воркер
+        job = Job(next(self.counter), request, session, CancellationToken(self.manager.Event()))
+        self.pending[job.id] = job
+        # PriorityQueue отдает наименьший элемент: больший приоритет идет первым, при равном — FIFO
+        self.jobs.put((-job.priority, job.id, job))
+        session.send({'event': 'queued', 'job': job.id, 'position': self.jobs.qsize()})
+
+    def cancel(self, job_id):
+        job = self.pending.get(job_id)
+        if job:
+            job.cancel_token.cancel()
+
+    def status(self):
+        return {
+            'event': 'status',
+            'workers': self.workers,
+            'queued': self.jobs.qsize(),
+            'running': len(self.active),
+            'done': self.done,
+            'failed': self.failed,
+            'uptime': time.time() - self.started,
+        }
+
+    # ---------- выполнение ----------
+
+    def dispatch(self):
+        # По одному потоку на воркер: в пул попадает не больше заданий, чем воркеров,
+        # поэтому порядок выполнения определяет очередь с приоритетами, а не FIFO пула
+        from batch import convert_file
+
+        while not self.stopping.is_set():
+            _, _, job = self.jobs.get()
+            if job.cancel_token.cancelled:
+                # Отменено еще в очереди — в воркер не отправляем
+                self.pending.pop(job.id, None)
+                job.session.send({'event': 'result', 'job': job.id, 'result': {
+                    'input': job.input_path, 'output': job.output_path, 'status': 'cancelled',
+                    'error': "Конвертация отменена"}})
+                continue
+            self.active[job.id] = job
+            try:
+                future = self.executor.submit(convert_file, job.input_path, job.output_path, job.use_cache,
+                                              None, self.progress_queue, job.options, job.id, job.cancel_token)
+                result = future.result()
+            except Exception as e:
+                result = {'input': job.input_path, 'output': job.output_path, 'status': 'error',
+                          'error': str(e)}
+            finally:
+                self.active.pop(job.id, None)
+                self.pending.pop(job.id, None)
+            record_result(result)
+            if result['status'] == 'ok':
+                self.done += 1
+            elif result['status'] != 'cancelled':
+                self.failed += 1
+            job.session.send({'event': 'result', 'job': job.id, 'result': result})
+
+    def on_progress(self, job_id, info):
+        job = self.active.get(job_id)
+        if job:
+            job.session.send({'event': 'progress', 'job': job_id, 'info': info})
+
+
+# ==================== КЛИЕНТ ====================
+
+class DaemonClient:
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+        self.job_id = None
+        self.cancel_requested = False
+
+    def send(self, message):
+        with self.lock:
+            self.connection.send(message)
+
+    def request(self, message):
+        self.send(message)
+        return self.connection.recv()
+
+    def convert(self, input_path, output_path, options=None, use_cache=True, priority=DEFAULT_PRIORITY,
+                on_progress=None):
+        # Отправляет задание и ждет результата; on_progress(info) — отчеты конвертера.
+        # Возвращает словарь результата как у batch.convert_file
+        self.send({
+            'cmd': 'convert',
+            'input': os.path.abspath(input_path),
+            'output': os.path.abspath(output_path),
+            'options': options,
+            'use_cache': use_cache,
+            'priority': priority,
+        })
+        while True:
+            message = self.connection.recv()
+            if message['event'] == 'queued':
+                self.job_id = message['job']
+                if self.cancel_requested:
+                    self.cancel()
+            elif message['event'] == 'progress' and on_progress:
+                on_progress(message['info'])
+            elif message['event'] == 'result':
+                return message['result']
+            elif message['event'] == 'error':
+                raise RuntimeError(message['error'])
+
+    def cancel(self):
+        # Можно вызывать из другого потока, пока convert ждет результата
+        self.cancel_requested = True
+        if self.job_id is not None:
+            try:
+                self.send({'cmd': 'cancel', 'job': self.job_id})
+            except OSError:
+                # Соединение уже закрыто — задание завершилось
+                pass
+
+    def close(self):
+        self.connection.close()
+
+
+def connect(address=None):
+    # Клиент демона или None, если демон не запущен
+    authkey = load_authkey()
+    if authkey is None:
+        return None
+    try:
+        return DaemonClient(Client(address or get_address(), authkey=authkey))
+    except (OSError, EOFError, multiprocessing.AuthenticationError):
+        return None
+
+
+# ==================== CLI ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Демон конвертации с прогретыми воркерами")
+    parser.add_argument('--address', help=f"host:port или путь к Unix-сокету (по умолчанию {DEFAULT_ADDRESS})")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve = subparsers.add_parser('serve', help="Запустить демон")
+    serve.add_argument('-j', '--workers', type=int, default=None,
+                       help="Количество воркеров (по умолчанию — число ядер)")
+    serve.add_argument('--metrics-port', type=int,
+                       help="Отдавать метрики Prometheus по HTTP: http://127.0.0.1:ПОРТ/metrics")
+    add_metrics_arguments(serve)
+    subparsers.add_parser('status', help="Состояние демона")
+    subparsers.add_parser('stop', help="Остановить демон")
+    args = parser.parse_args(argv)
+
+    address = parse_address(args.address) if args.address else None
+    if args.command == 'serve':
+        apply_metrics_arguments(args)
+        if args.metrics_port:
+            serve_prometheus(('127.0.0.1', args.metrics_port))
+        ConversionDaemon(address, args.workers).serve()
+        return 0
+
+    client = connect(address)
+    if client is None:
+        print("Демон не запущен")
+        return 1
+    if args.command == 'status':
+        status = client.request({'cmd': 'status'})
+        print(f"Воркеров: {status['workers']}, в очереди: {status['queued']}, "
+              f"выполняется: {status['running']}, готово: {status['done']}, ошибок: {status['failed']}, "
+              f"работает {status['uptime']:.0f} с")
+    else:
+        client.request({'cmd': 'shutdown'})
+        print("Демон остановлен")
+    client.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
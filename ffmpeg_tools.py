@@ -0,0 +1,156 @@
+import json
+import re
+import shutil
+import subprocess
+
+from cancel import stop_process
+from progress import ensure_progress
+
+
+# ==================== FFMPEG: АНАЛИЗ ПОТОКОВ И ПЕРЕУПАКОВКА ====================
+
+# Какие кодеки контейнер принимает без перекодирования (None — любые)
+CONTAINER_CODECS = {
+    'mp4': {'video': {'h264', 'hevc', 'mpeg4', 'av1'}, 'audio': {'aac', 'mp3', 'ac3', 'eac3', 'alac', 'opus'}},
+    'm4v': {'video': {'h264', 'hevc', 'mpeg4'}, 'audio': {'aac', 'ac3', 'alac'}},
+    'mov': {'video': {'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'}, 'audio': {'aac', 'mp3', 'alac', 'pcm_s16le'}},
+    'mkv': None,
+    'webm': {'video': {'vp8', 'vp9', 'av1'}, 'audio': {'vorbis', 'opus'}},
+    'avi': {'video': {'mpeg4', 'h264', 'mjpeg', 'msmpeg4v3'}, 'audio': {'mp3', 'ac3', 'pcm_s16le'}},
+    'wmv': {'video': {'wmv1', 'wmv2', 'wmv3', 'vc1'}, 'audio': {'wmav1', 'wmav2'}},
+    'flv': {'video': {'h264', 'flv1'}, 'audio': {'aac', 'mp3'}},
+    '3gp': {'video': {'h263', 'h264', 'mpeg4'}, 'audio': {'aac', 'amr_nb'}},
+    # Аудиоконтейнеры
+    'mp3': {'audio': {'mp3'}},
+    'aac': {'audio': {'aac'}},
+    'm4a': {'audio': {'aac', 'alac'}},
+    'ogg': {'audio': {'vorbis', 'opus', 'flac'}},
+    'flac': {'audio': {'flac'}},
+    'wav': {'audio': {'pcm_s16le', 'pcm_s24le', 'pcm_s32le', 'pcm_f32le', 'pcm_u8'}},
+    'aiff': {'audio': {'pcm_s16be', 'pcm_s24be', 'pcm_s32be'}},
+    'wma': {'audio': {'wmav1', 'wmav2'}},
+}
+
+
+def find_ffmpeg():
+    # ffmpeg из PATH, иначе тот, что поставляется вместе с moviepy (imageio-ffmpeg)
+    path = shutil.which('ffmpeg')
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+def find_ffprobe():
+    return shutil.which('ffprobe')
+
+
+def probe(input_path):
+    # Описание потоков и контейнера через ffprobe
+    ffprobe = find_ffprobe()
+    if not ffprobe:
+        return probe_with_ffmpeg(input_path)
+    result = subprocess.run(
+        [ffprobe, '-v', 'error', '-print_format', 'json', '-show_streams', '-show_format', input_path],
+        capture_output=True, text=True, check=True,
+    )
+    data = json.loads(result.stdout)
+    streams = [
+        {'type': s.get('codec_type'), 'codec': s.get('codec_name')}
+        for s in data.get('streams', [])
+        if s.get('codec_type') in ('video', 'audio')
+        # Обложки (attached_pic) не считаем видеопотоком
+        and not s.get('disposition', {}).get('attached_pic')
+    ]
+    duration = float(data.get('format', {}).get('duration') or 0)
+    return {'streams': streams, 'duration': duration}
+
+
+def probe_with_ffmpeg(input_path):
+    # Запасной вариант без ffprobe (например, только ffmpeg из imageio-ffmpeg):
+    # разбираем вывод "ffmpeg -i", строки вида "Stream #0:0: Video: h264 (High) ..."
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg не найден")
+    result = subprocess.run([ffmpeg, '-hide_banner', '-i', input_path], capture_output=True, text=True)
+    streams = []
+    for line in result.stderr.splitlines():
+        match = re.search(r'Stream #\S+: (Video|Audio): (\w+)', line)
+        if match and 'attached pic' not in line:
+            streams.append({'type': match.group(1).lower(), 'codec': match.group(2)})
+    duration = 0.0
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return {'streams': streams, 'duration': duration}
+
+
+def can_stream_copy(streams, output_ext, kinds=('video', 'audio')):
+    # Можно ли переложить потоки выбранных типов в контейнер без перекодирования
+    output_ext = output_ext.lower()
+    if output_ext not in CONTAINER_CODECS:
+        return False
+    accepted = CONTAINER_CODECS[output_ext]
+    selected = [s for s in streams if s['type'] in kinds]
+    if not selected:
+        return False
+    if accepted is None:
+        return True
+    return all(s['codec'] in accepted.get(s['type'], set()) for s in selected)
+
+
+def ffmpeg_command(args):
+    # Полная команда ffmpeg: ошибки в stderr, ход работы — строками key=value в stdout
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg не найден")
+    return [ffmpeg, '-y', '-hide_banner', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1'] + args
+
+
+def parse_progress_line(line):
+    # Строка -progress → обработанные секунды (out_time_us) или None
+    key, _, value = line.strip().partition('=')
+    if key == 'out_time_us' and value.isdigit():
+        return int(value) / 1_000_000
+    return None
+
+
+def remux_args(input_path, output_path, audio_only=False):
+    # Переупаковка без перекодирования (-c copy)
+    if audio_only:
+        return ['-i', input_path, '-map', '0:a:0', '-vn', '-c:a', 'copy', output_path]
+    # 0:V — видеопотоки без обложек
+    return ['-i', input_path, '-map', '0:V', '-map', '0:a?', '-c', 'copy', output_path]
+
+
+def run_ffmpeg(args, duration=0.0, progress=None):
+    # Запуск ffmpeg с разбором -progress: время out_time_us переводим в секунды
+    progress = ensure_progress(progress)
+    command = ffmpeg_command(args)
+    if duration:
+        progress.set_total(duration, 'seconds')
+
+    with progress.stage('ffmpeg'):
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        try:
+            # progress.update выбрасывает ConversionCancelled при отмене — тогда ffmpeg завершаем сами
+            for line in process.stdout:
+                seconds = parse_progress_line(line)
+                if seconds is not None:
+                    progress.update(seconds)
+            stderr = process.stderr.read()
+        finally:
+            stop_process(process)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg завершился с ошибкой:\n{stderr.strip()}")
+    progress.finish()
+
+
+def remux(input_path, output_path, audio_only=False, info=None, progress=None):
+    # Переупаковка без перекодирования (-c copy)
+    info = info or probe(input_path)
+    run_ffmpeg(remux_args(input_path, output_path, audio_only), info['duration'], progress)
@@ -0,0 +1,234 @@
+import io
+import mmap
+import os
+import shutil
+import tempfile
+
+from converters import convert_image_pillow, fast_temp_dir, read_table, write_table
+from progress import ensure_progress
+from registry import find_converter, normalize_format
+
+
+# ==================== КОНВЕРТАЦИЯ В ПАМЯТИ ====================
+# Тот же набор конвертаций, но без путей: вход — bytes, bytearray, memoryview, mmap,
+# файловый объект или путь, формат задается явно; результат — bytes или запись
+# в буфер вызывающего. Изображения и таблицы конвертируются целиком в памяти,
+# остальное (ffmpeg, pandoc, LibreOffice, архивы) требует файлов — для них вход и выход
+# временно кладутся в tmpfs (см. fast_temp_dir)
+
+# Файлы на диске от этого размера читаются через mmap, а не в память целиком
+MMAP_THRESHOLD = 1024 * 1024
+# Типы конвертации, которые работают с файловыми объектами напрямую
+IN_MEMORY_TYPES = ('image', 'table')
+
+
+class MemoryReader(io.RawIOBase):
+    # Файловый объект поверх буфера без копирования буфера целиком:
+    # read() копирует только запрошенный кусок
+    def __init__(self, buffer):
+        super().__init__()
+        self.view = memoryview(buffer).cast('B')
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        if offset < 0:
+            raise ValueError("Отрицательная позиция")
+        self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        chunk = self.view[self.position:self.position + len(buffer)]
+        size = len(chunk)
+        memoryview(buffer).cast('B')[:size] = chunk
+        self.position += size
+        return size
+
+    def readall(self):
+        data = bytes(self.view[self.position:])
+        self.position = len(self.view)
+        return data
+
+    def close(self):
+        self.view.release()
+        super().close()
+
+
+class InputSource:
+    # Вход как файловый объект (file) или путь на диске (path) — что потребуется конвертеру.
+    # Путь для буфера появляется только при обращении к path: данные пишутся во временный файл
+    def __init__(self, source, input_format):
+        self.source = source
+        self.input_format = input_format
+        self.file = None
+        self.temp_path = None
+        self._mmap = None
+        self._handle = None
+
+    def is_path(self):
+        return isinstance(self.source, (str, os.PathLike))
+
+    @staticmethod
+    def maps_file(source):
+        try:
+            size = os.fstat(source.fileno()).st_size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return False
+        return size >= MMAP_THRESHOLD and source.seekable()
+
+    def open(self):
+        source = self.source
+        if self.is_path():
+            self._handle = open(source, 'rb')
+            if os.fstat(self._handle.fileno()).st_size >= MMAP_THRESHOLD:
+                self._mmap = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+                self.file = MemoryReader(self._mmap)
+            else:
+                self.file = self._handle
+        elif isinstance(source, bytes):
+            # BytesIO разделяет память с bytes до первой записи — копии нет
+            self.file = io.BytesIO(source)
+        elif hasattr(source, 'read'):
+            if self.maps_file(source):
+                # Большой файл на диске: mmap с текущей позиции вместо чтения через буфер
+                self._mmap = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+                self.file = MemoryReader(memoryview(self._mmap)[source.tell():])
+            elif source.seekable():
+                self.file = source
+            else:
+                # Pillow и pandas перемещаются по входу, поэтому непоследовательный поток вычитываем
+                self.file = io.BytesIO(source.read())
+        else:
+            # bytearray, memoryview, mmap и прочие объекты с буферным протоколом
+            self.file = MemoryReader(source)
+        return self.file
+
+    @property
+    def path(self):
+        if self.is_path():
+            return os.fspath(self.source)
+        if self.temp_path is None:
+            fd, self.temp_path = tempfile.mkstemp(suffix=f'.{self.input_format}', dir=fast_temp_dir())
+            with os.fdopen(fd, 'wb') as temp:
+                if hasattr(self.source, 'read'):
+                    shutil.copyfileobj(self.source, temp)
+                else:
+                    temp.write(self.source)
+        return self.temp_path
+
+    def close(self):
+        if self.file is not None and self.file is not self.source and self.file is not self._handle:
+            self.file.close()
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._handle is not None:
+            self._handle.close()
+        if self.temp_path is not None:
+            os.remove(self.temp_path)
+
+
+def copy_to_output(data, output):
+    # data — memoryview результата. Возвращает число записанных байт
+    if output is None:
+        return bytes(data)
+    if isinstance(output, bytearray):
+        output.extend(data)
+    elif hasattr(output, 'write'):
+        output.write(data)
+    else:
+        # Изменяемый буфер фиксированного размера: memoryview, mmap, array
+        view = memoryview(output).cast('B')
+        if len(view) < len(data):
+            raise ValueError(f"Буфер мал: нужно {len(data)} байт, доступно {len(view)}")
+        view[:len(data)] = data
+    return len(data)
+
+
+def writes_directly(output):
+    # Seekable-файл вызывающего отдаем конвертеру как есть — результат не копируется
+    return hasattr(output, 'write') and not isinstance(output, bytearray) and output.seekable()
+
+
+def convert_buffer(source, input_format, output_format, output=None, progress=None, options=None):
+    # Конвертация без путей в API.
+    # source — bytes/bytearray/memoryview/mmap, двоичный файловый объект или путь;
+    # output — None (вернуть bytes), bytearray (дописать), двоичный файловый объект или
+    # изменяемый буфер (записать с начала). Если output задан, возвращает число байт
+    input_ext = normalize_format(input_format).lower()
+    output_ext = normalize_format(output_format).lower()
+    progress = ensure_progress(progress)
+    entry = find_converter(input_ext, output_ext)
+
+    if input_ext == output_ext:
+        # Формат не меняется — отдаем вход как есть
+        source_input = InputSource(source, input_ext)
+        try:
+            return copy_to_output(memoryview(source_input.open().read()), output)
+        finally:
+            source_input.close()
+
+    if entry is not None and entry.conv_type in IN_MEMORY_TYPES:
+        target = output if writes_directly(output) else io.BytesIO()
+        start = target.tell() if target is output else 0
+        source_input = InputSource(source, input_ext)
+        try:
+            source_file = source_input.open()
+            if entry.conv_type == 'image':
+                convert_image_pillow(source_file, target, progress=progress, options=options,
+                                     output_format=output_ext)
+            else:
+                progress.set_total(2, 'items')
+                df = read_table(source_file, input_ext)
+                progress.advance()
+                write_table(df, target, output_ext)
+                progress.finish()
+        finally:
+            source_input.close()
+        if target is output:
+            return output.tell() - start
+        return copy_to_output(target.getbuffer(), output)
+
+    return convert_buffer_via_files(source, input_ext, output_ext, output, progress, options)
+
+
+def convert_buffer_via_files(source, input_ext, output_ext, output, progress, options):
+    # Конвертеры, которым нужны файлы: вход и выход во временной папке в tmpfs.
+    # Вход-путь используется как есть
+    from planner import resolve_conversion_function
+
+    source_input = InputSource(source, input_ext)
+    temp_dir = tempfile.mkdtemp(prefix='konvertor-', dir=fast_temp_dir())
+    output_path = os.path.join(temp_dir, f'result.{output_ext}')
+    try:
+        conversion_func = resolve_conversion_function(f'input.{input_ext}', output_path)
+        if conversion_func is None:
+            raise ValueError(f"Конвертация .{input_ext} в .{output_ext} не поддерживается")
+        conversion_func(source_input.path, output_path, progress=progress, options=options)
+        if not os.path.exists(output_path):
+            # Например, все страницы PDF — несколько файлов в один буфер не помещаются
+            raise ValueError("Результат состоит из нескольких файлов; выберите одну страницу (pages)")
+        with open(output_path, 'rb') as result:
+            if os.path.getsize(output_path) == 0:
+                return copy_to_output(memoryview(b''), output)
+            with mmap.mmap(result.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                with memoryview(data) as view:
+                    return copy_to_output(view, output)
+    finally:
+        source_input.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def convert_bytes(data, input_format, output_format, progress=None, options=None):
+    return convert_buffer(data, input_format, output_format, progress=progress, options=options)
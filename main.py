@@ -1,207 +1,183 @@
+import logging
 import os
 import sys
-import tempfile
+from functools import partial
 from pathlib import Path
-from PyQt6 import uic
 from PyQt6.QtGui import QIcon
-from PyQt6.QtWidgets import QApplication, QMainWindow, QFileDialog, QMessageBox
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QFileDialog, QMessageBox, QWidget, QLabel, QProgressBar,
+                             QPushButton, QHBoxLayout, QVBoxLayout, QListWidgetItem)
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
 import traceback
 
-
-class ConversionThread(QThread):
-    #Поток для выполнения конвертации в фоне
+import daemon
+import metrics
+from batch import build_output_paths
+from cache import cached_convert
+from cancel import CancellationToken, ConversionCancelled, convert_atomic
+from progress import ProgressReporter, describe_progress
+from planner import convert_via_plan, plan, reachable_formats
+from registry import MATRIX, get_converter_type, get_output_formats, select_conversion_function
+
+log = logging.getLogger('konvertor')
+# Файл метрик Prometheus, обновляется после каждой конвертации (KONVERTOR_METRICS_FILE)
+METRICS_FILE = metrics.configure_from_env()
+# Сколько конвертаций GUI выполняет одновременно, остальные ждут в очереди пула
+GUI_MAX_JOBS = os.cpu_count() or 2
+# Через сколько итог набора заданий на общем прогресс-баре сбрасывается
+RESET_DELAY_MS = 2000
+
+
+class JobSignals(QObject):
+    # QRunnable не наследует QObject, поэтому сигналы задания живут в отдельном объекте
     progress = pyqtSignal(int)
+    status = pyqtSignal(str)  # описание прогресса: объем, скорость, оставшееся время
     finished = pyqtSignal(str)  # путь к сохраненному файлу
     error = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class ConversionJob(QRunnable):
+    #Одна конвертация в пуле потоков GUI (QThreadPool)
 
-    def __init__(self, input_path, output_format, conversion_func, save_path):
+    def __init__(self, input_path, output_format, conversion_func, save_path, use_cache=True, options=None,
+                 use_daemon=True):
         super().__init__()
+        # Задание остается в списке и после завершения — удаляем его сами, а не пул
+        self.setAutoDelete(False)
+        self.signals = JobSignals()
         self.input_path = input_path
         self.output_format = output_format
         self.conversion_func = conversion_func
         self.save_path = save_path
+        self.use_cache = use_cache
+        self.options = options  # настройки кодирования, см. options.py
+        self.use_daemon = use_daemon  # отправить задание демону (daemon.py), если он запущен
+        self.cancel_token = CancellationToken()
+        self.daemon_client = None
 
     def run(self):
         try:
-            self.progress.emit(10)
-            # Выполняем конвертацию
-            self.conversion_func(self.input_path, self.save_path)
-            self.progress.emit(100)
-            self.finished.emit(self.save_path)
+            if self.cancel_token.cancelled:
+                raise ConversionCancelled("Конвертация отменена")
+            self.signals.progress.emit(0)
+            self.daemon_client = daemon.connect() if self.use_daemon else None
+            if self.daemon_client:
+                self.convert_with_daemon(self.daemon_client)
+                return
+            # Прогресс сообщает сам конвертер, он же проверяет отмену
+            reporter = ProgressReporter(callback=self.on_progress, cancel_token=self.cancel_token)
+            # Выполняем конвертацию (через кэш, если результат уже есть — просто копируем).
+            # Результат пишется атомарно: при отмене недописанный файл удаляется
+            measurement = metrics.ConversionMetrics(self.input_path, self.save_path, reporter)
+            try:
+                with measurement:
+                    if self.use_cache:
+                        cached_convert(self.conversion_func, self.input_path, self.save_path, self.options,
+                                       progress=reporter)
+                    else:
+                        convert_atomic(self.conversion_func, self.input_path, self.save_path,
+                                       progress=reporter, options=self.options)
+            finally:
+                self.record({'metrics': measurement.to_dict()})
+            self.signals.progress.emit(100)
+            self.signals.finished.emit(self.save_path)
+        except ConversionCancelled:
+            self.signals.cancelled.emit()
         except Exception as e:
-            self.error.emit(f"Ошибка: {str(e)}\n{traceback.format_exc()}")
-
-
-# ==================== ФУНКЦИИ КОНВЕРТАЦИИ ====================
-
-def convert_image_pillow(input_path, output_path):
-    # Конвертация изображений с помощью Pillow
-    from PIL import Image
-
-    img = Image.open(input_path)
-    output_ext = output_path.split('.')[-1].lower()
-
-    # Обработка прозрачности для JPEG/BMP
-    if output_ext in ['jpg', 'jpeg', 'bmp'] and img.mode in ('RGBA', 'LA', 'P'):
-        background = Image.new('RGB', img.size, (255, 255, 255))
-        if img.mode == 'P':
-            img = img.convert('RGBA')
-        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-        img = background
-
-    # ОСОБАЯ ОБРАБОТКА ДЛЯ ICO
-    elif output_ext == 'ico':
-        # ICO требует специальной обработки
-        # Конвертируем в нужный формат (RGBA для поддержки прозрачности)
-        if img.mode != 'RGBA':
-            img = img.convert('RGBA')
-
-        # ICO файлы обычно содержат несколько размеров
-        # Создаем список размеров для иконки (стандартные размеры иконок Windows)
-        sizes = [(16, 16), (32, 32), (48, 48), (64, 64)]
-
-        # Создаем список изображений разных размеров
-        icon_images = []
-        for size in sizes:
-            # Масштабируем изображение с антиалиасингом
-            resized_img = img.resize(size, Image.Resampling.LANCZOS)
-            icon_images.append(resized_img)
-
-        # Сохраняем как ICO с несколькими размерами
-        icon_images[0].save(output_path, format='ICO', sizes=[(img.width, img.height) for img in icon_images])
-        return
+            self.signals.error.emit(f"Ошибка: {str(e)}\n{traceback.format_exc()}")
 
-    # Для GIF с анимацией
-    elif output_ext == 'gif' and hasattr(img, 'is_animated') and img.is_animated:
-        frames = []
+    def convert_with_daemon(self, client):
+        # Демон держит прогретые воркеры, конвертация идет в нем, прогресс приходит по сокету
         try:
-            while True:
-                frames.append(img.copy())
-                img.seek(len(frames))
-        except EOFError:
-            pass
-        if frames:
-            frames[0].save(output_path, save_all=True, append_images=frames[1:])
-            return
-
-    # Для всех остальных форматов
-    img.save(output_path)
-
-def convert_audio_pydub(input_path, output_path):
-    # Конвертация аудио с помощью pydub
-    from pydub import AudioSegment
-
-    input_ext = input_path.split('.')[-1].lower()
-    output_ext = output_path.split('.')[-1].lower()
-
+            result = client.convert(self.input_path, self.save_path, self.options, use_cache=self.use_cache,
+                                    on_progress=self.on_progress)
+        finally:
+            client.close()
+        self.record(result)
+        if result['status'] == 'cancelled':
+            raise ConversionCancelled(result['error'])
+        if result['status'] != 'ok':
+            raise RuntimeError(result['error'])
+        self.signals.progress.emit(100)
+        self.signals.finished.emit(self.save_path)
+
+    def record(self, result):
+        # Метрики конвертации — в JSON-лог и файл Prometheus, если они включены
+        metrics.record_result(result)
+        if METRICS_FILE:
+            metrics.write_prometheus(METRICS_FILE)
+
+    def cancel(self):
+        # Кооперативная отмена: конвертер сам остановится в ближайшей точке проверки
+        self.cancel_token.cancel()
+        if self.daemon_client:
+            self.daemon_client.cancel()
+
+    def on_progress(self, info):
+        if info['percent'] is not None:
+            self.signals.progress.emit(int(info['percent']))
+        self.signals.status.emit(describe_progress(info))
+
+
+class JobWidget(QWidget):
+    # Строка списка заданий: имя файла, свой прогресс и кнопка отмены
+    cancel_requested = pyqtSignal()
+
+    def __init__(self, job, parent=None):
+        super().__init__(parent)
+        self.label = QLabel(f"{Path(job.input_path).name} → {job.output_format}")
+        self.label.setToolTip(job.save_path)
+        self.bar = QProgressBar()
+        self.bar.setValue(0)
+        self.bar.setFormat("В очереди")
+        self.cancel_button = QPushButton("✕")
+        self.cancel_button.setFixedWidth(24)
+        self.cancel_button.setToolTip("Отменить")
+        self.cancel_button.clicked.connect(self.cancel_requested)
+
+        row = QHBoxLayout()
+        row.addWidget(self.bar)
+        row.addWidget(self.cancel_button)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 2, 4, 2)
+        layout.setSpacing(2)
+        layout.addWidget(self.label)
+        layout.addLayout(row)
+
+    def set_progress(self, value):
+        self.bar.setValue(value)
+        if self.bar.format() == "В очереди":
+            self.bar.setFormat("%p%")
+
+    def set_status(self, text):
+        # После нажатия отмены строка показывает ее, а не скорость
+        if self.cancel_button.isEnabled():
+            self.bar.setFormat(f"%p% — {text}")
+
+    def set_done(self, text, tooltip=None):
+        # Итог задания: кнопка отмены больше не нужна
+        self.bar.setFormat(text)
+        self.cancel_button.setEnabled(False)
+        if tooltip:
+            self.bar.setToolTip(tooltip)
+
+
+# ==================== ИНТЕРФЕЙС ====================
+
+def load_ui(window):
+    # Предкомпилированный интерфейс (python build_ui.py) не требует разбора XML при запуске,
+    # без него загружаем .ui как раньше
     try:
-        audio = AudioSegment.from_file(input_path, format=input_ext)
-    except:
-        audio = AudioSegment.from_file(input_path)
-
-    audio.export(output_path, format=output_ext)
-
-
-def convert_video_moviepy(input_path, output_path):
-    # Конвертация видео с помощью moviepy
-    from moviepy import VideoFileClip
-
-    clip = VideoFileClip(input_path)
-    output_ext = output_path.split('.')[-1].lower()
-
-    if output_ext == 'gif':
-        clip.write_gif(output_path)
-    else:
-        clip.write_videofile(output_path)
-
-    clip.close()
-
-
-def extract_audio_from_video_moviepy(video_path, audio_path):
-    # Извлечение аудио из видео
-    from moviepy import VideoFileClip
-
-    clip = VideoFileClip(video_path)
-    audio = clip.audio
-    audio.write_audiofile(audio_path)
-    clip.close()
-
-
-def convert_document_pypandoc(input_path, output_path):
-    # Конвертация документов с помощью pypandoc
-    import pypandoc
-
-    output_ext = output_path.split('.')[-1].lower()
-    format_map = {
-        'docx': 'docx', 'pdf': 'pdf', 'html': 'html', 'txt': 'plain',
-        'md': 'markdown', 'epub': 'epub', 'rtf': 'rtf', 'odt': 'odt'
-    }
-
-    output_format = format_map.get(output_ext, output_ext)
-    pypandoc.convert_file(input_path, output_format, outputfile=output_path)
-
-
-def convert_table_pandas(input_path, output_path):
-    # Конвертация таблиц с помощью pandas
-    import pandas as pd
-
-    input_ext = input_path.split('.')[-1].lower()
-    output_ext = output_path.split('.')[-1].lower()
-
-    # Чтение
-    if input_ext == 'csv':
-        df = pd.read_csv(input_path)
-    elif input_ext in ['xlsx', 'xls']:
-        df = pd.read_excel(input_path)
-    elif input_ext == 'json':
-        df = pd.read_json(input_path)
-    elif input_ext == 'xml':
-        df = pd.read_xml(input_path)
-    else:
-        raise ValueError(f"Неподдерживаемый формат: {input_ext}")
-
-    # Запись
-    if output_ext == 'csv':
-        df.to_csv(output_path, index=False)
-    elif output_ext in ['xlsx', 'xls']:
-        df.to_excel(output_path, index=False)
-    elif output_ext == 'json':
-        df.to_json(output_path, indent=2)
-    elif output_ext == 'html':
-        df.to_html(output_path, index=False)
-    else:
-        raise ValueError(f"Неподдерживаемый выходной формат: {output_ext}")
-
-
-def convert_pdf_to_image_pdf2image(pdf_path, output_path):
-    # Конвертация PDF в изображение
-    from pdf2image import convert_from_path
-
-    images = convert_from_path(pdf_path, dpi=150, first_page=1, last_page=1)
-    if images:
-        images[0].save(output_path)
-
-
-def convert_docx_to_image(docx_path, output_path):
-    # Конвертация DOCX в изображение через временный PDF
-    import pypandoc
-    from pdf2image import convert_from_path
-
-    # Создаем временный PDF
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
-        temp_pdf = tmp.name
-
-    try:
-        # DOCX → PDF
-        pypandoc.convert_file(docx_path, 'pdf', outputfile=temp_pdf)
-        # PDF → изображение
-        images = convert_from_path(temp_pdf, dpi=150, first_page=1, last_page=1)
-        if images:
-            images[0].save(output_path)
-    finally:
-        if os.path.exists(temp_pdf):
-            os.remove(temp_pdf)
+        from uic_storage.main2_ui import Ui_Konverter
+    except ImportError:
+        from PyQt6 import uic
+        uic.loadUi('uic_storage/main2.ui', window)
+        return
+    ui = Ui_Konverter()
+    ui.setupUi(window)
+    # setupUi создает виджеты как атрибуты ui, а loadUi — как атрибуты окна
+    for name, widget in vars(ui).items():
+        setattr(window, name, widget)
 
 
 # ==================== ОСНОВНОЙ КЛАСС ====================
@@ -211,95 +187,23 @@ class FileConverter(QMainWindow):
         super().__init__()
 
         # Загружаем интерфейс
-        uic.loadUi('uic_storage/main2.ui', self)
+        load_ui(self)
         self.setWindowIcon(QIcon("ico/icon.ico"))
 
         self.setup_tooltips()
         self.ex_format = None
         self.upload_file = False
         self.current_file_path = None
-        self.conversion_thread = None
-
-        # Матрица конвертаций
-        self.matrix = {
-            # ========== ИЗОБРАЖЕНИЯ ==========
-            'JPG': ['PNG', 'GIF', 'BMP', 'TIFF', 'PDF', 'WEBP', 'ICO', 'PPM'],
-            'JPEG': ['PNG', 'GIF', 'BMP', 'TIFF', 'PDF', 'WEBP', 'ICO', 'PPM'],
-            'PNG': ['JPG', 'GIF', 'BMP', 'TIFF', 'PDF', 'WEBP', 'ICO', 'PPM'],
-            'GIF': ['JPG', 'PNG', 'BMP', 'TIFF', 'PDF', 'WEBP', 'ICO', 'PPM'],
-            'BMP': ['JPG', 'PNG', 'GIF', 'TIFF', 'PDF', 'WEBP', 'ICO', 'PPM'],
-            'TIFF': ['JPG', 'PNG', 'GIF', 'BMP', 'PDF', 'WEBP', 'ICO', 'PPM'],
-            'WEBP': ['JPG', 'PNG', 'GIF', 'BMP', 'TIFF', 'PDF', 'ICO', 'PPM'],
-            'ICO': ['JPG', 'PNG', 'GIF', 'BMP', 'TIFF', 'PDF', 'WEBP', 'PPM'],
-            'PPM': ['JPG', 'PNG', 'GIF', 'BMP', 'TIFF', 'PDF', 'WEBP', 'ICO'],
-
-            # ========== ВИДЕО ==========
-            'MP4': ['AVI', 'GIF', 'MKV', 'WEBM', 'MOV', 'WMV', 'MP3', 'WAV'],
-            'AVI': ['MP4', 'GIF', 'MKV', 'WEBM', 'MOV', 'WMV', 'MP3', 'WAV'],
-            'MKV': ['MP4', 'AVI', 'GIF', 'WEBM', 'MOV', 'WMV', 'MP3', 'WAV'],
-            'WEBM': ['MP4', 'AVI', 'GIF', 'MKV', 'MOV', 'WMV', 'MP3', 'WAV'],
-            'MOV': ['MP4', 'AVI', 'GIF', 'MKV', 'WEBM', 'WMV', 'MP3', 'WAV'],
-            'WMV': ['MP4', 'AVI', 'GIF', 'MKV', 'WEBM', 'MOV', 'MP3', 'WAV'],
-            'FLV': ['MP4', 'AVI', 'GIF', 'MKV', 'WEBM', 'MOV', 'WMV', 'MP3', 'WAV'],
-            'M4V': ['MP4', 'AVI', 'GIF', 'MKV', 'WEBM', 'MOV', 'WMV', 'MP3', 'WAV'],
-            '3GP': ['MP4', 'AVI', 'GIF', 'MKV', 'WEBM', 'MOV', 'WMV', 'MP3', 'WAV'],
-
-            # ========== АУДИО ==========
-            'MP3': ['WAV', 'FLAC', 'OGG', 'AAC', 'AIFF', 'M4A'],
-            'WAV': ['MP3', 'FLAC', 'OGG', 'AAC', 'AIFF', 'M4A'],
-            'FLAC': ['MP3', 'WAV', 'OGG', 'AAC', 'AIFF', 'M4A'],
-            'OGG': ['MP3', 'WAV', 'FLAC', 'AAC', 'AIFF', 'M4A'],
-            'AAC': ['MP3', 'WAV', 'FLAC', 'OGG', 'AIFF', 'M4A'],
-            'AIFF': ['MP3', 'WAV', 'FLAC', 'OGG', 'AAC', 'M4A'],
-            'M4A': ['MP3', 'WAV', 'FLAC', 'OGG', 'AAC', 'AIFF'],
-            'WMA': ['MP3', 'WAV', 'FLAC', 'OGG', 'AAC', 'AIFF', 'M4A'],
-            'AMR': ['MP3', 'WAV', 'FLAC', 'OGG', 'AAC', 'AIFF', 'M4A'],
-
-            # ========== ДОКУМЕНТЫ ==========
-            'DOCX': ['PDF', 'HTML', 'TXT', 'MD', 'RTF', 'EPUB'],
-            'DOC': ['PDF', 'HTML', 'TXT', 'MD', 'RTF', 'DOCX', 'EPUB'],
-            'PDF': ['DOCX', 'HTML', 'TXT', 'MD', 'RTF', 'JPG', 'PNG', 'EPUB'],
-            'HTML': ['PDF', 'DOCX', 'TXT', 'MD', 'RTF', 'EPUB'],
-            'HTM': ['PDF', 'DOCX', 'TXT', 'MD', 'RTF', 'HTML', 'EPUB'],
-            'TXT': ['PDF', 'DOCX', 'HTML', 'MD', 'RTF', 'EPUB'],
-            'MD': ['PDF', 'DOCX', 'HTML', 'TXT', 'RTF', 'EPUB'],
-            'MARKDOWN': ['PDF', 'DOCX', 'HTML', 'TXT', 'RTF', 'EPUB'],
-            'RTF': ['PDF', 'DOCX', 'HTML', 'TXT', 'MD', 'EPUB'],
-            'EPUB': ['PDF', 'DOCX', 'HTML', 'TXT', 'MD', 'RTF'],
-            'ODT': ['PDF', 'DOCX', 'HTML', 'TXT', 'MD', 'RTF', 'EPUB'],
-            'LATEX': ['PDF', 'TXT', 'HTML'],
-            'TEX': ['PDF', 'TXT', 'HTML'],
-
-            # ========== ТАБЛИЦЫ ==========
-            'CSV': ['XLSX', 'JSON', 'HTML', 'XML', 'PDF', 'PARQUET'],
-            'XLSX': ['CSV', 'JSON', 'HTML', 'XML', 'PDF', 'PARQUET'],
-            'XLS': ['CSV', 'XLSX', 'JSON', 'HTML', 'XML', 'PDF', 'PARQUET'],
-            'JSON': ['CSV', 'XLSX', 'HTML', 'XML', 'PDF', 'PARQUET'],
-            'XML': ['CSV', 'XLSX', 'JSON', 'HTML', 'PDF', 'PARQUET'],
-            'PARQUET': ['CSV', 'XLSX', 'JSON', 'HTML', 'XML', 'PDF'],
-            'ODS': ['CSV', 'XLSX', 'JSON', 'HTML', 'XML', 'PDF', 'PARQUET'],
-
-            # ========== ПРЕЗЕНТАЦИИ ==========
-            'PPTX': ['PDF', 'HTML', 'JPG', 'PNG'],
-            'PPT': ['PDF', 'HTML', 'JPG', 'PNG', 'PPTX'],
-            'ODP': ['PDF', 'HTML', 'JPG', 'PNG', 'PPTX'],
-
-            # ========== АРХИВЫ ==========
-            'ZIP': ['TAR', 'GZ', 'RAR'],
-            'TAR': ['ZIP', 'GZ'],
-            'GZ': ['ZIP', 'TAR'],
-            'RAR': ['ZIP', 'TAR'],
-            '7Z': ['ZIP', 'TAR'],
-        }
-
-        self.special_conversions = {
-            'MP4': ['MP3', 'WAV'],
-            'AVI': ['MP3', 'WAV'],
-            'MKV': ['MP3', 'WAV'],
-            'PDF': ['JPG', 'PNG', 'TIFF'],
-            'DOCX': ['JPG', 'PNG'],
-            'PPTX': ['JPG', 'PNG'],
-        }
+        self.current_files = []
+
+        # Задания конвертации: очередь в ограниченном пуле потоков, у каждого своя строка в списке
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(GUI_MAX_JOBS)
+        self.jobs = {}  # задание -> JobWidget
+        self.batch = []  # задания, запущенные с момента последнего сброса общего прогресса
+
+        # Матрица конвертаций строится из реестра конвертеров
+        self.matrix = MATRIX
 
         # Запуск функции
         self.initUI()
@@ -309,6 +213,8 @@ class FileConverter(QMainWindow):
         self.rd_show_off_ex.toggled.connect(self.show_or_off_all_formats)
         self.upload_button.clicked.connect(self.open_file_explorer_advanced)
         self.dowlnload_button.clicked.connect(self.start_conversion_process)
+        # Файлы можно перетащить в окно
+        self.setAcceptDrops(True)
 
         if not self.upload_file:
             self.setTextSelectedFileExtension(["Выберите файл"])
@@ -327,27 +233,61 @@ class FileConverter(QMainWindow):
         self.what_show_button.setToolTip(tooltip_text)
 
     def open_file_explorer_advanced(self):
-        file_path, _ = QFileDialog.getOpenFileName(
+        file_paths, _ = QFileDialog.getOpenFileNames(
             self,
-            "Выберите файл",
+            "Выберите файлы",
             "",
             "Все файлы (*.*)",
         )
 
-        if file_path:
-            self.upload_file = True
-            self.current_file_path = file_path
-            self.rd_show_off_ex.setChecked(False)
-            self.process_selected_file(file_path)
+        if file_paths:
+            self.process_selected_files(file_paths)
         else:
-            print('Файл не выбран')
+            log.debug('Файл не выбран')
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        # Папки раскрываем в список файлов
+        file_paths = []
+        for url in event.mimeData().urls():
+            path = url.toLocalFile()
+            if os.path.isdir(path):
+                for root, _, names in sorted(os.walk(path)):
+                    file_paths.extend(os.path.join(root, name) for name in sorted(names))
+            elif os.path.isfile(path):
+                file_paths.append(path)
+        if file_paths:
+            event.acceptProposedAction()
+            self.process_selected_files(file_paths)
+
+    def process_selected_files(self, file_paths):
+        self.upload_file = True
+        self.current_files = list(file_paths)
+        self.current_file_path = self.current_files[0]
+        self.rd_show_off_ex.setChecked(False)
+        if len(self.current_files) == 1:
+            self.process_selected_file(self.current_file_path)
+            return
+
+        log.debug("Выбрано файлов: %d", len(self.current_files))
+        extensions = self.input_extensions()
+        self.upload_button.setText(f"Файлов: {len(self.current_files)}")
+        # Для нескольких файлов — только форматы, доступные каждому из них
+        need_format_list = self.common_output_formats()
+        self.ex_format = next(iter(extensions)) if len(extensions) == 1 else None
+        if need_format_list:
+            self.setTextSelectedFileExtension(need_format_list, self.ex_format)
+        else:
+            self.setTextSelectedFileExtension(['Нет общего формата'])
 
     def process_selected_file(self, file_path):
         file_name = os.path.basename(file_path).split('.')[0]
         file_extension = os.path.basename(file_path).split('.')[-1].upper()
 
-        print(f"Выбран файл: {file_name}")
-        print(f"Расширение: {file_extension}")
+        log.debug("Выбран файл: %s, расширение: %s", file_name, file_extension)
 
         self.update_ui_after_file_selection(file_name, file_extension)
 
@@ -372,8 +312,9 @@ class FileConverter(QMainWindow):
                     self.selected_file_extension.addItem(i)
 
     def show_or_off_all_formats(self, checked):
+        formats = self.common_output_formats()
         if checked:
-            if self.ex_format:
+            if formats:
                 buff = []
                 for i in self.matrix:
                     for j in self.matrix[i]:
@@ -381,177 +322,229 @@ class FileConverter(QMainWindow):
                             buff.append(j)
                 self.setTextSelectedFileExtension(buff)
         else:
-            if self.ex_format is not None:
-                sort_list = self.get_output_formats(self.ex_format)
-                self.setTextSelectedFileExtension(sort_list, self.ex_format)
+            if formats:
+                self.setTextSelectedFileExtension(formats, self.ex_format)
+
+    def input_extensions(self):
+        return {os.path.basename(path).split('.')[-1].upper() for path in self.current_files}
+
+    def common_output_formats(self):
+        formats = None
+        for extension in self.input_extensions():
+            available = set(self.get_output_formats(extension))
+            formats = available if formats is None else formats & available
+        return sorted(formats or ())
 
     def get_output_formats(self, input_format):
-        input_format = input_format.upper()
-        base_formats = self.matrix.get(input_format, [])
-        special_formats = self.special_conversions.get(input_format, [])
-        all_formats = list(set(base_formats + special_formats))
-        return sorted(all_formats)
+        # Прямые конвертации и доступные цепочкой через планировщик
+        return sorted(set(get_output_formats(input_format)) | set(reachable_formats(input_format)))
 
     def get_converter_type(self, input_format, output_format):
-        input_format = input_format.upper()
-        output_format = output_format.upper()
-
-        image_formats = ['JPG', 'JPEG', 'PNG', 'GIF', 'BMP', 'TIFF', 'WEBP', 'ICO', 'PPM']
-        video_formats = ['MP4', 'AVI', 'MKV', 'WEBM', 'MOV', 'WMV', 'FLV', 'M4V', '3GP']
-        audio_formats = ['MP3', 'WAV', 'FLAC', 'OGG', 'AAC', 'AIFF', 'M4A', 'WMA', 'AMR']
-        doc_formats = ['DOCX', 'DOC', 'PDF', 'HTML', 'HTM', 'TXT', 'MD', 'MARKDOWN', 'RTF', 'EPUB', 'ODT', 'LATEX',
-                       'TEX']
-        table_formats = ['CSV', 'XLSX', 'XLS', 'JSON', 'XML', 'PARQUET', 'ODS']
-        presentation_formats = ['PPTX', 'PPT', 'ODP']
-
-        if input_format in image_formats and output_format in image_formats:
-            return 'image'
-        if input_format in audio_formats and output_format in audio_formats:
-            return 'audio'
-        if input_format in video_formats and output_format in video_formats:
-            return 'video'
-        if input_format in video_formats and output_format in audio_formats:
-            return 'video_to_audio'
-        if input_format in doc_formats and output_format in doc_formats:
-            return 'document'
-        if input_format in table_formats and output_format in table_formats:
-            return 'table'
-        if input_format in presentation_formats and output_format in presentation_formats:
-            return 'presentation'
-        if (input_format in doc_formats + presentation_formats and output_format in image_formats):
-            return 'doc_to_image'
-        return 'unknown'
+        return get_converter_type(input_format, output_format)
 
     # ==================== НОВАЯ ФУНКЦИЯ КОНВЕРТАЦИИ ====================
 
     def start_conversion_process(self):
-        # Запускает процесс конвертации
-        if not self.current_file_path:
+        # Ставит выбранные файлы в очередь конвертации
+        if not self.current_files:
             QMessageBox.warning(self, "Ошибка", "Сначала выберите файл!")
             return
 
-        if not self.ex_format:
+        if not self.common_output_formats():
             QMessageBox.warning(self, "Ошибка", "Не удалось определить формат файла!")
             return
 
         output_format = self.selected_file_extension.currentText()
-        if not output_format or output_format in ["Выберите файл", "Неизвестный формат"]:
+        if not output_format or output_format in ["Выберите файл", "Неизвестный формат", "Нет общего формата"]:
             QMessageBox.warning(self, "Ошибка", "Выберите формат для конвертации!")
             return
 
-        # Определяем тип конвертации
-        conv_type = self.get_converter_type(self.ex_format, output_format)
-        if conv_type == 'unknown':
-            QMessageBox.warning(self, "Ошибка",
-                                f"Конвертация из .{self.ex_format} в .{output_format} не поддерживается!")
+        # Функцию конвертации определяем для каждого файла: форматы входов могут различаться
+        conversions = []
+        for input_path in self.current_files:
+            input_format = os.path.basename(input_path).split('.')[-1].upper()
+            conversion_func, error = self.resolve_conversion(input_format, output_format)
+            if error:
+                QMessageBox.warning(self, "Ошибка", f"{os.path.basename(input_path)}: {error}")
+                return
+            conversions.append((input_path, conversion_func))
+
+        save_paths = self.ask_save_paths(output_format)
+        if not save_paths:  # Пользователь отменил
             return
 
+        # Начинается новый набор заданий: убираем из списка завершенные строки
+        if not self.has_active_jobs():
+            self.clear_finished_jobs()
+        for (input_path, conversion_func), save_path in zip(conversions, save_paths):
+            self.add_job(ConversionJob(input_path, output_format, conversion_func, save_path))
+
+    def resolve_conversion(self, input_format, output_format):
+        # Возвращает (функция, None) или (None, текст ошибки)
+        # Определяем тип конвертации; без прямого конвертера пробуем цепочку
+        conv_type = self.get_converter_type(input_format, output_format)
+        if conv_type == 'unknown' and plan(input_format, output_format):
+            conv_type = 'chain'
+        if conv_type == 'unknown':
+            return None, f"Конвертация из .{input_format} в .{output_format} не поддерживается!"
+
         # Определяем функцию конвертации
-        conversion_func = self.select_conversion_function(conv_type)
+        if conv_type == 'chain':
+            conversion_func = convert_via_plan
+        else:
+            conversion_func = self.select_conversion_function(conv_type)
         if not conversion_func:
-            QMessageBox.warning(self, "Ошибка",
-                                f"Для конвертации типа '{conv_type}' нет функции!")
-            return
-
-        # Спрашиваем куда сохранить файл
-        base_name = Path(self.current_file_path).stem
-        default_name = f"{base_name}_converted.{output_format.lower()}"
-
-        save_path, _ = QFileDialog.getSaveFileName(
-            self,
-            "Сохранить файл как",
-            os.path.join(os.path.dirname(self.current_file_path), default_name),
-            f"{output_format} файлы (*.{output_format.lower()})"
-        )
+            return None, f"Для конвертации типа '{conv_type}' нет функции!"
+        return conversion_func, None
 
-        if not save_path:  # Пользователь отменил
-            return
+    def ask_save_paths(self, output_format):
+        extension = output_format.lower()
+        if len(self.current_files) == 1:
+            # Спрашиваем куда сохранить файл
+            base_name = Path(self.current_file_path).stem
+            default_name = f"{base_name}_converted.{extension}"
 
-        # Блокируем кнопки на время конвертации
-        self.set_buttons_enabled(False)
+            save_path, _ = QFileDialog.getSaveFileName(
+                self,
+                "Сохранить файл как",
+                os.path.join(os.path.dirname(self.current_file_path), default_name),
+                f"{output_format} файлы (*.{extension})"
+            )
+            return [save_path] if save_path else []
 
-        # Запускаем конвертацию в отдельном потоке
-        self.conversion_thread = ConversionThread(
-            self.current_file_path,
-            output_format,
-            conversion_func,
-            save_path
+        # Для нескольких файлов — только папка, имена строятся по исходным так же, как в пакетном режиме:
+        # совпавшие имена не перезаписывают друг друга
+        folder = QFileDialog.getExistingDirectory(
+            self,
+            "Папка для сохранения",
+            os.path.dirname(self.current_file_path),
         )
-
-        self.conversion_thread.progress.connect(self.update_progress_bar)
-        self.conversion_thread.finished.connect(self.on_conversion_finished)
-        self.conversion_thread.error.connect(self.on_conversion_error)
-
-        self.conversion_thread.start()
+        if not folder:
+            return []
+        output_paths = build_output_paths(self.current_files, output_format, folder)
+        for save_path in output_paths.values():
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        return [output_paths[input_path] for input_path in self.current_files]
+
+    def add_job(self, job):
+        # Строка задания в списке и запуск в пуле; сверх лимита пула задание ждет в очереди
+        widget = JobWidget(job)
+        item = QListWidgetItem(self.jobs_list)
+        item.setSizeHint(widget.sizeHint())
+        self.jobs_list.setItemWidget(item, widget)
+        widget.item = item
+        widget.state = 'queued'
+        self.jobs[job] = widget
+        self.batch.append(job)
+
+        widget.cancel_requested.connect(partial(self.cancel_job, job))
+        job.signals.progress.connect(partial(self.on_job_progress, job))
+        job.signals.status.connect(widget.set_status)
+        job.signals.finished.connect(partial(self.on_job_finished, job))
+        job.signals.error.connect(partial(self.on_job_error, job))
+        job.signals.cancelled.connect(partial(self.on_job_cancelled, job))
+
+        self.pool.start(job)
+        self.update_overall_progress()
 
     def select_conversion_function(self, conv_type):
         # Выбирает функцию конвертации по типу
-        func_map = {
-            'image': convert_image_pillow,
-            'audio': convert_audio_pydub,
-            'video': convert_video_moviepy,
-            'video_to_audio': extract_audio_from_video_moviepy,
-            'document': convert_document_pypandoc,
-            'table': convert_table_pandas,
-            'doc_to_image': self.select_doc_to_image_function,
-        }
-
-        func = func_map.get(conv_type)
-        if conv_type == 'doc_to_image':
-            return self.select_doc_to_image_function
-        return func
-
-    def select_doc_to_image_function(self, input_path, output_path):
-        # Выбирает функцию конвертации документа в изображение
-        input_ext = Path(input_path).suffix.lower()
-
-        if input_ext == '.pdf':
-            convert_pdf_to_image_pdf2image(input_path, output_path)
-        elif input_ext == '.docx':
-            convert_docx_to_image(input_path, output_path)
+        return select_conversion_function(conv_type)
+
+    def cancel_job(self, job):
+        widget = self.jobs[job]
+        if widget.state not in ('queued', 'running'):
+            return
+        # Еще не начатое задание просто убираем из очереди пула
+        if self.pool.tryTake(job):
+            self.on_job_cancelled(job)
         else:
-            raise ValueError(f"Конвертация {input_ext} в изображение не поддерживается")
+            job.cancel()
+            widget.set_done("Отмена…")
 
-    def update_progress_bar(self, value):
-        # Обновляет прогресс-бар
-        self.download_bar.setValue(value)
+    def on_job_progress(self, job, value):
+        widget = self.jobs[job]
+        if widget.state == 'queued':
+            widget.state = 'running'
+        widget.set_progress(value)
+        self.update_overall_progress()
 
-    def on_conversion_finished(self, output_path):
+    def on_job_finished(self, job, output_path):
         # Обработка успешного завершения конвертации
-        self.set_buttons_enabled(True)
-        self.download_bar.setValue(100)
-
-        # Спрашиваем, открыть ли папку с файлом
-        reply = QMessageBox.question(
-            self,
-            "Конвертация завершена",
-            f"Файл успешно сохранен:\n{output_path}\n\nОткрыть папку с файлом?",
-            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
-        )
-
-        if reply == QMessageBox.StandardButton.Yes:
-            self.open_file_in_explorer(output_path)
+        widget = self.jobs[job]
+        widget.state = 'ok'
+        widget.set_progress(100)
+        widget.set_done("Готово", output_path)
+        single = len(self.batch) == 1
+        self.on_job_done()
+
+        if single:
+            # Одиночная конвертация: как раньше, предлагаем открыть папку
+            reply = QMessageBox.question(
+                self,
+                "Конвертация завершена",
+                f"Файл успешно сохранен:\n{output_path}\n\nОткрыть папку с файлом?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            )
 
-        # Сбрасываем прогресс-бар через 2 секунды
-        QApplication.processEvents()
-        import time
-        time.sleep(2)
-        self.download_bar.setValue(0)
+            if reply == QMessageBox.StandardButton.Yes:
+                self.open_file_in_explorer(output_path)
 
-    def on_conversion_error(self, error_message):
+    def on_job_error(self, job, error_message):
         # Обработка ошибки конвертации
-        self.set_buttons_enabled(True)
+        widget = self.jobs[job]
+        widget.state = 'error'
+        widget.set_done("Ошибка", error_message[:500])
+        single = len(self.batch) == 1
+        self.on_job_done()
+
+        if single:
+            QMessageBox.critical(self, "Ошибка конвертации",
+                                 f"Произошла ошибка:\n\n{error_message[:500]}...")
+
+    def on_job_cancelled(self, job):
+        widget = self.jobs[job]
+        widget.state = 'cancelled'
+        widget.set_done("Отменено")
+        self.on_job_done()
+
+    def on_job_done(self):
+        self.update_overall_progress()
+        if self.has_active_jobs():
+            return
+        # Итог набора на общем прогресс-баре, сброс — по таймеру, без блокировки интерфейса
+        states = [self.jobs[job].state for job in self.batch]
+        self.download_bar.setValue(100)
+        self.download_bar.setFormat(
+            f"Готово: {states.count('ok')}, ошибок: {states.count('error')}, "
+            f"отменено: {states.count('cancelled')}")
+        self.batch = []
+        QTimer.singleShot(RESET_DELAY_MS, self.reset_progress)
+
+    def update_overall_progress(self):
+        # Общий прогресс — среднее по заданиям текущего набора, кроме отмененных
+        widgets = [self.jobs[job] for job in self.batch if self.jobs[job].state != 'cancelled']
+        if not widgets or not self.has_active_jobs():
+            return
+        done = sum(widget.state in ('ok', 'error') for widget in widgets)
+        self.download_bar.setValue(sum(widget.bar.value() for widget in widgets) // len(widgets))
+        self.download_bar.setFormat(f"%p% — {done}/{len(widgets)}")
+
+    def reset_progress(self):
+        # За время таймера мог начаться новый набор — тогда бар уже показывает его
+        if self.has_active_jobs():
+            return
         self.download_bar.setValue(0)
+        self.download_bar.setFormat("%p%")
 
-        QMessageBox.critical(self, "Ошибка конвертации",
-                             f"Произошла ошибка:\n\n{error_message[:500]}...")
+    def has_active_jobs(self):
+        return any(widget.state in ('queued', 'running') for widget in self.jobs.values())
 
-    def set_buttons_enabled(self, enabled):
-        # Включает/выключает кнопки
-        self.upload_button.setEnabled(enabled)
-        self.dowlnload_button.setEnabled(enabled)
-        self.selected_file_extension.setEnabled(enabled)
-        self.rd_show_off_ex.setEnabled(enabled)
+    def clear_finished_jobs(self):
+        for job, widget in list(self.jobs.items()):
+            if widget.state not in ('queued', 'running'):
+                self.jobs_list.takeItem(self.jobs_list.row(widget.item))
+                del self.jobs[job]
 
     def open_file_in_explorer(self, file_path):
         # Открывает папку с файлом в проводнике
@@ -568,7 +561,7 @@ class FileConverter(QMainWindow):
 
     def closeEvent(self, event):
         # Обработка закрытия окна
-        if self.conversion_thread and self.conversion_thread.isRunning():
+        if self.has_active_jobs():
             reply = QMessageBox.question(
                 self,
                 "Конвертация выполняется",
@@ -577,8 +570,12 @@ class FileConverter(QMainWindow):
             )
 
             if reply == QMessageBox.StandardButton.Yes:
-                self.conversion_thread.terminate()
-                self.conversion_thread.wait()
+                # Очередь сбрасываем, запущенные задания отменяем кооперативно:
+                # они завершают подпроцессы и удаляют недописанные файлы сами
+                self.pool.clear()
+                for job in self.jobs:
+                    job.cancel()
+                self.pool.waitForDone()
                 event.accept()
             else:
                 event.ignore()
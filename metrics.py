@@ -0,0 +1,306 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+from cancel import ConversionCancelled, atomic_output
+
+try:
+    import resource
+except ImportError:
+    # Windows: пиковую память не замеряем
+    resource = None
+
+
+# ==================== МЕТРИКИ КОНВЕРТАЦИЙ ====================
+# Каждая конвертация замеряется целиком (ConversionMetrics): время этапов из ProgressReporter.stage,
+# байты на входе и выходе, процессорное время процесса и его подпроцессов (ffmpeg, pandoc,
+# LibreOffice), пиковая память. Замер идет там, где выполняется конвертация (в воркере),
+# а в главный процесс приходит словарем вместе с результатом. Там record_result пишет его
+# в JSON-лог (логгер 'konvertor.metrics') и в счетчики METRICS, которые отдаются в текстовом
+# формате Prometheus — файлом (write_prometheus) или по HTTP (serve_prometheus)
+
+logger = logging.getLogger('konvertor.metrics')
+
+# Папка для .prof-файлов cProfile; переменная окружения наследуется воркерами пула
+PROFILE_DIR_ENV = 'KONVERTOR_PROFILE_DIR'
+# JSON-лог и файл метрик для GUI (см. configure_from_env)
+LOG_JSON_ENV = 'KONVERTOR_LOG_JSON'
+METRICS_FILE_ENV = 'KONVERTOR_METRICS_FILE'
+
+# Границы корзин гистограммы длительности конвертации, с
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# Имя → (тип, описание)
+METRIC_DEFINITIONS = {
+    'konvertor_conversions_total': ('counter', "Конвертации по типу, статусу и кэшу"),
+    'konvertor_conversion_seconds': ('histogram', "Длительность конвертации"),
+    'konvertor_stage_seconds_total': ('counter', "Время этапов конвертации"),
+    'konvertor_input_bytes_total': ('counter', "Прочитано байт исходных файлов"),
+    'konvertor_output_bytes_total': ('counter', "Записано байт результатов"),
+    'konvertor_cpu_seconds_total': ('counter', "Процессорное время конвертера (self) и его подпроцессов (children)"),
+    'konvertor_peak_rss_bytes': ('gauge', "Пиковая память процесса-конвертера (self) и самого тяжелого подпроцесса"),
+}
+
+
+def conversion_type(input_path, output_path):
+    from registry import find_converter, format_of
+
+    entry = find_converter(format_of(input_path), format_of(output_path))
+    return entry.conv_type if entry else 'chain'
+
+
+def peak_rss_bytes(children=False):
+    # ru_maxrss: в Linux — килобайты, в macOS — байты
+    if resource is None:
+        return None
+    value = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return value if sys.platform == 'darwin' else value * 1024
+
+
+class ConversionMetrics:
+    # Замер одной конвертации: with ConversionMetrics(вход, выход, progress): ...
+    # Процессорное время — разница os.times(), а cProfile в потоке может быть только один,
+    # поэтому если в процессе параллельно идут другие конвертации, measure_process=False
+    # отключает и то и другое; в воркерах пула процессов замер точный.
+    # Пиковая память — максимум процесса за всю жизнь (ru_maxrss не сбрасывается)
+
+    def __init__(self, input_path, output_path, progress=None, profile_dir=None, measure_process=True):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.progress = progress
+        self.measure_process = measure_process
+        self.profile_dir = (profile_dir or os.environ.get(PROFILE_DIR_ENV)) if measure_process else None
+        self.status = 'ok'
+        self.seconds = 0.0
+        self.cpu = None
+        self.profile_path = None
+        self._start = None
+        self._start_times = None
+        self._profiler = None
+
+    @property
+    def started(self):
+        return self._start is not None
+
+    def __enter__(self):
+        if self.profile_dir:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._start_times = os.times()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        if self.measure_process:
+            now = os.times()
+            self.cpu = {field: getattr(now, field) - getattr(self._start_times, field)
+                        for field in ('user', 'system', 'children_user', 'children_system')}
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.profile_path = self.dump_profile()
+        if exc_type is not None:
+            self.status = 'cancelled' if issubclass(exc_type, ConversionCancelled) else 'error'
+        return False
+
+    def dump_profile(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f"{Path(self.input_path).name}.{os.getpid()}.{time.time_ns()}.prof"
+        path = os.path.join(self.profile_dir, name)
+        self._profiler.dump_stats(path)
+        return path
+
+    def to_dict(self, **extra):
+        # extra — дополнительные поля результата, например method и cache
+        bytes_in = os.path.getsize(self.input_path) if os.path.exists(self.input_path) else 0
+        bytes_out = os.path.getsize(self.output_path) if os.path.exists(self.output_path) else 0
+        data = {
+            'time': time.time(),
+            'pid': os.getpid(),
+            'input': self.input_path,
+            'output': self.output_path,
+            'type': conversion_type(self.input_path, self.output_path),
+            'status': self.status,
+            'seconds': self.seconds,
+            'stages': dict(self.progress.stages) if self.progress is not None else {},
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out if self.status == 'ok' else 0,
+            'cpu': self.cpu,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'children_peak_rss_bytes': peak_rss_bytes(children=True),
+            'profile': self.profile_path,
+        }
+        data.update(extra)
+        return data
+
+
+# ==================== СЧЕТЧИКИ И ЭКСПОРТ ====================
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    # Счетчики по именам из METRIC_DEFINITIONS; метки — кортеж пар (имя, значение)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def _add(self, name, labels, value):
+        series = self.series.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def _max(self, name, labels, value):
+        series = self.series.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = max(series.get(key, 0), value)
+
+    def _observe(self, name, labels, value):
+        # Гистограмма: накопительные счетчики корзин, сумма и количество
+        series = self.series.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        buckets, total, count = series.get(key, ([0] * len(DURATION_BUCKETS), 0.0, 0))
+        buckets = [bucket + (value <= bound) for bucket, bound in zip(buckets, DURATION_BUCKETS)]
+        series[key] = (buckets, total + value, count + 1)
+
+    def record(self, data):
+        labels = {'type': data.get('type') or 'unknown'}
+        with self.lock:
+            self._add('konvertor_conversions_total',
+                      dict(labels, status=data['status'], cache=data.get('cache') or 'none'), 1)
+            self._observe('konvertor_conversion_seconds', labels, data['seconds'])
+            for stage, seconds in (data.get('stages') or {}).items():
+                self._add('konvertor_stage_seconds_total', dict(labels, stage=stage), seconds)
+            self._add('konvertor_input_bytes_total', labels, data.get('bytes_in') or 0)
+            self._add('konvertor_output_bytes_total', labels, data.get('bytes_out') or 0)
+            cpu = data.get('cpu')
+            if cpu:
+                for process, prefix in (('self', ''), ('children', 'children_')):
+                    for mode in ('user', 'system'):
+                        self._add('konvertor_cpu_seconds_total', dict(labels, process=process, mode=mode),
+                                  cpu[prefix + mode])
+            for process, key in (('self', 'peak_rss_bytes'), ('children', 'children_peak_rss_bytes')):
+                if data.get(key):
+                    self._max('konvertor_peak_rss_bytes', {'process': process}, data[key])
+
+    def render(self):
+        # Текстовый формат Prometheus (exposition format 0.0.4)
+        lines = []
+        with self.lock:
+            for name, (kind, help_text) in METRIC_DEFINITIONS.items():
+                series = self.series.get(name)
+                if not series:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series.items()):
+                    if kind != 'histogram':
+                        lines.append(f"{name}{format_labels(labels)} {format_number(value)}")
+                        continue
+                    buckets, total, count = value
+                    for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {bucket}")
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_number(total)}")
+                    lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+
+
+def record_result(result, registry=None):
+    # Результат конвертации (batch.convert_file и т.п.) → счетчики и строка JSON-лога
+    data = result.get('metrics')
+    if not data:
+        return
+    (registry or METRICS).record(data)
+    logger.info(json.dumps(data, ensure_ascii=False))
+
+
+def write_prometheus(path, registry=None):
+    # Файл для textfile-коллектора node_exporter; пишется атомарно
+    text = (registry or METRICS).render()
+    with atomic_output(path) as temp_path:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def serve_prometheus(address, registry=None):
+    # HTTP-эндпоинт /metrics в фоновом потоке; address — (host, port). Возвращает сервер
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    registry = registry or METRICS
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(address, MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ==================== НАСТРОЙКА ====================
+
+def configure_json_log(target):
+    # target — путь к файлу или '-' (stderr); одна строка JSON на конвертацию
+    handler = logging.StreamHandler(sys.stderr) if target == '-' else logging.FileHandler(target, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def enable_profiling(directory):
+    # Через окружение, чтобы профилировали и воркеры, запущенные после этого вызова
+    os.makedirs(directory, exist_ok=True)
+    os.environ[PROFILE_DIR_ENV] = os.path.abspath(directory)
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument('--log-json', metavar='ФАЙЛ',
+                        help="JSON-лог метрик каждой конвертации ('-' — в stderr)")
+    parser.add_argument('--cprofile', metavar='ПАПКА',
+                        help="Профилировать каждую конвертацию cProfile и сохранять .prof в папку")
+
+
+def apply_metrics_arguments(args):
+    if args.log_json:
+        configure_json_log(args.log_json)
+    if args.cprofile:
+        enable_profiling(args.cprofile)
+
+
+def configure_from_env():
+    # Для GUI: KONVERTOR_LOG_JSON, KONVERTOR_PROFILE_DIR; путь из KONVERTOR_METRICS_FILE
+    # возвращается, чтобы обновлять файл после каждой конвертации
+    if os.environ.get(LOG_JSON_ENV):
+        configure_json_log(os.environ[LOG_JSON_ENV])
+    return os.environ.get(METRICS_FILE_ENV)
@@ -0,0 +1,251 @@
+import os
+
+
+# ==================== НАСТРОЙКИ КОДИРОВАНИЯ ====================
+# Все конвертеры принимают options=None — словарь настроек.
+# Каждый конвертер берет из него только понятные ему ключи
+
+PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast',
+           'medium', 'slow', 'slower', 'veryslow']
+
+# Именованные профили скорость/качество
+PROFILES = {
+    'fastest': {'preset': 'ultrafast', 'crf': 28, 'audio_bitrate': '128k'},
+    'fast': {'preset': 'veryfast', 'crf': 25, 'audio_bitrate': '160k'},
+    'balanced': {'preset': 'medium', 'crf': 23, 'audio_bitrate': '192k'},
+    'quality': {'preset': 'slow', 'crf': 18, 'audio_bitrate': '256k'},
+    'smallest': {'preset': 'veryslow', 'crf': 30, 'audio_bitrate': '96k'},
+}
+DEFAULT_PROFILE = 'balanced'
+
+# Видеокодек moviepy/ffmpeg по расширению (поддерживает preset и crf там, где это возможно)
+VIDEO_CODECS = {
+    'mp4': 'libx264', 'm4v': 'libx264', 'mov': 'libx264', 'mkv': 'libx264',
+    'avi': 'mpeg4', 'flv': 'libx264', '3gp': 'libx264',
+    'webm': 'libvpx-vp9', 'wmv': 'wmv2',
+}
+
+# Аудиокодек и формат ffmpeg для аудиофайлов
+AUDIO_CODECS = {
+    'mp3': 'libmp3lame', 'ogg': 'libvorbis', 'aac': 'aac', 'm4a': 'aac',
+    'flac': 'flac', 'wav': 'pcm_s16le', 'aiff': 'pcm_s16be', 'wma': 'wmav2', 'amr': 'libopencore_amrnb',
+}
+AUDIO_FORMATS = {'aac': 'adts', 'm4a': 'ipod', 'wma': 'asf'}
+
+# Форматы без потерь: битрейт к ним не применяется
+LOSSLESS_AUDIO = ['flac', 'wav', 'aiff']
+# Форматы с единственно допустимыми частотой и каналами: AMR-NB — только 8 кГц моно
+FIXED_AUDIO_FORMATS = {'amr': {'sample_rate': 8000, 'channels': 1}}
+
+# Звуковая дорожка при перекодировании видео
+VIDEO_AUDIO_CODECS = {
+    'mp4': 'aac', 'm4v': 'aac', 'mov': 'aac', 'mkv': 'aac', 'flv': 'aac', '3gp': 'aac',
+    'avi': 'libmp3lame', 'webm': 'libvorbis', 'wmv': 'wmav2',
+}
+
+
+def resolve_options(options=None):
+    # Профиль + явные переопределения. По умолчанию используем все ядра
+    options = dict(options or {})
+    profile = options.get('profile') or DEFAULT_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"Неизвестный профиль: {profile}. Доступны: {', '.join(PROFILES)}")
+
+    resolved = {'threads': os.cpu_count() or 1}
+    resolved.update(PROFILES[profile])
+    resolved.update({key: value for key, value in options.items() if value is not None})
+
+    if resolved.get('preset') not in PRESETS:
+        raise ValueError(f"Неизвестный пресет: {resolved.get('preset')}")
+    return resolved
+
+
+def moviepy_video_kwargs(output_ext, options=None):
+    # Аргументы для clip.write_videofile
+    options = resolve_options(options)
+    codec = options.get('video_codec') or VIDEO_CODECS.get(output_ext)
+    kwargs = {
+        'threads': options['threads'],
+        'preset': options['preset'],
+    }
+    if codec:
+        kwargs['codec'] = codec
+    if options.get('audio_codec'):
+        kwargs['audio_codec'] = options['audio_codec']
+    kwargs['audio_bitrate'] = options['audio_bitrate']
+
+    # Битрейт важнее CRF; CRF понимают только x264/x265/vpx
+    ffmpeg_params = []
+    if options.get('bitrate'):
+        kwargs['bitrate'] = options['bitrate']
+    elif codec in ('libx264', 'libx265'):
+        ffmpeg_params += ['-crf', str(options['crf'])]
+    elif codec in ('libvpx', 'libvpx-vp9'):
+        ffmpeg_params += ['-crf', str(options['crf']), '-b:v', '0']
+    if ffmpeg_params:
+        kwargs['ffmpeg_params'] = ffmpeg_params
+    return kwargs
+
+
+def moviepy_audio_kwargs(output_ext, options=None):
+    # Аргументы для audio.write_audiofile при извлечении звука из видео
+    options = resolve_options(options)
+    kwargs = {'codec': options.get('audio_codec') or AUDIO_CODECS.get(output_ext)}
+    if output_ext not in LOSSLESS_AUDIO:
+        kwargs['bitrate'] = options['audio_bitrate']
+    kwargs['ffmpeg_params'] = ['-threads', str(options['threads'])] + audio_format_args(options, output_ext)
+    return kwargs
+
+
+def audio_format_args(options, output_ext=None):
+    # -ar/-ac: частота дискретизации и число каналов, если заданы (иначе как в исходнике).
+    # Для FIXED_AUDIO_FORMATS они обязательны, другие значения — ошибка
+    args = []
+    fixed = FIXED_AUDIO_FORMATS.get(output_ext)
+    if fixed:
+        for key, value in fixed.items():
+            if options.get(key) and int(options[key]) != value:
+                raise ValueError(f"{output_ext.upper()} поддерживает только {key}={value}")
+        options = {**options, **fixed}
+    sample_rate = options.get('sample_rate')
+    if sample_rate:
+        if int(sample_rate) <= 0:
+            raise ValueError(f"Неверная частота дискретизации: {sample_rate}")
+        args += ['-ar', str(int(sample_rate))]
+    channels = options.get('channels')
+    if channels:
+        if not 1 <= int(channels) <= 8:
+            raise ValueError(f"Неверное число каналов: {channels}")
+        args += ['-ac', str(int(channels))]
+    return args
+
+
+def ffmpeg_audio_args(output_ext, options=None):
+    # Аргументы ffmpeg для кодирования звука: кодек и формат по расширению,
+    # битрейт из профиля (кроме форматов без потерь), частота и каналы
+    options = resolve_options(options)
+    args = ['-vn']
+    codec = options.get('audio_codec') or AUDIO_CODECS.get(output_ext)
+    if codec:
+        args += ['-c:a', codec]
+    if output_ext not in LOSSLESS_AUDIO:
+        args += ['-b:a', options['audio_bitrate']]
+    args += audio_format_args(options, output_ext)
+    return args + ['-threads', str(options['threads']), '-f', AUDIO_FORMATS.get(output_ext, output_ext)]
+
+
+def ffmpeg_video_args(output_ext, options=None):
+    # Аргументы ffmpeg для перекодирования видео — те же настройки, что у moviepy_video_kwargs
+    kwargs = moviepy_video_kwargs(output_ext, options)
+    codec = kwargs.get('codec')
+    args = []
+    if codec:
+        args += ['-c:v', codec]
+        if codec in ('libx264', 'libx265'):
+            args += ['-preset', kwargs['preset'], '-pix_fmt', 'yuv420p']
+    if kwargs.get('bitrate'):
+        args += ['-b:v', kwargs['bitrate']]
+    args += kwargs.get('ffmpeg_params', [])
+    audio_codec = kwargs.get('audio_codec') or VIDEO_AUDIO_CODECS.get(output_ext)
+    if audio_codec:
+        args += ['-c:a', audio_codec]
+    args += ['-b:a', kwargs['audio_bitrate'], '-threads', str(kwargs['threads'])]
+    return args
+
+
+# Настройки кодировщиков Pillow по профилю: чем медленнее профиль, тем сильнее сжатие
+IMAGE_PROFILES = {
+    'fastest': {
+        'jpeg': {'quality': 85},
+        'png': {'compress_level': 1},
+        'webp': {'quality': 80, 'method': 0},
+        'tiff': {'compression': 'raw'},
+    },
+    'fast': {
+        'jpeg': {'quality': 85},
+        'png': {'compress_level': 3},
+        'webp': {'quality': 80, 'method': 2},
+        'tiff': {'compression': 'tiff_lzw'},
+    },
+    'balanced': {
+        'jpeg': {'quality': 90, 'optimize': True},
+        'png': {'compress_level': 6},
+        'webp': {'quality': 85, 'method': 4},
+        'tiff': {'compression': 'tiff_lzw'},
+    },
+    'quality': {
+        'jpeg': {'quality': 95, 'optimize': True, 'subsampling': 0},
+        'png': {'compress_level': 6},
+        'webp': {'quality': 95, 'method': 6},
+        'tiff': {'compression': 'tiff_lzw'},
+    },
+    'smallest': {
+        'jpeg': {'quality': 80, 'optimize': True, 'progressive': True},
+        'png': {'optimize': True},
+        'webp': {'quality': 75, 'method': 6},
+        'tiff': {'compression': 'tiff_adobe_deflate'},
+    },
+}
+
+# Расширение → ключ в IMAGE_PROFILES
+IMAGE_ENCODERS = {'jpg': 'jpeg', 'jpeg': 'jpeg', 'png': 'png', 'webp': 'webp', 'tiff': 'tiff', 'tif': 'tiff'}
+
+
+def pillow_save_kwargs(output_ext, options=None):
+    # Аргументы для Image.save по профилю; options['quality'] переопределяет качество
+    options = options or {}
+    profile = options.get('profile') or DEFAULT_PROFILE
+    if profile not in IMAGE_PROFILES:
+        raise ValueError(f"Неизвестный профиль: {profile}. Доступны: {', '.join(IMAGE_PROFILES)}")
+
+    encoder = IMAGE_ENCODERS.get(output_ext)
+    kwargs = dict(IMAGE_PROFILES[profile].get(encoder, {}))
+    if options.get('quality') is not None and encoder in ('jpeg', 'webp'):
+        kwargs['quality'] = options['quality']
+    return kwargs
+
+
+# ==================== АРГУМЕНТЫ КОМАНДНОЙ СТРОКИ ====================
+
+def add_option_arguments(parser):
+    # Общие для CLI аргументы настроек конвертации
+    parser.add_argument('--profile', choices=list(PROFILES), help="Профиль скорость/качество")
+    parser.add_argument('--threads', type=int, help="Потоки кодировщика (по умолчанию — все ядра)")
+    parser.add_argument('--preset', choices=PRESETS, help="Пресет кодировщика видео")
+    parser.add_argument('--crf', type=int, help="CRF для видео (меньше — лучше качество)")
+    parser.add_argument('--bitrate', help="Битрейт видео, например 4M")
+    parser.add_argument('--audio-codec', help="Аудиокодек, например aac")
+    parser.add_argument('--audio-bitrate', help="Битрейт аудио, например 192k")
+    parser.add_argument('--sample-rate', type=int, help="Частота дискретизации аудио, Гц (например 44100)")
+    parser.add_argument('--channels', type=int, help="Число каналов аудио (1 — моно, 2 — стерео)")
+    parser.add_argument('--quality', type=int, help="Качество JPEG/WEBP (1–100)")
+    parser.add_argument('--max-size', type=int, help="Вписать изображение или кадр видео в квадрат NxN пикселей")
+    parser.add_argument('--pages', help="Страницы PDF/DOCX: all, N или A-B (по умолчанию первая)")
+    parser.add_argument('--dpi', type=int, help="Разрешение растеризации PDF")
+    parser.add_argument('--compression-level', type=int, choices=range(10), metavar='0-9',
+                        help="Уровень сжатия архивов (0 — без сжатия)")
+    parser.add_argument('--no-copy', action='store_true',
+                        help="Всегда перекодировать видео, без переупаковки потоков")
+
+
+def options_from_args(args):
+    # Словарь настроек из разобранных аргументов; None, если ничего не задано
+    options = {
+        'profile': args.profile,
+        'threads': args.threads,
+        'preset': args.preset,
+        'crf': args.crf,
+        'bitrate': args.bitrate,
+        'audio_codec': args.audio_codec,
+        'audio_bitrate': args.audio_bitrate,
+        'sample_rate': args.sample_rate,
+        'channels': args.channels,
+        'quality': args.quality,
+        'max_size': args.max_size,
+        'pages': args.pages,
+        'dpi': args.dpi,
+        'compression_level': args.compression_level,
+    }
+    if args.no_copy:
+        options['copy'] = False
+    return {key: value for key, value in options.items() if value is not None} or None
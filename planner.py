@@ -0,0 +1,280 @@
+import heapq
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from cache import DEFAULT_CACHE_DIR
+from converters import fast_temp_dir
+from progress import ProgressReporter, ensure_progress
+from registry import REGISTRY, find_converter, format_of, normalize_format
+
+
+# ==================== ПЛАНИРОВЩИК ЦЕПОЧЕК КОНВЕРТАЦИЙ ====================
+# Форматы — вершины графа, конвертеры из реестра — ребра.
+# Вес ребра — измеренное время конвертации (секунд на МБ входа шага) плюс накладные расходы на шаг.
+# Размер входа каждого шага оценивается по измеренному отношению размеров выхода и входа предыдущих шагов
+
+# Начальные оценки, секунд на МБ, пока нет замеров
+DEFAULT_COSTS = {
+    'image': 0.05,
+    'archive': 0.1,
+    'table': 0.2,
+    'audio': 0.5,
+    'video_to_audio': 1.0,
+    'document': 1.0,
+    'doc_to_image': 1.0,
+    'office': 3.0,
+    'video': 5.0,
+}
+# Начальные оценки отношения размера выхода к размеру входа; для остальных типов — 1
+DEFAULT_SIZE_RATIOS = {
+    'video_to_audio': 0.1,
+}
+# Какие конвертеры могут продолжать цепочку после шага данного типа. Переход между семействами
+# допустим, только если он сохраняет содержимое: PPTX → PDF → PNG, DOC → DOCX → MD.
+# Кадр из видео (MP4 → GIF → PNG) или таблица, отрендеренная в картинку (CSV → HTML → PDF → WEBP), —
+# уже не конвертация. Многостраничный шаг (doc_to_image) может быть только последним: дальше
+# цепочка передала бы лишь первую страницу
+CHAIN_FOLLOWERS = {
+    'image': {'image'},
+    'audio': {'audio'},
+    'video': {'video', 'video_to_audio'},
+    'video_to_audio': {'audio'},
+    'document': {'document', 'doc_to_image'},
+    'office': {'office', 'document', 'doc_to_image'},
+    'table': {'table'},
+    'archive': {'archive'},
+}
+# Фиксированная цена каждого шага: при равной скорости выбираем более короткую цепочку
+STEP_OVERHEAD = 0.1
+MAX_HOPS = 4
+# Вес нового замера в скользящем среднем
+SMOOTHING = 0.3
+
+log = logging.getLogger('konvertor.planner')
+
+
+def default_costs_file():
+    # Рядом с папкой кэша, но не внутри: кэш считает, вытесняет и очищает все файлы своей папки
+    cache_dir = os.path.abspath(os.environ.get('KONVERTOR_CACHE_DIR', DEFAULT_CACHE_DIR))
+    return os.path.join(os.path.dirname(cache_dir), f"{os.path.basename(cache_dir)}-costs.json")
+
+
+class CostModel:
+    # Измеренная стоимость ребер (вход, выход) и отношение размеров выхода и входа,
+    # хранятся в JSON между запусками
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('KONVERTOR_COSTS_FILE') or default_costs_file()
+        self.costs = {}
+        self.ratios = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if isinstance(data.get('costs'), dict):
+            self.costs = data['costs']
+            self.ratios = data.get('ratios') or {}
+        else:
+            # Старый формат файла — только стоимости
+            self.costs = data
+            self.ratios = {}
+
+    def save(self):
+        # Модель пишут параллельно воркеры пула: у каждого свой временный файл, побеждает последний.
+        # Ошибка записи оценок не должна ломать уже выполненную конвертацию
+        tmp_path = None
+        try:
+            directory = os.path.dirname(self.path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            with self._lock:
+                data = {'costs': dict(self.costs), 'ratios': dict(self.ratios)}
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.costs-', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            tmp_path = None
+        except OSError as e:
+            log.warning("Не удалось сохранить модель стоимости %s: %s", self.path, e)
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def seconds_per_mb(self, input_format, output_format, entry):
+        key = f"{input_format}->{output_format}"
+        if key in self.costs:
+            return self.costs[key]
+        return DEFAULT_COSTS.get(entry.conv_type, 1.0)
+
+    def size_ratio(self, input_format, output_format, entry):
+        key = f"{input_format}->{output_format}"
+        if key in self.ratios:
+            return self.ratios[key]
+        return DEFAULT_SIZE_RATIOS.get(entry.conv_type, 1.0)
+
+    def edge_cost(self, input_format, output_format, entry, size_mb):
+        return STEP_OVERHEAD + self.seconds_per_mb(input_format, output_format, entry) * size_mb
+
+    def record(self, input_format, output_format, seconds, size_bytes, output_bytes=None):
+        # Обновляем скользящие средние по новому замеру
+        size_mb = max(size_bytes / (1024 * 1024), 0.001)
+        measured = max(seconds - STEP_OVERHEAD, 0.0) / size_mb
+        key = f"{input_format}->{output_format}"
+        with self._lock:
+            old = self.costs.get(key)
+            self.costs[key] = measured if old is None else old + SMOOTHING * (measured - old)
+            if output_bytes is not None and size_bytes:
+                ratio = output_bytes / size_bytes
+                old = self.ratios.get(key)
+                self.ratios[key] = ratio if old is None else old + SMOOTHING * (ratio - old)
+
+
+_default_cost_model = None
+
+
+def get_default_cost_model():
+    global _default_cost_model
+    if _default_cost_model is None:
+        _default_cost_model = CostModel()
+    return _default_cost_model
+
+
+# Ребра графа: формат → [(выходной формат, ConverterEntry)]
+EDGES = {}
+for (_source, _target), _entry in REGISTRY.items():
+    EDGES.setdefault(_source, []).append((_target, _entry))
+
+
+def chain_edges(fmt, previous=None):
+    # Ребра, которыми можно продолжить цепочку из формата fmt после шага previous
+    # (ConverterEntry; None — первый шаг, подходит любой конвертер)
+    if previous is not None and 'multipage' in previous.capabilities:
+        return []
+    followers = CHAIN_FOLLOWERS.get(previous.conv_type, ()) if previous is not None else None
+    return [(target, entry) for target, entry in EDGES.get(fmt, [])
+            if followers is None or entry.conv_type in followers]
+
+
+def plan(input_format, output_format, size_bytes=1024 * 1024, cost_model=None, max_hops=MAX_HOPS):
+    # Самая дешевая цепочка (Дейкстра): список шагов (вход, выход, ConverterEntry)
+    # или None, если путь не найден. Вершина — формат вместе с типом последнего шага,
+    # от него зависит, какие конвертеры допустимы дальше
+    input_format = normalize_format(input_format)
+    output_format = normalize_format(output_format)
+    if input_format == output_format:
+        return []
+
+    cost_model = cost_model or get_default_cost_model()
+
+    best = {(input_format, None): 0.0}
+    # (стоимость, счетчик для стабильности, формат, оценка размера входа следующего шага в МБ, шаги)
+    queue = [(0.0, 0, input_format, size_bytes / (1024 * 1024), [])]
+    counter = 1
+    while queue:
+        cost, _, fmt, size_mb, steps = heapq.heappop(queue)
+        if fmt == output_format:
+            return steps
+        previous = steps[-1][2] if steps else None
+        state = (fmt, previous.conv_type if previous else None)
+        if cost > best.get(state, float('inf')) or len(steps) >= max_hops:
+            continue
+        for target, entry in chain_edges(fmt, previous):
+            new_cost = cost + cost_model.edge_cost(fmt, target, entry, size_mb)
+            new_state = (target, entry.conv_type)
+            if new_cost < best.get(new_state, float('inf')):
+                best[new_state] = new_cost
+                new_size_mb = size_mb * cost_model.size_ratio(fmt, target, entry)
+                heapq.heappush(queue, (new_cost, counter, target, new_size_mb, steps + [(fmt, target, entry)]))
+                counter += 1
+    return None
+
+
+def reachable_formats(input_format, max_hops=MAX_HOPS):
+    # Все форматы, в которые можно попасть допустимой цепочкой (для GUI)
+    input_format = normalize_format(input_format)
+    seen = {(input_format, None)}
+    formats = set()
+    frontier = [(input_format, None)]
+    for _ in range(max_hops):
+        next_frontier = []
+        for fmt, previous in frontier:
+            for target, entry in chain_edges(fmt, previous):
+                formats.add(target)
+                if (target, entry.conv_type) not in seen:
+                    seen.add((target, entry.conv_type))
+                    next_frontier.append((target, entry))
+        frontier = next_frontier
+    formats.discard(input_format)
+    return sorted(formats)
+
+
+def describe_plan(steps):
+    if not steps:
+        return ''
+    return ' → '.join([steps[0][0]] + [target for _, target, _ in steps])
+
+
+def convert_via_plan(input_path, output_path, progress=None, options=None, cost_model=None):
+    # Конвертация цепочкой. Промежуточные файлы живут в tmpfs (/dev/shm), если он есть.
+    # Время каждого шага записывается в модель стоимости. Возвращает описание маршрута
+    progress = ensure_progress(progress)
+    cost_model = cost_model or get_default_cost_model()
+
+    input_format = format_of(input_path)
+    output_format = format_of(output_path)
+    steps = plan(input_format, output_format, os.path.getsize(input_path), cost_model)
+    if not steps:
+        # Пустой план — формат не меняется, конвертировать нечего
+        raise ValueError(f"Не найдено цепочки конвертации {input_format} → {output_format}")
+
+    progress.set_total(len(steps), 'steps')
+    with tempfile.TemporaryDirectory(dir=fast_temp_dir()) as work_dir:
+        current = input_path
+        for index, (source, target, entry) in enumerate(steps):
+            last = index == len(steps) - 1
+            destination = output_path if last else os.path.join(work_dir, f"step{index}.{target.lower()}")
+
+            # Прогресс шага пересчитываем в долю общей цепочки
+            step_progress = ProgressReporter(
+                callback=lambda info, step=index: progress.update(step + (info['percent'] or 0) / 100),
+                min_interval=0,
+                cancel_token=progress.cancel_token,
+                stages=progress.stages,
+            )
+            size = os.path.getsize(current)
+            start = time.perf_counter()
+            entry.func(current, destination, progress=step_progress, options=options)
+            # Многостраничный последний шаг пишет файлы страниц, а не destination
+            output_size = os.path.getsize(destination) if os.path.exists(destination) else None
+            cost_model.record(source, target, time.perf_counter() - start, size, output_size)
+
+            # Промежуточный результат предыдущего шага больше не нужен
+            if current != input_path:
+                os.remove(current)
+            current = destination
+
+    cost_model.save()
+    progress.finish()
+    return describe_plan(steps)
+
+
+def resolve_conversion_function(input_path, output_path):
+    # Прямой конвертер из реестра, иначе цепочка через планировщик.
+    # Одинаковые форматы дают пустой план — это не конвертация
+    entry = find_converter(format_of(input_path), format_of(output_path))
+    if entry:
+        return entry.func
+    if plan(format_of(input_path), format_of(output_path)):
+        return convert_via_plan
+    return None
@@ -0,0 +1,153 @@
+import time
+from contextlib import contextmanager
+
+# Подписи единиц измерения для отображения
+UNIT_LABELS = {'items': 'шт.', 'frames': 'кадр.', 'pages': 'стр.', 'seconds': 'с', 'steps': 'шаг.'}
+
+
+# ==================== ПРОГРЕСС КОНВЕРТАЦИИ ====================
+
+def format_size(value, unit):
+    # Человекочитаемое значение для байт, для остальных единиц — как есть
+    if unit != 'bytes':
+        return f"{value:.0f}"
+    for suffix in ['Б', 'КБ', 'МБ', 'ГБ']:
+        if value < 1024 or suffix == 'ГБ':
+            return f"{value:.1f} {suffix}"
+        value /= 1024
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return '--:--'
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class ProgressReporter:
+    # Отчет о прогрессе, который ведет сам конвертер:
+    # сколько обработано (байт, кадров, страниц, кусков) из скольких.
+    # callback(info) получает словарь со снимком состояния, вызовы прореживаются по min_interval.
+    # cancel_token (cancel.CancellationToken) проверяется при каждом отчете:
+    # после отмены очередной update/advance выбрасывает ConversionCancelled.
+    # stages — время этапов конвертации (см. stage), общий словарь можно передать дочернему отчету
+
+    def __init__(self, callback=None, total=None, unit='items', min_interval=0.1, cancel_token=None,
+                 stages=None):
+        self.callback = callback
+        self.cancel_token = cancel_token
+        self.stages = stages if stages is not None else {}
+        self.total = total
+        self.unit = unit
+        self.min_interval = min_interval
+        self.done = 0
+        self.start_time = time.monotonic()
+        self.last_emit = 0.0
+
+    def set_total(self, total, unit=None):
+        if unit is not None and unit != self.unit:
+            # Сменилась единица измерения — начинаем отсчет скорости заново
+            self.unit = unit
+            self.done = 0
+            self.start_time = time.monotonic()
+        self.total = total
+        self.emit(force=True)
+
+    def update(self, done):
+        # Абсолютное значение обработанного
+        self.done = done
+        self.emit()
+
+    def advance(self, amount=1):
+        self.done += amount
+        self.emit()
+
+    def finish(self):
+        if self.total is not None:
+            self.done = self.total
+        self.emit(force=True)
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self.start_time
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        percent = None
+        eta = None
+        if self.total:
+            percent = min(100.0, self.done * 100.0 / self.total)
+            if rate > 0:
+                eta = max(0.0, (self.total - self.done) / rate)
+        return {
+            'done': self.done,
+            'total': self.total,
+            'unit': self.unit,
+            'percent': percent,
+            'elapsed': elapsed,
+            'rate': rate,
+            'eta': eta,
+        }
+
+    @contextmanager
+    def stage(self, name):
+        # Замер этапа (decode, transform, encode, ffmpeg, ...) для метрик, см. metrics.py.
+        # Повторные этапы с тем же именем суммируются
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def check(self):
+        # Точка отмены для мест, где нечего сообщать о прогрессе
+        if self.cancel_token is not None:
+            self.cancel_token.check()
+
+    def emit(self, force=False):
+        self.check()
+        if not self.callback:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_emit < self.min_interval:
+            return
+        self.last_emit = now
+        self.callback(self.snapshot())
+
+
+def ensure_progress(progress):
+    # Конвертеры принимают progress=None, тогда отчет просто никуда не уходит
+    return progress if progress is not None else ProgressReporter()
+
+
+def describe_progress(info):
+    # Строка вида "12.0 МБ из 40.0 МБ, 3.1 МБ/с, осталось 00:09"
+    unit = info['unit']
+    done = format_size(info['done'], unit)
+    rate = format_size(info['rate'], unit)
+    unit_label = '' if unit == 'bytes' else f" {UNIT_LABELS.get(unit, unit)}"
+    if info['total']:
+        total = format_size(info['total'], unit)
+        return (f"{done} из {total}{unit_label}, {rate}{unit_label}/с, "
+                f"осталось {format_eta(info['eta'])}")
+    return f"{done}{unit_label}, {rate}{unit_label}/с"
+
+
+def make_moviepy_logger(progress, bar_name='frame_index'):
+    # Логгер proglog для moviepy: пересылает номер кадра (или куска аудио) в ProgressReporter
+    from proglog import ProgressBarLogger
+
+    class MoviepyProgressLogger(ProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            if bar != bar_name or attr != 'index':
+                return
+            total = self.bars[bar].get('total')
+            if total and total != progress.total:
+                progress.set_total(total, 'frames' if bar == 'frame_index' else 'items')
+            progress.update(value)
+
+    return MoviepyProgressLogger()
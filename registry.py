@@ -0,0 +1,140 @@
+from pathlib import Path
+
+from converters import (
+    convert_archive,
+    convert_audio_ffmpeg,
+    convert_doc_to_image,
+    convert_document_pypandoc,
+    convert_image_pillow,
+    convert_office_libreoffice,
+    convert_table_pandas,
+    convert_video_ffmpeg,
+    extract_audio_ffmpeg,
+)
+
+
+# ==================== РЕЕСТР КОНВЕРТЕРОВ ====================
+# Единственный источник правды о том, что во что конвертируется.
+# Строится один раз при импорте; не зависит от GUI
+
+IMAGE_FORMATS = frozenset(['JPG', 'JPEG', 'PNG', 'GIF', 'BMP', 'TIFF', 'WEBP', 'ICO', 'PPM'])
+VIDEO_FORMATS = frozenset(['MP4', 'AVI', 'MKV', 'WEBM', 'MOV', 'WMV', 'FLV', 'M4V', '3GP'])
+AUDIO_FORMATS = frozenset(['MP3', 'WAV', 'FLAC', 'OGG', 'AAC', 'AIFF', 'M4A', 'WMA', 'AMR'])
+# pandoc не читает PDF и старый DOC, поэтому входы и выходы документов различаются
+DOC_INPUT_FORMATS = frozenset(['DOCX', 'HTML', 'HTM', 'TXT', 'MD', 'MARKDOWN', 'RTF', 'EPUB', 'ODT',
+                               'LATEX', 'TEX'])
+DOC_OUTPUT_FORMATS = frozenset(['PDF', 'DOCX', 'HTML', 'TXT', 'MD', 'RTF', 'EPUB', 'ODT'])
+TABLE_INPUT_FORMATS = frozenset(['CSV', 'XLSX', 'XLS', 'JSON', 'XML', 'PARQUET', 'FEATHER', 'ARROW', 'ODS'])
+# XLS pandas записать не может
+TABLE_OUTPUT_FORMATS = frozenset(['CSV', 'XLSX', 'JSON', 'HTML', 'XML', 'PARQUET', 'FEATHER', 'ARROW', 'ODS'])
+RASTER_DOC_FORMATS = frozenset(['PDF', 'DOCX'])
+# Презентации и старый DOC открывает только LibreOffice
+PRESENTATION_FORMATS = frozenset(['PPTX', 'PPT', 'ODP'])
+# GZ/BZ2/XZ — tar со сжатием (или одиночный сжатый файл на входе); RAR только читаем
+ARCHIVE_INPUT_FORMATS = frozenset(['ZIP', 'TAR', 'GZ', 'TGZ', 'BZ2', 'XZ', '7Z', 'RAR'])
+ARCHIVE_OUTPUT_FORMATS = ARCHIVE_INPUT_FORMATS - {'RAR'}
+
+
+class ConverterEntry:
+    # Описание конвертера: тип, функция и возможности
+    # (progress, options, streaming, stream_copy, multipage, animated)
+
+    def __init__(self, conv_type, func, capabilities=()):
+        self.conv_type = conv_type
+        self.func = func
+        self.capabilities = frozenset(capabilities)
+
+    @property
+    def name(self):
+        return self.func.__name__
+
+    def __repr__(self):
+        return f"ConverterEntry({self.conv_type!r}, {self.name})"
+
+
+# Семейства: (тип, входные форматы, выходные форматы, функция, возможности)
+CONVERTER_FAMILIES = [
+    ('image', IMAGE_FORMATS, IMAGE_FORMATS | {'PDF'}, convert_image_pillow,
+     ['progress', 'options', 'animated']),
+    ('audio', AUDIO_FORMATS, AUDIO_FORMATS, convert_audio_ffmpeg,
+     ['progress', 'options']),
+    ('video', VIDEO_FORMATS, VIDEO_FORMATS | {'GIF'}, convert_video_ffmpeg,
+     ['progress', 'options', 'stream_copy']),
+    ('video_to_audio', VIDEO_FORMATS, AUDIO_FORMATS, extract_audio_ffmpeg,
+     ['progress', 'options', 'stream_copy']),
+    ('document', DOC_INPUT_FORMATS, DOC_OUTPUT_FORMATS, convert_document_pypandoc,
+     ['progress']),
+    ('table', TABLE_INPUT_FORMATS, TABLE_OUTPUT_FORMATS, convert_table_pandas,
+     ['progress', 'streaming']),
+    ('doc_to_image', RASTER_DOC_FORMATS, IMAGE_FORMATS - {'ICO'}, convert_doc_to_image,
+     ['progress', 'options', 'multipage']),
+    ('office', PRESENTATION_FORMATS, {'PDF', 'PPTX'}, convert_office_libreoffice,
+     ['progress']),
+    ('office', {'DOC'}, {'PDF', 'DOCX'}, convert_office_libreoffice,
+     ['progress']),
+    ('archive', ARCHIVE_INPUT_FORMATS, ARCHIVE_OUTPUT_FORMATS, convert_archive,
+     ['progress', 'options', 'streaming']),
+]
+
+
+def build_registry(families):
+    # (вход, выход) → ConverterEntry; первый подходящий конвертер побеждает
+    registry = {}
+    for conv_type, inputs, outputs, func, capabilities in families:
+        entry = ConverterEntry(conv_type, func, capabilities)
+        for input_format in inputs:
+            for output_format in outputs:
+                if input_format != output_format:
+                    registry.setdefault((input_format, output_format), entry)
+    return registry
+
+
+REGISTRY = build_registry(CONVERTER_FAMILIES)
+
+# Функции по типу конвертации
+TYPE_FUNCTIONS = {conv_type: func for conv_type, _, _, func, _ in CONVERTER_FAMILIES}
+
+
+def normalize_format(fmt):
+    return fmt.lstrip('.').upper()
+
+
+def format_of(path):
+    return normalize_format(Path(path).suffix)
+
+
+def find_converter(input_format, output_format):
+    return REGISTRY.get((normalize_format(input_format), normalize_format(output_format)))
+
+
+def get_converter_type(input_format, output_format):
+    entry = find_converter(input_format, output_format)
+    return entry.conv_type if entry else 'unknown'
+
+
+def select_conversion_function(conv_type):
+    # Выбирает функцию конвертации по типу
+    # Все функции модульного уровня, поэтому их можно передавать в пул процессов
+    return TYPE_FUNCTIONS.get(conv_type)
+
+
+def get_conversion_function(input_path, output_path):
+    # Определяет функцию конвертации по расширениям входного и выходного файлов
+    entry = find_converter(format_of(input_path), format_of(output_path))
+    return entry.func if entry else None
+
+
+def build_matrix(registry=None):
+    # Матрица для GUI: входной формат → отсортированный список выходных.
+    # Строится из реестра, поэтому в ней нет пар без конвертера
+    matrix = {}
+    for input_format, output_format in (registry or REGISTRY):
+        matrix.setdefault(input_format, []).append(output_format)
+    return {input_format: sorted(outputs) for input_format, outputs in sorted(matrix.items())}
+
+
+MATRIX = build_matrix()
+
+
+def get_output_formats(input_format):
+    return list(MATRIX.get(normalize_format(input_format), []))
@@ -0,0 +1,416 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import ffmpeg_tools
+from cancel import atomic_output
+from metrics import ConversionMetrics, record_result
+from options import ffmpeg_audio_args, ffmpeg_video_args
+from progress import ProgressReporter
+from registry import find_converter, format_of
+
+
+# ==================== ПЛАНИРОВЩИК ВНЕШНИХ ПРОЦЕССОВ ====================
+# ffmpeg, pandoc и pdftoppm запускаются напрямую из одного цикла asyncio — ни один поток
+# не простаивает в ожидании подпроцесса. У каждого инструмента свой лимит одновременных
+# процессов, общий лимит — число ядер. Конвертации, которым нужен Python (таблицы,
+# изображения, офис), идут в пул процессов под тем же учетом, как инструмент 'python'
+
+# Доля ядер, которую может занять один инструмент
+TOOL_SHARES = {'ffmpeg': 0.5, 'pandoc': 0.5, 'pdftoppm': 0.5, 'python': 0.5}
+# Сколько последних байт stderr хранить для диагностики
+STDERR_TAIL = 16 * 1024
+# Как часто проверять отмену, пока процесс работает
+POLL_INTERVAL = 0.2
+# Заданий в работе на один слот процесса: остальные ждут, не занимая память
+PENDING_PER_SLOT = 2
+
+# Форматы, которые pdftoppm пишет сам, и расширение, которое он добавляет
+PDFTOPPM_FORMATS = {'png': ('-png', '.png'), 'jpg': ('-jpeg', '.jpg'), 'jpeg': ('-jpeg', '.jpg'),
+                    'tiff': ('-tiff', '.tif'), 'tif': ('-tiff', '.tif')}
+
+
+def default_limits(cpu_count=None):
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return {tool: max(1, int(cpu_count * share)) for tool, share in TOOL_SHARES.items()}
+
+
+def parse_limits(values):
+    # ['ffmpeg=4', 'pandoc=2'] → {'ffmpeg': 4, 'pandoc': 2}
+    limits = {}
+    for value in values or []:
+        tool, _, count = value.partition('=')
+        if not count.isdigit() or int(count) < 1:
+            raise ValueError(f"Неверный лимит: {value}, ожидается ИНСТРУМЕНТ=N")
+        limits[tool] = int(count)
+    return limits
+
+
+class ToolScheduler:
+    def __init__(self, limits=None, max_processes=None):
+        self.cpu_count = os.cpu_count() or 1
+        self.limits = default_limits(self.cpu_count)
+        self.limits.update(limits or {})
+        self.max_processes = max_processes or self.cpu_count
+        self._semaphores = {}
+        self._global = None
+        self.running = Counter()
+        self.peak = Counter()
+        self.completed = Counter()
+        self.failed = Counter()
+        self.busy = Counter()  # суммарное время процессов инструмента, с
+        self.started = time.perf_counter()
+        self.start_times = os.times()
+
+    def threads_for(self, tool):
+        # Потоки одного процесса: ядра делятся между одновременно работающими процессами инструмента
+        return max(1, self.cpu_count // min(self.limits.get(tool, 1), self.max_processes))
+
+    @asynccontextmanager
+    async def slot(self, tool):
+        # Слот инструмента и общий слот процесса; семафоры создаются внутри работающего цикла.
+        # Отдает словарь исхода: задание без исключения, но с ошибкой помечает outcome['failed']
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_processes)
+        if tool not in self._semaphores:
+            self._semaphores[tool] = asyncio.Semaphore(self.limits.get(tool, 1))
+
+        async with self._semaphores[tool], self._global:
+            self.running[tool] += 1
+            self.peak[tool] = max(self.peak[tool], self.running[tool])
+            start = time.perf_counter()
+            outcome = {'failed': False}
+            try:
+                yield outcome
+            except BaseException:
+                self.failed[tool] += 1
+                raise
+            else:
+                if outcome['failed']:
+                    self.failed[tool] += 1
+                else:
+                    self.completed[tool] += 1
+            finally:
+                self.running[tool] -= 1
+                self.busy[tool] += time.perf_counter() - start
+
+    async def run(self, tool, command, on_line=None, cancel_token=None, progress=None):
+        # Запускает процесс в слоте инструмента; stdout разбирается построчно через on_line,
+        # из stderr хранится хвост. При ошибке, отмене или исключении в on_line процесс убивается.
+        # В progress.stages попадают ожидание слота ('queue') и работа процесса (имя инструмента).
+        # Возвращает stderr
+        queued = time.perf_counter()
+        async with self.slot(tool):
+            started = time.perf_counter()
+            if progress is not None:
+                progress.add_stage('queue', started - queued)
+            try:
+                return await self.run_process(tool, command, on_line, cancel_token)
+            finally:
+                if progress is not None:
+                    progress.add_stage(tool, time.perf_counter() - started)
+
+    async def run_process(self, tool, command, on_line=None, cancel_token=None):
+        # Сам запуск, без слота — см. run
+        process = await asyncio.create_subprocess_exec(
+            *command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stderr = bytearray()
+
+        async def read_stdout():
+            async for line in process.stdout:
+                if on_line:
+                    on_line(line.decode(errors='replace'))
+
+        async def read_stderr():
+            while chunk := await process.stderr.read(65536):
+                stderr.extend(chunk)
+                del stderr[:-STDERR_TAIL]
+
+        readers = asyncio.gather(read_stdout(), read_stderr())
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(asyncio.shield(readers), POLL_INTERVAL)
+                    break
+                except asyncio.TimeoutError:
+                    if cancel_token is not None:
+                        cancel_token.check()
+            await process.wait()
+        except BaseException:
+            readers.cancel()
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            # Забираем исключение читателей, чтобы asyncio не ругался на потерянную ошибку
+            await asyncio.gather(readers, return_exceptions=True)
+            raise
+
+        text = stderr.decode(errors='replace').strip()
+        if process.returncode != 0:
+            raise RuntimeError(f"{tool} завершился с ошибкой (код {process.returncode}):\n{text}")
+        return text
+
+    async def run_python(self, executor, func, *args):
+        # func — как batch.convert_file: ошибку возвращает словарем со статусом, а не исключением
+        async with self.slot('python') as outcome:
+            result = await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+            if isinstance(result, dict) and result.get('status', 'ok') != 'ok':
+                outcome['failed'] = True
+            return result
+
+    def stats(self):
+        # Сводка: загрузка CPU за время работы (вместе с дочерними процессами) и счетчики по инструментам
+        elapsed = time.perf_counter() - self.started
+        now = os.times()
+        cpu_seconds = sum(getattr(now, field) - getattr(self.start_times, field)
+                          for field in ('user', 'system', 'children_user', 'children_system'))
+        tools = {}
+        for tool in sorted(set(self.limits) | set(self.completed) | set(self.failed)):
+            tools[tool] = {
+                'limit': self.limits.get(tool, 1),
+                'running': self.running[tool],
+                'peak': self.peak[tool],
+                'completed': self.completed[tool],
+                'failed': self.failed[tool],
+                'busy_seconds': self.busy[tool],
+            }
+        return {
+            'elapsed': elapsed,
+            'cpu_count': self.cpu_count,
+            'max_processes': self.max_processes,
+            'cpu_seconds': cpu_seconds,
+            'cpu_utilization': cpu_seconds / (elapsed * self.cpu_count) if elapsed > 0 else 0.0,
+            'tools': tools,
+        }
+
+
+# ==================== КОМАНДЫ ИНСТРУМЕНТОВ ====================
+
+class ToolJob:
+    # build(output_path) → (команда, путь, куда инструмент запишет результат).
+    # converter — функция реестра, которую заменяет внешний процесс: по ней ключ кэша
+    # совпадает с ключом cached_convert для той же конвертации
+    def __init__(self, tool, build, converter, duration=0.0, method=None):
+        self.tool = tool
+        self.build = build
+        self.converter = converter
+        self.duration = duration
+        self.method = method or tool
+
+
+async def plan_tool_job(input_path, output_path, options, threads):
+    # Как выполнить конвертацию одним внешним процессом, или None, если нужен Python
+    entry = find_converter(format_of(input_path), format_of(output_path))
+    if entry is None:
+        return None
+    options = dict(options or {})
+    options.setdefault('threads', threads)
+    output_ext = format_of(output_path).lower()
+    loop = asyncio.get_running_loop()
+
+    if entry.conv_type in ('audio', 'video', 'video_to_audio'):
+        if not ffmpeg_tools.find_ffmpeg() or options.get('max_size') or output_ext == 'gif':
+            return None
+        info = await loop.run_in_executor(None, ffmpeg_tools.probe, input_path)
+        kinds = ('video', 'audio') if entry.conv_type == 'video' else ('audio',)
+        allow_copy = entry.conv_type != 'audio' and options.get('copy', True)
+        if allow_copy and ffmpeg_tools.can_stream_copy(info['streams'], output_ext, kinds):
+            audio_only = entry.conv_type == 'video_to_audio'
+            return ToolJob('ffmpeg', lambda path: (
+                ffmpeg_tools.ffmpeg_command(ffmpeg_tools.remux_args(input_path, path, audio_only)), path),
+                entry.func, info['duration'], 'copy')
+        codec_args = ffmpeg_video_args(output_ext, options) if entry.conv_type == 'video' \
+            else ffmpeg_audio_args(output_ext, options)
+        return ToolJob('ffmpeg', lambda path: (
+            ffmpeg_tools.ffmpeg_command(['-i', input_path] + codec_args + [path]), path),
+            entry.func, info['duration'], 'transcode')
+
+    if entry.conv_type == 'document':
+        try:
+            from converters import pandoc_command
+            pandoc_command(input_path, output_path)
+        except (ImportError, OSError):
+            return None
+        return ToolJob('pandoc', lambda path: (pandoc_command(input_path, path), path), entry.func)
+
+    if entry.conv_type == 'doc_to_image' and format_of(input_path) == 'PDF':
+        # Одна страница — одним вызовом pdftoppm; диапазоны и прочие форматы — через pdf2image
+        pdftoppm = shutil.which('pdftoppm')
+        pages = str(options.get('pages') or '1')
+        if not pdftoppm or output_ext not in PDFTOPPM_FORMATS or not pages.isdigit() and pages != 'first':
+            return None
+        from converters import PDF_DEFAULT_DPI
+        page = '1' if pages == 'first' else pages
+        flag, suffix = PDFTOPPM_FORMATS[output_ext]
+        dpi = str(options.get('dpi') or PDF_DEFAULT_DPI)
+
+        def build(path):
+            prefix = str(Path(path).with_suffix(''))
+            return [pdftoppm, '-r', dpi, '-f', page, '-l', page, '-singlefile', flag, input_path, prefix], \
+                prefix + suffix
+        return ToolJob('pdftoppm', build, entry.func)
+
+    return None
+
+
+# ==================== ПАКЕТНАЯ КОНВЕРТАЦИЯ ====================
+
+async def convert_scheduled(scheduler, executor, input_path, save_path, use_cache=True, cache_dir=None,
+                            options=None, on_progress=None, progress_queue=None, cancel_token=None):
+    # Одна конвертация: внешним процессом, если возможно, иначе batch.convert_file в пуле.
+    # Результат — словарь как у batch.convert_file
+    from batch import convert_file
+    from cache import ConversionCache, converter_name, get_default_cache
+
+    try:
+        job = await plan_tool_job(input_path, save_path, options, scheduler.threads_for('ffmpeg'))
+    except Exception:
+        # Не удалось разобрать файл (например, probe) — пусть разбирается общий путь
+        job = None
+    if job is None:
+        return await scheduler.run_python(executor, convert_file, input_path, save_path, use_cache, cache_dir,
+                                          progress_queue, options, None, cancel_token)
+
+    loop = asyncio.get_running_loop()
+    result = {
+        'input': input_path,
+        'output': save_path,
+        'status': 'ok',
+        'error': None,
+        'bytes_in': 0,
+        'bytes_out': 0,
+        'seconds': 0.0,
+        'cache': None,
+        'method': job.method,
+    }
+    start = time.perf_counter()
+    callback = (lambda info: on_progress(input_path, info)) if on_progress else None
+    reporter = ProgressReporter(callback=callback, min_interval=0.5, cancel_token=cancel_token)
+    # Процессорное время и cProfile здесь не замеряем: в одном цикле идут параллельные задания
+    # (общая загрузка CPU — в ToolScheduler.stats)
+    metrics = ConversionMetrics(input_path, save_path, reporter, measure_process=False)
+    try:
+        result['bytes_in'] = os.path.getsize(input_path)
+        with metrics:
+            cache = key = None
+            output_format = Path(save_path).suffix.lstrip('.')
+            if use_cache:
+                cache = ConversionCache(cache_dir) if cache_dir else get_default_cache()
+                # Хэш исходника считается в потоке, чтобы не останавливать цикл
+                with reporter.stage('hash'):
+                    key = await loop.run_in_executor(None, cache.make_key, input_path, output_format, options,
+                                                     converter_name(job.converter))
+                with reporter.stage('cache'):
+                    hit = await loop.run_in_executor(None, cache.get, key, output_format, save_path)
+                if hit:
+                    result['cache'] = 'hit'
+                    result['method'] = None
+            if result['cache'] != 'hit':
+                if job.duration:
+                    reporter.set_total(job.duration, 'seconds')
+
+                def on_line(line):
+                    seconds = ffmpeg_tools.parse_progress_line(line)
+                    if seconds is not None:
+                        reporter.update(seconds)
+
+                with atomic_output(save_path) as temp_path:
+                    command, produced = job.build(temp_path)
+                    await scheduler.run(job.tool, command, on_line if job.tool == 'ffmpeg' else None,
+                                        cancel_token, reporter)
+                    if produced != temp_path:
+                        os.replace(produced, temp_path)
+                reporter.finish()
+                if cache:
+                    result['cache'] = 'miss'
+                    with reporter.stage('cache'):
+                        await loop.run_in_executor(None, cache.put, key, output_format, save_path)
+        result['bytes_out'] = os.path.getsize(save_path)
+    except Exception as e:
+        from cancel import ConversionCancelled
+        result['status'] = 'cancelled' if isinstance(e, ConversionCancelled) else 'error'
+        result['error'] = str(e)
+    if metrics.started:
+        result['metrics'] = metrics.to_dict(method=result['method'], cache=result['cache'])
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+async def run_scheduled(inputs, output_format, output_dir=None, limits=None, on_result=None,
+                        use_cache=True, cache_dir=None, on_progress=None, options=None, cancel_token=None):
+    from batch import build_output_paths, drain_progress, summarize
+
+    output_paths = build_output_paths(inputs, output_format, output_dir)
+    for save_path in output_paths.values():
+        os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+    scheduler = ToolScheduler(limits)
+    start = time.perf_counter()
+    results = []
+
+    manager = None
+    progress_queue = None
+    if on_progress:
+        import multiprocessing
+        import threading
+        manager = multiprocessing.Manager()
+        progress_queue = manager.Queue()
+        listener = threading.Thread(target=drain_progress, args=(progress_queue, on_progress), daemon=True)
+        listener.start()
+
+    # Ограничение заданий в работе: очередь входов не превращается в тысячи задач сразу
+    pending = asyncio.Semaphore(scheduler.max_processes * PENDING_PER_SLOT)
+
+    async def process(path):
+        try:
+            result = await convert_scheduled(
+                scheduler, executor, path, output_paths[path], use_cache,
+                cache_dir, options, on_progress, progress_queue, cancel_token)
+        finally:
+            pending.release()
+        record_result(result)
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    executor = ProcessPoolExecutor(max_workers=scheduler.limits['python'])
+    try:
+        tasks = []
+        for path in inputs:
+            await pending.acquire()
+            tasks.append(asyncio.create_task(process(path)))
+        await asyncio.gather(*tasks)
+    finally:
+        executor.shutdown(cancel_futures=True)
+        if manager:
+            progress_queue.put(None)
+            listener.join()
+            manager.shutdown()
+
+    summary = summarize(results, time.perf_counter() - start)
+    summary['scheduler'] = scheduler.stats()
+    return summary
+
+
+def run_scheduled_batch(inputs, output_format, output_dir=None, limits=None, on_result=None,
+                        use_cache=True, cache_dir=None, on_progress=None, options=None, cancel_token=None):
+    # Аналог batch.run_batch на планировщике; в сводке дополнительно 'scheduler' — см. ToolScheduler.stats.
+    # cancel_token уходит и в воркеры пула, поэтому, как у run_batch, он должен быть межпроцессным
+    return asyncio.run(run_scheduled(inputs, output_format, output_dir, limits, on_result, use_cache,
+                                     cache_dir, on_progress, options, cancel_token))
+
+
+def print_scheduler_stats(stats):
+    print(f"Загрузка CPU: {stats['cpu_utilization']:.0%} "
+          f"({stats['cpu_seconds']:.1f} с процессорного времени на {stats['cpu_count']} ядрах)")
+    for tool, tool_stats in stats['tools'].items():
+        if not tool_stats['completed'] and not tool_stats['failed']:
+            continue
+        print(f"  {tool}: готово {tool_stats['completed']}, ошибок {tool_stats['failed']}, "
+              f"одновременно до {tool_stats['peak']} из {tool_stats['limit']}, "
+              f"в работе {tool_stats['busy_seconds']:.1f} с")
@@ -0,0 +1,583 @@
+import argparse
+import json
+import os
+import re
+import select
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from batch import build_output_path, convert_file, print_result, summarize
+from cache import file_hash
+from metrics import add_metrics_arguments, apply_metrics_arguments, record_result, write_prometheus
+from options import add_option_arguments, options_from_args
+from planner import resolve_conversion_function
+
+
+# ==================== ИНКРЕМЕНТАЛЬНАЯ СИНХРОНИЗАЦИЯ ПАПОК ====================
+# Дерево исходников зеркалируется в папку результатов в целевом формате.
+# Манифест помнит для каждого исходника размер, mtime, хэш содержимого, формат, опции
+# и пути результатов, поэтому повторный запуск конвертирует только новые и измененные файлы
+# и удаляет результаты исчезнувших исходников. Каждый готовый файл сразу дописывается
+# в журнал, а результаты пишутся атомарно — после сбоя запуск продолжается с того же места
+
+MANIFEST_NAME = '.konvertor-sync.json'
+JOURNAL_NAME = '.konvertor-sync.journal'
+LOCK_NAME = '.konvertor-sync.lock'
+MANIFEST_VERSION = 1
+
+# Режим наблюдения: синхронизация после паузы в событиях, но не реже чем раз в WATCH_MAX_DELAY
+WATCH_DEBOUNCE = 1.0
+WATCH_MAX_DELAY = 10.0
+# Без inotify (не Linux) дерево пересматривается целиком с этим интервалом
+POLL_INTERVAL = 5.0
+
+# Временные файлы atomic_output (cancel.py), оставшиеся после аварийного завершения
+PARTIAL_PATTERN = re.compile(r'^\..+\.[0-9a-f]{8}\.part')
+# Многостраничный результат: report_1.png, report_2.png
+PAGE_PATTERN = r'_\d+'
+
+
+class SyncManifest:
+    # Манифест синхронизации: {относительный путь исходника: запись}.
+    # Изменения дописываются в журнал построчно, save() сворачивает журнал в манифест
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.journal_path = os.path.join(output_dir, JOURNAL_NAME)
+        self.entries = {}
+        self.journal = None
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.entries = data['entries']
+        if not os.path.exists(self.journal_path):
+            return
+        # Журнал после сбоя: применяем записи по порядку, недописанную последнюю строку пропускаем
+        with open(self.journal_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record['entry'] is None:
+                    self.entries.pop(record['path'], None)
+                else:
+                    self.entries[record['path']] = record['entry']
+
+    def get(self, rel_path):
+        return self.entries.get(rel_path)
+
+    def update(self, rel_path, entry):
+        self.entries[rel_path] = entry
+        self.append(rel_path, entry)
+
+    def remove(self, rel_path):
+        self.entries.pop(rel_path, None)
+        self.append(rel_path, None)
+
+    def append(self, rel_path, entry):
+        if self.journal is None:
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        self.journal.write(json.dumps({'path': rel_path, 'entry': entry}, ensure_ascii=False) + '\n')
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def save(self):
+        # Манифест пишется через временный файл, журнал удаляется только после замены
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+
+def sync_file(input_path, save_path, previous_hash=None, use_cache=True, cache_dir=None, options=None):
+    # Воркер: хэш исходника и конвертация, если содержимое действительно изменилось.
+    # Файл, у которого поменялся только mtime, возвращается со статусом 'unchanged'
+    digest = file_hash(input_path)
+    if digest == previous_hash and os.path.exists(save_path):
+        return {'input': input_path, 'output': save_path, 'status': 'unchanged', 'hash': digest}
+    # Хэш уже посчитан — кэш конвертаций не читает файл второй раз
+    result = convert_file(input_path, save_path, use_cache, cache_dir, options=options, source_hash=digest)
+    result['hash'] = digest
+    return result
+
+
+def produced_outputs(save_path):
+    # Результат конвертации: один файл или страницы с номерами (см. atomic_output)
+    if os.path.exists(save_path):
+        return [save_path]
+    path = Path(save_path)
+    if not path.parent.is_dir():
+        return []
+    pattern = re.compile(re.escape(path.stem) + PAGE_PATTERN + re.escape(path.suffix) + '$')
+    return sorted(str(path.parent / name) for name in os.listdir(path.parent) if pattern.match(name))
+
+
+class DirectorySync:
+    # Синхронизация папки source_dir в output_dir в формате output_format.
+    # Используется как контекстный менеджер: блокировка папки результатов, пул процессов
+    # и сохранение манифеста при выходе
+    def __init__(self, source_dir, output_dir, output_format, options=None, workers=None,
+                 use_cache=True, cache_dir=None, on_result=None):
+        self.source_dir = os.path.abspath(source_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.output_format = output_format.lower()
+        # Опции сравниваются с записью манифеста, поэтому храним их в виде после JSON
+        self.options = json.loads(json.dumps(options or {}, sort_keys=True, default=str))
+        self.workers = workers or os.cpu_count() or 1
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.on_result = on_result
+        self.manifest = None
+        self.executor = None
+        self._lock_file = None
+
+    def __enter__(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.lock()
+        self.manifest = SyncManifest(self.output_dir)
+        self.remove_partial_files()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.manifest.save()
+        self.unlock()
+
+    def lock(self):
+        # Второй запуск по той же папке результатов испортил бы манифест.
+        # flock снимается сам при падении процесса; на Windows блокировки нет
+        try:
+            import fcntl
+        except ImportError:
+            return
+        self._lock_file = open(os.path.join(self.output_dir, LOCK_NAME), 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            raise RuntimeError(f"Синхронизация в {self.output_dir} уже выполняется")
+
+    def unlock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def remove_partial_files(self):
+        # После kill -9 недописанные временные файлы остаются рядом с результатами
+        for root, _, names in os.walk(self.output_dir):
+            for name in names:
+                if PARTIAL_PATTERN.match(name):
+                    os.remove(os.path.join(root, name))
+
+    # ---------- обход дерева ----------
+
+    def is_excluded(self, path):
+        # Папка результатов внутри исходной не обходится
+        return path == self.output_dir or path.startswith(self.output_dir + os.sep)
+
+    def walk(self, directory):
+        for root, dirnames, names in os.walk(directory):
+            dirnames[:] = sorted(name for name in dirnames
+                                 if not name.startswith('.') and not self.is_excluded(os.path.join(root, name)))
+            for name in sorted(names):
+                if not name.startswith('.'):
+                    yield os.path.join(root, name)
+
+    def relative(self, path):
+        return Path(os.path.relpath(path, self.source_dir)).as_posix()
+
+    def output_path(self, rel_path, claimed):
+        # Зеркальный путь в папке результатов, имена — как у batch.build_output_paths:
+        # a.png и a.jpg в одной папке различаются исходным расширением (a.pdf и a_jpg.pdf),
+        # а если совпало и оно (a.JPG) — номером: a_jpg-2.pdf. Номер через дефис,
+        # чтобы имя не выглядело страницей многостраничного результата (PAGE_PATTERN)
+        directory = os.path.normpath(os.path.join(self.output_dir, Path(rel_path).parent))
+        save_path = build_output_path(rel_path, self.output_format, directory)
+        if save_path in claimed:
+            save_path = build_output_path(rel_path, self.output_format, directory, with_extension=True)
+        counter = 2
+        while save_path in claimed:
+            save_path = build_output_path(rel_path, self.output_format, directory, with_extension=True,
+                                          counter=counter)
+            counter += 1
+        return save_path
+
+    def scan(self, paths=None):
+        # Возвращает (задания, удаленные исходники). paths — измененные файлы и папки
+        # из режима наблюдения; без них обходится все дерево
+        if paths is None:
+            candidates = list(self.walk(self.source_dir))
+            scope = None
+        else:
+            candidates = []
+            scope = set()
+            for path in sorted(set(paths)):
+                path = os.path.abspath(path)
+                if self.is_excluded(path) or os.path.basename(path).startswith('.'):
+                    continue
+                scope.add(self.relative(path))
+                if os.path.isdir(path):
+                    candidates.extend(self.walk(path))
+                elif os.path.isfile(path):
+                    candidates.append(path)
+            # Файл новой папки приходит и событием, и обходом самой папки
+            candidates = sorted(set(candidates))
+
+        seen = set()
+        jobs = []
+        # Имена результатов заняты исходниками из манифеста, кроме уже удаленных
+        claimed = {os.path.join(self.output_dir, entry['output'])
+                   for rel_path, entry in self.manifest.entries.items()
+                   if os.path.isfile(os.path.join(self.source_dir, rel_path))}
+        for path in candidates:
+            rel_path = self.relative(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = self.manifest.get(rel_path)
+            if entry is not None:
+                seen.add(rel_path)
+                save_path = os.path.join(self.output_dir, entry['output'])
+            else:
+                save_path = self.output_path(rel_path, claimed)
+            if resolve_conversion_function(path, save_path) is None:
+                continue
+            seen.add(rel_path)
+            if entry is not None and not self.needs_update(entry, stat, save_path):
+                continue
+            claimed.add(save_path)
+            jobs.append({'path': path, 'rel_path': rel_path, 'save_path': save_path,
+                         'stat': stat, 'entry': entry})
+
+        # Исходник исчез (или больше не конвертируется в этот формат) — его результаты лишние
+        removed = [rel_path for rel_path in self.manifest.entries
+                   if rel_path not in seen and (scope is None or any(
+                       rel_path == item or rel_path.startswith(item + '/') for item in scope))]
+        return jobs, removed
+
+    def needs_update(self, entry, stat, save_path):
+        if entry['format'] != self.output_format or entry['options'] != self.options:
+            return True
+        if not all(os.path.exists(os.path.join(self.output_dir, output)) for output in entry['outputs']):
+            return True
+        # Размер и mtime совпали — файл не трогали, хэш не считаем
+        return entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns
+
+    # ---------- синхронизация ----------
+
+    def sync(self, paths=None):
+        # Один проход синхронизации. Возвращает сводку как run_batch
+        # плюс число неизменившихся и удаленных исходников
+        start = time.perf_counter()
+        jobs, removed = self.scan(paths)
+        for rel_path in removed:
+            self.remove_outputs(rel_path)
+
+        results = []
+        unchanged = 0
+        if jobs:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            futures = {}
+            for job in jobs:
+                entry = job['entry']
+                # Хэш прошлой версии полезен, только если формат и опции те же
+                previous_hash = None
+                if entry is not None and entry['format'] == self.output_format and entry['options'] == self.options:
+                    previous_hash = entry['hash']
+                os.makedirs(os.path.dirname(job['save_path']), exist_ok=True)
+                future = self.executor.submit(sync_file, job['path'], job['save_path'], previous_hash,
+                                              self.use_cache, self.cache_dir, self.options)
+                futures[future] = job
+            for future in as_completed(futures):
+                job = futures[future]
+                result = future.result()
+                if result['status'] == 'unchanged':
+                    # Изменился только mtime: обновляем stat в манифесте, не конвертируя
+                    unchanged += 1
+                    self.commit(job, result)
+                    continue
+                record_result(result)
+                results.append(result)
+                # При ошибке запись манифеста не меняется: следующий проход попробует снова
+                if result['status'] == 'ok':
+                    self.commit(job, result)
+                if self.on_result:
+                    self.on_result(result)
+
+        summary = summarize(results, time.perf_counter() - start)
+        summary['unchanged'] = unchanged
+        summary['removed'] = len(removed)
+        return summary
+
+    def commit(self, job, result):
+        # Готовый файл сразу попадает в журнал манифеста
+        stat = job['stat']
+        outputs = [os.path.relpath(path, self.output_dir) for path in produced_outputs(job['save_path'])]
+        old_entry = job['entry']
+        if old_entry is not None:
+            # Страниц стало меньше — лишние результаты прошлой версии удаляем
+            for output in set(old_entry['outputs']) - set(outputs):
+                self.delete_output(output)
+        self.manifest.update(job['rel_path'], {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': result['hash'],
+            'format': self.output_format,
+            'options': self.options,
+            'output': os.path.relpath(job['save_path'], self.output_dir),
+            'outputs': outputs,
+            'converted': time.time(),
+        })
+
+    def remove_outputs(self, rel_path):
+        entry = self.manifest.get(rel_path)
+        for output in entry['outputs']:
+            self.delete_output(output)
+        self.manifest.remove(rel_path)
+        if self.on_result:
+            self.on_result({'input': os.path.join(self.source_dir, rel_path), 'status': 'removed',
+                            'outputs': entry['outputs']})
+
+    def delete_output(self, output):
+        path = os.path.join(self.output_dir, output)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        # Пустые папки, оставшиеся от удаленного поддерева, тоже убираем
+        directory = os.path.dirname(path)
+        while directory != self.output_dir and directory.startswith(self.output_dir):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+    # ---------- наблюдение ----------
+
+    def watch(self, debounce=WATCH_DEBOUNCE, interval=POLL_INTERVAL, on_summary=None, stop_event=None):
+        # Первый проход догоняет все, что изменилось без нас (в том числе после сбоя),
+        # дальше конвертируются только файлы из событий inotify
+        summary = self.sync()
+        if on_summary:
+            on_summary(summary)
+        watcher = create_watcher(self.source_dir, self.is_excluded, interval)
+        pending = set()
+        first_event = None
+        try:
+            while stop_event is None or not stop_event.is_set():
+                paths = watcher.read(debounce)
+                if paths:
+                    pending.update(paths)
+                    first_event = first_event or time.monotonic()
+                    if time.monotonic() - first_event < WATCH_MAX_DELAY:
+                        continue
+                if not pending:
+                    continue
+                changed, pending, first_event = pending, set(), None
+                summary = self.sync(None if self.source_dir in changed else changed)
+                if on_summary and (summary['total'] or summary['removed']):
+                    on_summary(summary)
+        finally:
+            watcher.close()
+
+
+# ==================== INOTIFY ====================
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+# Файл считается готовым по IN_CLOSE_WRITE/IN_MOVED_TO: событие создания для файлов
+# приходит до записи содержимого и используется только для новых папок
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    # Наблюдение за деревом через inotify (Linux) по ctypes, без сторонних зависимостей.
+    # read() возвращает измененные пути; корень в ответе означает «пересмотреть все»
+    def __init__(self, root, is_excluded=None):
+        import ctypes
+        import ctypes.util
+
+        self.root = root
+        self.is_excluded = is_excluded or (lambda path: False)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.watches = {}
+        self.add_tree(root)
+
+    def add_tree(self, directory):
+        for root, dirnames, _ in os.walk(directory):
+            dirnames[:] = [name for name in dirnames
+                           if not name.startswith('.') and not self.is_excluded(os.path.join(root, name))]
+            self.add_watch(root)
+
+    def add_watch(self, directory):
+        import ctypes
+
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == 2:  # ENOENT: папку уже удалили
+                return
+            raise OSError(error, f"inotify_add_watch {directory}")
+        self.watches[wd] = directory
+
+    def read(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Очередь событий переполнилась — часть изменений потеряна
+                paths.append(self.root)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if self.is_excluded(path):
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # Новая папка: файлы могли появиться в ней раньше, чем мы подписались
+                self.add_tree(path)
+            elif mask & IN_CREATE:
+                continue
+            paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    # Замена inotify на других системах: периодический полный проход (он только сверяет stat)
+    def __init__(self, root, interval=POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+
+    def read(self, timeout):
+        time.sleep(self.interval)
+        return [self.root]
+
+    def close(self):
+        pass
+
+
+def create_watcher(root, is_excluded=None, interval=POLL_INTERVAL):
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root, is_excluded)
+        except OSError as e:
+            print(f"inotify недоступен ({e}), папка будет пересматриваться каждые {interval} с")
+    return PollingWatcher(root, interval)
+
+
+# ==================== CLI ====================
+
+def print_sync_result(result):
+    if result['status'] == 'removed':
+        print(f"[УДАЛЕН] {os.path.basename(result['input'])}: {', '.join(result['outputs'])}")
+    else:
+        print_result(result)
+
+
+def print_summary(summary):
+    print(f"Сконвертировано: {summary['ok']}, ошибок: {summary['failed']}, "
+          f"без изменений: {summary['unchanged']}, удалено: {summary['removed']}, "
+          f"время: {summary['elapsed']:.2f} с")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Инкрементальная синхронизация папки: "
+                                                 "конвертируются только новые и измененные файлы")
+    parser.add_argument('source', help="Папка с исходниками")
+    parser.add_argument('-t', '--to', required=True, help="Целевой формат, например PNG")
+    parser.add_argument('-o', '--output-dir', required=True, help="Папка для результатов и манифеста")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="Количество процессов (по умолчанию — число ядер)")
+    parser.add_argument('-w', '--watch', action='store_true',
+                        help="После синхронизации следить за папкой и конвертировать новые файлы")
+    parser.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE,
+                        help="Пауза в событиях перед синхронизацией в режиме наблюдения, с")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL,
+                        help="Интервал пересмотра папки, если inotify недоступен, с")
+    parser.add_argument('--no-cache', action='store_true', help="Не использовать кэш конвертаций")
+    parser.add_argument('--cache-dir', help="Папка кэша конвертаций")
+    parser.add_argument('--metrics-file', metavar='ФАЙЛ',
+                        help="Записывать метрики в текстовом формате Prometheus после каждого прохода")
+    add_metrics_arguments(parser)
+    add_option_arguments(parser)
+    args = parser.parse_args(argv)
+    options = options_from_args(args)
+    apply_metrics_arguments(args)
+
+    if not os.path.isdir(args.source):
+        print(f"Папка не найдена: {args.source}")
+        return 1
+
+    def on_summary(summary):
+        print_summary(summary)
+        if args.metrics_file:
+            write_prometheus(args.metrics_file)
+
+    try:
+        with DirectorySync(args.source, args.output_dir, args.to, options, args.workers,
+                           use_cache=not args.no_cache, cache_dir=args.cache_dir,
+                           on_result=print_sync_result) as directory_sync:
+            if args.watch:
+                directory_sync.watch(args.debounce, args.interval, on_summary=on_summary)
+                return 0
+            summary = directory_sync.sync()
+    except RuntimeError as e:
+        print(e)
+        return 1
+    except KeyboardInterrupt:
+        # Готовые файлы уже в манифесте, недописанные удалены — следующий запуск продолжит
+        print("\nПрервано")
+        return 130
+    on_summary(summary)
+    return 0 if summary['failed'] == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
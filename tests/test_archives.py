@@ -0,0 +1,35 @@
+import os
+import sys
+import zipfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import archives
+
+
+# Данных больше нескольких блоков сжатия: ParallelCompressor пишет поток из нескольких частей
+MEMBERS = {
+    'data/random.bin': os.urandom(3 * archives.COMPRESSION_BLOCK_SIZES['xz'] + 12345),
+    'data/text.txt': b'konvertor\n' * 200_000,
+    'empty.txt': b'',
+}
+
+
+@pytest.mark.parametrize('extension', ['tar', 'tar.gz', 'tar.bz2', 'tar.xz'])
+def test_parallel_tar_round_trip(tmp_path, extension):
+    source = tmp_path / 'source.zip'
+    with zipfile.ZipFile(source, 'w') as archive:
+        for name, data in MEMBERS.items():
+            archive.writestr(name, data)
+
+    packed = tmp_path / f'packed.{extension}'
+    archives.repack_archive(str(source), str(packed), threads=4)
+    unpacked = tmp_path / 'unpacked.zip'
+    assert archives.repack_archive(str(packed), str(unpacked)) == len(MEMBERS)
+
+    with zipfile.ZipFile(unpacked) as archive:
+        assert {name: archive.read(name) for name in archive.namelist()} == MEMBERS